@@ -0,0 +1,49 @@
+"""Benchmark parallel policy builds in a thread pool
+
+Builds the default policy for several architecture sets serially and with
+a PolicyBuilder. libseccomp runs without the GIL, so builds overlap.
+
+    python benchmarks/bench_build.py [--builds N] [--workers N]
+"""
+
+import argparse
+import time
+
+from seccomppolicy._compiled import PolicyBuilder, build
+from seccomppolicy._constants import ScmpArch
+from seccomppolicy._containerpolicy import flatten
+from seccomppolicy._defaultpolicy import DEFAULT_ACTION, SYSCALLS
+
+ARCHES = [
+    (),
+    (ScmpArch.SCMP_ARCH_X86,),
+    (ScmpArch.SCMP_ARCH_X86, ScmpArch.SCMP_ARCH_X32),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--builds", type=int, default=24)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    policy = flatten(DEFAULT_ACTION, SYSCALLS)
+    jobs = [ARCHES[i % len(ARCHES)] for i in range(args.builds)]
+
+    start = time.perf_counter()
+    serial = [build(policy, arches) for arches in jobs]
+    serial_time = time.perf_counter() - start
+
+    with PolicyBuilder(args.workers) as builder:
+        start = time.perf_counter()
+        futures = [builder.submit(policy, arches) for arches in jobs]
+        parallel = [future.result() for future in futures]
+        parallel_time = time.perf_counter() - start
+
+    assert parallel == serial
+    print("serial:   {:8.1f} ms".format(serial_time * 1000))
+    print("parallel: {:8.1f} ms".format(parallel_time * 1000))
+
+
+if __name__ == "__main__":
+    main()
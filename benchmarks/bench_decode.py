@@ -0,0 +1,109 @@
+"""Benchmark seccomp.json decoding
+
+Compares the generic parser (json.load + translate_scmp + validating
+ScmpArg) with the fast path decoder on large generated profiles.
+
+    python benchmarks/bench_decode.py [--rulesets N] [--repeat N]
+"""
+
+import argparse
+import json
+import random
+import timeit
+
+from seccomppolicy._constants import ARCHES_MAP, Capabilities, ScmpArch, ScmpCmp
+from seccomppolicy._containerpolicy import _parse, loads
+
+NAMES = [
+    "read",
+    "write",
+    "openat",
+    "close",
+    "mmap",
+    "munmap",
+    "socket",
+    "clone",
+    "personality",
+    "ioctl",
+    "getpriority",
+    "setpriority",
+    "futex",
+    "epoll_wait",
+    "prctl",
+    "kill",
+]
+
+ACTIONS = ["SCMP_ACT_ALLOW", "SCMP_ACT_ERRNO", "SCMP_ACT_LOG", "SCMP_ACT_KILL"]
+
+
+def generate(rulesets, seed=0):
+    """Generate a profile with rulesets entries"""
+    rnd = random.Random(seed)
+    syscalls = []
+    for _ in range(rulesets):
+        syscall = {
+            "names": rnd.sample(NAMES, rnd.randint(1, 4)),
+            "action": rnd.choice(ACTIONS),
+            "comment": "",
+            "args": [
+                {
+                    "index": i,
+                    "value": rnd.getrandbits(32),
+                    "valueTwo": 0,
+                    "op": rnd.choice(list(ScmpCmp.__members__)),
+                }
+                for i in range(rnd.randint(0, 3))
+            ],
+        }
+        if rnd.random() < 0.3:
+            syscall["includes"] = {
+                "caps": [rnd.choice(list(Capabilities.__members__))],
+                "arches": [rnd.choice(list(ARCHES_MAP))],
+            }
+        if rnd.random() < 0.1:
+            syscall["excludes"] = {"minKernel": "4.8"}
+        syscalls.append(syscall)
+    return json.dumps(
+        {
+            "defaultAction": "SCMP_ACT_ERRNO",
+            "archMap": [
+                {
+                    "architecture": "SCMP_ARCH_X86_64",
+                    "subArchitectures": ["SCMP_ARCH_X86", "SCMP_ARCH_X32"],
+                }
+            ],
+            "syscalls": syscalls,
+        }
+    )
+
+
+def generic(text):
+    return _parse(json.loads(text))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rulesets", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print("{:>10} {:>12} {:>12} {:>8}".format("rulesets", "generic", "fast", "speedup"))
+    for rulesets in args.rulesets:
+        text = generate(rulesets)
+        results = []
+        for func in (generic, loads):
+            timer = timeit.Timer(lambda: func(text))
+            results.append(min(timer.repeat(args.repeat, 1)))
+        print(
+            "{:>10} {:>10.2f}ms {:>10.2f}ms {:>7.1f}x".format(
+                rulesets,
+                results[0] * 1000,
+                results[1] * 1000,
+                results[0] / results[1],
+            )
+        )
+    assert ScmpArch.SCMP_ARCH_X86_64 in loads(generate(1))["archmap"]
+
+
+if __name__ == "__main__":
+    main()
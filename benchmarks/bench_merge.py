@@ -0,0 +1,96 @@
+"""Benchmark stacked filters against a merged filter
+
+Loads a base profile plus application specific restrictions as separately
+stacked filters and as one merged filter, then measures the cost of a cheap
+syscall in a forked child.
+
+    python benchmarks/bench_merge.py [--calls N] [--repeat N]
+"""
+
+import argparse
+import os
+import struct
+import time
+
+from seccomppolicy._analysis import merge
+from seccomppolicy._constants import ScmpAction, ScmpCmp
+from seccomppolicy._containerpolicy import Policy, Rule, flatten
+from seccomppolicy._defaultpolicy import DEFAULT_ACTION, SYSCALLS
+from seccomppolicy._installer import FilterInstaller
+from seccomppolicy._libseccomp import ScmpArg
+
+APP = Policy(
+    ScmpAction.SCMP_ACT_ALLOW,
+    (
+        Rule(
+            ScmpAction.SCMP_ACT_EPERM, "socket", (ScmpArg(0, ScmpCmp.SCMP_CMP_NE, 1),)
+        ),
+        Rule(ScmpAction.SCMP_ACT_KILL_PROCESS, "ptrace", ()),
+        Rule(ScmpAction.SCMP_ACT_EPERM, "mount", ()),
+    ),
+)
+
+SANDBOX = Policy(
+    ScmpAction.SCMP_ACT_ALLOW,
+    (
+        Rule(ScmpAction.SCMP_ACT_EPERM, "setpriority", ()),
+        Rule(ScmpAction.SCMP_ACT_EPERM, "unshare", ()),
+    ),
+)
+
+
+def _measure(installers, calls):
+    """Nanoseconds per getppid() call in a child with installers loaded"""
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(rfd)
+            for installer in installers:
+                installer()
+            getppid = os.getppid
+            start = time.perf_counter()
+            for _ in range(calls):
+                getppid()
+            elapsed = time.perf_counter() - start
+            os.write(wfd, struct.pack("d", elapsed * 1e9 / calls))
+        finally:
+            os._exit(0)
+    os.close(wfd)
+    data = os.read(rfd, 8)
+    os.close(rfd)
+    os.waitpid(pid, 0)
+    return struct.unpack("d", data)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    policies = [flatten(DEFAULT_ACTION, SYSCALLS), APP, SANDBOX]
+    stacked = [FilterInstaller.from_policy(policy) for policy in policies]
+    merged = [FilterInstaller.from_policy(merge(*policies))]
+
+    results = {}
+    for label, installers in [("none", []), ("stacked", stacked), ("merged", merged)]:
+        results[label] = min(
+            _measure(installers, args.calls) for _ in range(args.repeat)
+        )
+        print(
+            "{:>8}: {:>3} filters, {:>4} instructions, {:7.1f} ns/syscall".format(
+                label,
+                len(installers),
+                sum(len(installer) for installer in installers),
+                results[label],
+            )
+        )
+    overhead = results["stacked"] - results["none"]
+    if overhead > 0:
+        saved = results["stacked"] - results["merged"]
+        print("merged filter saves {:.0%} of filter overhead".format(saved / overhead))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Report the effect of the peephole optimizer on the default policy
+
+Builds the default policy for the native architecture with and without
+the subArchitectures, with libseccomp and with the IncrementalCompiler,
+optimizes each program and prints instruction counts, the longest path
+and the mean number of instructions executed per native syscall before
+and after. Every optimized program is verified against its input.
+
+    python benchmarks/bench_peephole.py
+"""
+
+import sys
+import time
+
+from seccomppolicy._bpf import evaluate, seccomp_data
+from seccomppolicy._compiled import build
+from seccomppolicy._containerpolicy import flatten
+from seccomppolicy._defaultpolicy import DEFAULT_ACTION, SUB_ARCHITECTURES, SYSCALLS
+from seccomppolicy._incremental import IncrementalCompiler
+from seccomppolicy._peephole import optimize, stats, verify
+from seccomppolicy._seccomp import NATIVE_ARCH
+from seccomppolicy._syscalltable import get_table
+
+
+def _mean_path(bpf):
+    """Mean executed instructions over the native syscall numbers"""
+    numbers = sorted(set(get_table().numbers().values()))
+    total = 0
+    for nr in numbers:
+        trace = []
+        evaluate(bpf, seccomp_data(nr, NATIVE_ARCH), trace)
+        total += len(trace)
+    return total / len(numbers)
+
+
+def main():
+    policy = flatten(DEFAULT_ACTION, SYSCALLS)
+    failed = False
+    print(
+        "{:<28} {:^12} {:^14} {:^14} {:>9}".format(
+            "program", "instructions", "longest path", "mean path", "optimize"
+        )
+    )
+    for arches in ((), tuple(SUB_ARCHITECTURES.get(NATIVE_ARCH, ()))):
+        programs = [
+            ("libseccomp", build(policy, arches).bpf),
+            ("incremental", IncrementalCompiler().compile(policy, arches)),
+        ]
+        for name, bpf in programs:
+            start = time.perf_counter()
+            optimized = optimize(bpf, NATIVE_ARCH)
+            elapsed = time.perf_counter() - start
+            before = stats(bpf)
+            after = stats(optimized)
+            print(
+                "{:<28} {:>5} -> {:<4} {:>6} -> {:<5} {:>6.1f} -> {:<5.1f} "
+                "{:>6.1f} ms".format(
+                    "{} +{} arches".format(name, len(arches)),
+                    before.instructions,
+                    after.instructions,
+                    before.longest_path,
+                    after.longest_path,
+                    _mean_path(bpf),
+                    _mean_path(optimized),
+                    elapsed * 1000,
+                )
+            )
+            mismatches = verify(bpf, optimized, (NATIVE_ARCH,) + arches)
+            for mismatch in mismatches[:10]:
+                print("  MISMATCH {}".format(mismatch))
+            failed = failed or bool(mismatches)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
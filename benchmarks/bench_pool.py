@@ -0,0 +1,80 @@
+"""Benchmark SeccompPool variants against fresh filters
+
+Builds tenant variants of the default profile, each tenant denies one
+syscall on top of the base template. Variants are built once with a fresh
+Seccomp context each and once from a SeccompPool. The pool hands out a
+context that was built for an equal delta without adding any rules. It
+gives no speedup when there are more distinct tenants than pooled
+contexts, every variant is then built from scratch.
+
+    python benchmarks/bench_pool.py [--variants N] [--maxsize N] [--repeat N]
+"""
+
+import argparse
+import time
+
+from seccomppolicy._constants import ScmpAction
+from seccomppolicy._containerpolicy import Rule, flatten
+from seccomppolicy._defaultpolicy import DEFAULT_ACTION, SYSCALLS
+from seccomppolicy._pool import PreparedRules, SeccompPool
+from seccomppolicy._seccomp import Seccomp
+from seccomppolicy._syscalltable import get_table
+
+
+def _tenants(count):
+    """Delta rules of count distinct tenants, one denied syscall each"""
+    names = sorted(get_table().numbers())
+    return [
+        [Rule(ScmpAction.SCMP_ACT_EPERM, names[i % len(names)], ())]
+        for i in range(count)
+    ]
+
+
+def _best(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--variants", type=int, default=200)
+    parser.add_argument("--maxsize", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    policy = flatten(DEFAULT_ACTION, SYSCALLS)
+    base = PreparedRules.from_policy(policy)
+
+    def fresh(tenants):
+        for i in range(args.variants):
+            with Seccomp(policy.default_action) as sc:
+                base.apply(sc)
+                PreparedRules(tenants[i % len(tenants)]).apply(sc)
+                sc.export_bpf()
+
+    def pooled(tenants):
+        with SeccompPool(policy.default_action, base, args.maxsize) as pool:
+            for i in range(args.variants):
+                # a new delta object per request, reuse is keyed on content
+                with pool.variant(tenants[i % len(tenants)]) as sc:
+                    sc.export_bpf()
+
+    for count in (1, args.maxsize, args.maxsize + 2, args.variants):
+        tenants = _tenants(count)
+        print(
+            "{:>4} tenants: fresh {:7.1f} ms, pool {:7.1f} ms / {} variants".format(
+                count,
+                _best(lambda: fresh(tenants), args.repeat),
+                _best(lambda: pooled(tenants), args.repeat),
+                args.variants,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Benchmark a CPU-bound loop with and without SECCOMP_FILTER_FLAG_SPEC_ALLOW
+
+Depending on the Kernel's spec_store_bypass_disable setting, loading a
+seccomp filter forces the speculative store bypass mitigation (SSBD) on the
+task. The benchmark installs the same filter with and without the
+SPEC_ALLOW flag in forked children and times a store/load heavy loop.
+
+    python benchmarks/bench_ssb.py [--size N] [--repeat N]
+"""
+
+import argparse
+import array
+import os
+import struct
+import time
+
+from seccomppolicy._constants import ScmpAction, SeccompFilterFlag
+from seccomppolicy._containerpolicy import Policy, Rule
+from seccomppolicy._features import probe
+from seccomppolicy._installer import FilterInstaller
+
+POLICY = Policy(
+    ScmpAction.SCMP_ACT_ALLOW, (Rule(ScmpAction.SCMP_ACT_EPERM, "ptrace", ()),)
+)
+
+VULNERABILITY = "/sys/devices/system/cpu/vulnerabilities/spec_store_bypass"
+
+
+def _workload(size):
+    # store followed by dependent loads, the pattern SSBD slows down
+    buf = array.array("q", range(size))
+    for i in range(1, size):
+        buf[i] = buf[i - 1] + buf[i] & 0xFFFF
+    return buf[-1]
+
+
+def _ssb_status():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("Speculation_Store_Bypass:"):
+                return line.split(":", 1)[1].strip()
+    return "unknown"
+
+
+def _measure(installer, size):
+    """Run workload in a forked child, returns seconds and SSB status"""
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(rfd)
+            if installer is not None:
+                installer()
+            start = time.perf_counter()
+            _workload(size)
+            elapsed = time.perf_counter() - start
+            status = _ssb_status().encode("ascii")
+            os.write(wfd, struct.pack("d", elapsed) + status)
+        finally:
+            os._exit(0)
+    os.close(wfd)
+    data = os.read(rfd, 4096)
+    os.close(rfd)
+    os.waitpid(pid, 0)
+    return struct.unpack("d", data[:8])[0], data[8:].decode("ascii")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=2000000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    try:
+        with open(VULNERABILITY) as f:
+            print("spec_store_bypass: {}".format(f.read().strip()))
+    except OSError:
+        pass
+    if not probe().has_flag(SeccompFilterFlag.SPEC_ALLOW):
+        print("Kernel does not support SECCOMP_FILTER_FLAG_SPEC_ALLOW")
+
+    cases = [
+        ("no filter", None),
+        ("filter", FilterInstaller.from_policy(POLICY)),
+        (
+            "filter+spec_allow",
+            FilterInstaller.from_policy(POLICY, flags=SeccompFilterFlag.SPEC_ALLOW),
+        ),
+    ]
+    for label, installer in cases:
+        results = [_measure(installer, args.size) for _ in range(args.repeat)]
+        best = min(elapsed for elapsed, _ in results)
+        print("{:>18}: {:8.1f} ms  ({})".format(label, best * 1000, results[0][1]))
+
+
+if __name__ == "__main__":
+    main()
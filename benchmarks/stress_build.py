@@ -0,0 +1,290 @@
+"""Stress policy builds with synthetic profiles of growing size
+
+Generates seccomp.json profiles with a growing number of argument rules
+spread over many syscall names, with the subArchitectures of the default
+policy. For each size, a forked child measures _parse(), Seccomp.add_rule()
+for all rules, export_bpf() and export_pfc(), plus RSS growth. Python heap
+(tracemalloc) is measured in a separate child, tracing slows down the
+timed phases. A log-log fit of each metric against rule count flags
+super-linear growth.
+
+    python benchmarks/stress_build.py [--sizes 250,500,1000,2000]
+        [--args-per-rule N] [--max-exponent 1.6]
+        [--save baseline.json] [--baseline baseline.json] [--tolerance 1.5]
+        [--exponent-margin 0.15]
+
+Rule insertion and BPF generation of libseccomp are slightly super-linear
+(exponents of about 1.26 and 1.45 in benchmarks/baselines/), the default
+--max-exponent is above that. With a baseline, each exponent is instead
+compared with the recorded exponent of the baseline plus the margin.
+
+Exits with status 1 when a metric grows faster than allowed or is slower
+than the baseline by more than the tolerance factor.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import resource
+import sys
+import time
+import traceback
+import tracemalloc
+
+from seccomppolicy._containerpolicy import _parse, flatten
+from seccomppolicy._defaultpolicy import SUB_ARCHITECTURES
+from seccomppolicy._libseccomp import seccomp_version
+from seccomppolicy._seccomp import NATIVE_ARCH, Seccomp
+from seccomppolicy._syscalltable import get_table
+
+METRICS = ("parse", "add_rule", "export_bpf", "export_pfc", "heap_kib", "rss_kib")
+# timings are compared against the baseline, memory is only fitted
+TIMINGS = ("parse", "add_rule", "export_bpf", "export_pfc")
+
+
+def generate_profile(rules, args_per_rule=1):
+    """seccomp.json document with the given number of argument rules
+
+    Rules are spread round-robin over all syscall names of the native
+    architecture, each rule compares args_per_rule arguments for equality.
+    """
+    names = sorted(get_table().numbers())
+    syscalls = []
+    for i in range(rules):
+        syscalls.append(
+            {
+                "names": [names[i % len(names)]],
+                "action": "SCMP_ACT_ALLOW",
+                "comment": "",
+                "args": [
+                    {
+                        "index": index,
+                        "value": i // len(names) + index,
+                        "valueTwo": 0,
+                        "op": "SCMP_CMP_EQ",
+                    }
+                    for index in range(args_per_rule)
+                ],
+            }
+        )
+    arch_map = [
+        {
+            "architecture": arch.name,
+            "subArchitectures": [sub.name for sub in subs],
+        }
+        for arch, subs in SUB_ARCHITECTURES.items()
+    ]
+    return {
+        "defaultAction": "SCMP_ACT_ERRNO",
+        "archMap": arch_map,
+        "syscalls": syscalls,
+    }
+
+
+def _measure_heap(root):
+    """Peak Python heap of parse and add_rule in KiB, returns metrics dict"""
+    tracemalloc.start()
+    config = _parse(root)
+    policy = flatten(config["default_action"], config["syscalls"])
+    with Seccomp(policy.default_action) as sc:
+        for arch in config["archmap"].get(NATIVE_ARCH, ()):
+            sc.add_arch(arch)
+        for rule in policy.rules:
+            sc.add_rule(rule.action, rule.syscall, *rule.args)
+        _, heap = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"heap_kib": heap / 1024}
+
+
+def _measure(root):
+    """Measure a build in the current process, returns metrics dict"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    config = _parse(root)
+    parsed = time.perf_counter()
+
+    policy = flatten(config["default_action"], config["syscalls"])
+    with Seccomp(policy.default_action) as sc:
+        for arch in config["archmap"].get(NATIVE_ARCH, ()):
+            sc.add_arch(arch)
+        added_start = time.perf_counter()
+        for rule in policy.rules:
+            sc.add_rule(rule.action, rule.syscall, *rule.args)
+        added = time.perf_counter()
+
+        sc.export_bpf()
+        exported = time.perf_counter()
+        sc.export_pfc()
+        pfc = time.perf_counter()
+
+    return {
+        "parse": parsed - start,
+        "add_rule": added - added_start,
+        "export_bpf": exported - added,
+        "export_pfc": pfc - exported,
+        "rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss,
+    }
+
+
+def _measure_child(func, root):
+    """Run func(root) in a forked child, so RSS and caches start fresh"""
+    rfd, wfd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            os.close(rfd)
+            data = json.dumps(func(root)).encode("utf-8")
+            with os.fdopen(wfd, "wb") as f:
+                f.write(data)
+            status = 0
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            sys.stderr.flush()
+            os._exit(status)
+    os.close(wfd)
+    with os.fdopen(rfd, "rb") as f:
+        data = f.read()
+    _, status = os.waitpid(pid, 0)
+    if not os.WIFEXITED(status) or os.WEXITSTATUS(status):
+        raise RuntimeError("{} failed in child process".format(func.__name__))
+    return json.loads(data.decode("utf-8"))
+
+
+def growth_exponent(sizes, values):
+    """Least squares slope of log(value) over log(size)
+
+    1.0 is linear growth, 2.0 quadratic. Values of zero are ignored.
+    """
+    points = [
+        (math.log(size), math.log(value))
+        for size, value in zip(sizes, values)
+        if value > 0
+    ]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    sxx = sum((x - mean_x) ** 2 for x, _ in points)
+    if not sxx:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / sxx
+
+
+def run(sizes, args_per_rule, repeat):
+    results = {metric: [] for metric in METRICS}
+    for size in sizes:
+        root = generate_profile(size, args_per_rule)
+        runs = [_measure_child(_measure, root) for _ in range(repeat)]
+        # separate pass, tracemalloc must not overlap the timed phases
+        heap = _measure_child(_measure_heap, root)
+        for metric in METRICS:
+            if metric in heap:
+                results[metric].append(heap[metric])
+            else:
+                results[metric].append(min(r[metric] for r in runs))
+        print(
+            "{:>6} rules: parse {:7.1f} ms, add_rule {:8.1f} ms, "
+            "bpf {:8.1f} ms, pfc {:8.1f} ms, heap {:8.0f} KiB, "
+            "rss {:8.0f} KiB".format(
+                size,
+                results["parse"][-1] * 1000,
+                results["add_rule"][-1] * 1000,
+                results["export_bpf"][-1] * 1000,
+                results["export_pfc"][-1] * 1000,
+                results["heap_kib"][-1],
+                results["rss_kib"][-1],
+            )
+        )
+    return {
+        "machine": platform.machine(),
+        "python": platform.python_version(),
+        "libseccomp": str(seccomp_version().contents),
+        "args_per_rule": args_per_rule,
+        "sizes": list(sizes),
+        "results": results,
+        "exponents": {
+            metric: growth_exponent(sizes, values) for metric, values in results.items()
+        },
+    }
+
+
+def check(report, max_exponent, baseline=None, tolerance=1.5, exponent_margin=0.15):
+    """Return list of problems, super-linear growth and regressions"""
+    problems = []
+    base_exponents = baseline["exponents"] if baseline is not None else {}
+    for metric, exponent in sorted(report["exponents"].items()):
+        if exponent is None:
+            continue
+        base = base_exponents.get(metric)
+        if base is not None:
+            if exponent > base + exponent_margin:
+                problems.append(
+                    "{} grows faster than baseline (exponent {:.2f}, "
+                    "baseline {:.2f})".format(metric, exponent, base)
+                )
+        elif exponent > max_exponent:
+            problems.append(
+                "{} grows super-linearly (exponent {:.2f})".format(metric, exponent)
+            )
+    if baseline is not None:
+        base_sizes = baseline["sizes"]
+        for metric in TIMINGS:
+            for size, value in zip(report["sizes"], report["results"][metric]):
+                if size not in base_sizes:
+                    continue
+                base = baseline["results"][metric][base_sizes.index(size)]
+                if base > 0 and value > base * tolerance:
+                    problems.append(
+                        "{} at {} rules is {:.1f}x slower than baseline".format(
+                            metric, size, value / base
+                        )
+                    )
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="250,500,1000,2000")
+    parser.add_argument("--args-per-rule", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--max-exponent", type=float, default=1.6)
+    parser.add_argument("--save", help="write results as JSON baseline")
+    parser.add_argument("--baseline", help="compare timings with a JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    parser.add_argument("--exponent-margin", type=float, default=0.15)
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    report = run(sizes, args.args_per_rule, args.repeat)
+    print(
+        "growth exponents: "
+        + ", ".join(
+            "{} {:.2f}".format(metric, exponent)
+            for metric, exponent in sorted(report["exponents"].items())
+            if exponent is not None
+        )
+    )
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    problems = check(
+        report, args.max_exponent, baseline, args.tolerance, args.exponent_margin
+    )
+    for problem in problems:
+        print("WARNING: " + problem)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
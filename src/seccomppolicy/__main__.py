@@ -0,0 +1,476 @@
+"""Command line interface
+
+    python -m seccomppolicy run --profile PROFILE [--caps CAPS] -- CMD [ARGS]
+    python -m seccomppolicy scan [--tasks] [--format {json,csv}]
+    python -m seccomppolicy metrics [--audit-log FILE | --netlink] [--textfile FILE]
+    python -m seccomppolicy compile-server --socket PATH [--profile-dir DIR]
+    python -m seccomppolicy watch --output DIR [--variant NAME=CAPS] DIR [DIR ...]
+
+The launcher only imports the policy modules when a profile has to be
+compiled. Compiled programs are stored in a memory mapped policy bundle per
+profile, one program per condition variant. A cached program is checked
+against the libseccomp version and installed with plain prctl() calls.
+"""
+
+import argparse
+import ctypes
+import errno
+import hashlib
+import os
+import sys
+import time
+
+from . import __version__
+
+DEFAULT_PROFILE = "default"
+
+
+def _cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "seccomppolicy")
+
+
+def _profile_source(profile):
+    """Raw bytes of a profile, used for the cache key"""
+    if profile == DEFAULT_PROFILE:
+        # hash module source instead of importing the default policy
+        profile = os.path.join(os.path.dirname(__file__), "_defaultpolicy.py")
+    with open(profile, "rb") as f:
+        return f.read()
+
+
+def _policy_hash(profile, libseccomp, arch):
+    """sha256 digest of profile source, versions and native architecture"""
+    h = hashlib.sha256(_profile_source(profile))
+    h.update(__version__.encode("ascii"))
+    h.update(b"\0" + libseccomp.encode("ascii"))
+    h.update(b"\0" + str(int(arch)).encode("ascii"))
+    return h.digest()
+
+
+def _variant(arch, effective):
+    """Profile conditions depend on architecture, caps and Kernel release
+
+    arch is the architecture of the interpreter, not the machine of the
+    Kernel, e.g. a 32bit interpreter on x86_64 runs i386 programs.
+    """
+    from ._bundle import Variant
+
+    name = arch.name[len("SCMP_ARCH_") :].lower()
+    return Variant(name, effective, os.uname().release)
+
+
+def _libseccomp_version():
+    """Version of the libseccomp library, programs are specific to it
+
+    Cached launches only dlopen() the library, setting up the full binding
+    in _libseccomp takes milliseconds.
+    """
+    try:
+        lib = ctypes.CDLL("libseccomp.so.2")
+    except OSError:
+        from ._libseccomp import seccomp_version
+    else:
+        seccomp_version = lib.seccomp_version
+        seccomp_version.argtypes = ()
+        seccomp_version.restype = ctypes.POINTER(ctypes.c_uint * 3)
+        return "{}.{}.{}".format(*seccomp_version().contents)
+    return str(seccomp_version().contents)
+
+
+def _open_bundle(filename, libseccomp):
+    from ._bundle import Bundle
+
+    try:
+        return Bundle(filename, libseccomp)
+    except (OSError, ValueError):
+        return None
+
+
+def _update_bundle(filename, policy_hash, variant, bpf, arches, libseccomp):
+    """Add a compiled variant to the bundle, keep existing variants
+
+    The bundle is read again under a lock, concurrent launchers that compile
+    other variants do not lose their updates.
+    """
+    from ._bundle import locked, write_bundle
+
+    programs = {}
+    try:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with locked(filename):
+            bundle = _open_bundle(filename, libseccomp)
+            if bundle is not None:
+                with bundle:
+                    programs.update((v, bundle.bpf(v)) for v in bundle.variants)
+            programs[variant] = bpf
+            write_bundle(filename, policy_hash, arches, programs, libseccomp)
+    except OSError:
+        # cache is optional
+        pass
+
+
+def _compile(profile):
+    """Build BPF program of a profile for the native architecture
+
+    Returns BPF program and filter architectures.
+    """
+    from ._containerpolicy import flatten, load_file
+    from ._pool import PreparedRules
+    from ._seccomp import NATIVE_ARCH, Seccomp
+
+    if profile == DEFAULT_PROFILE:
+        from . import _defaultpolicy
+
+        policy = flatten(_defaultpolicy.DEFAULT_ACTION, _defaultpolicy.SYSCALLS)
+        arches = _defaultpolicy.SUB_ARCHITECTURES.get(NATIVE_ARCH, ())
+    else:
+        config = load_file(profile)
+        policy = flatten(config["default_action"], config["syscalls"])
+        arches = config["archmap"].get(NATIVE_ARCH, ())
+    with Seccomp(policy.default_action) as sc:
+        PreparedRules.from_policy(policy, arches).apply(sc)
+        return sc.export_bpf(), (NATIVE_ARCH,) + tuple(arches)
+
+
+def _parse_caps(value):
+    from ._constants import Capabilities
+
+    if value == "default":
+        # without the policy modules, they load libseccomp
+        from ._capprofile import DEFAULT_CAPABILITIES
+
+        return DEFAULT_CAPABILITIES
+    caps = []
+    for name in value.split(","):
+        name = name.strip().upper()
+        if not name:
+            continue
+        if not name.startswith("CAP_"):
+            name = "CAP_" + name
+        try:
+            caps.append(Capabilities[name])
+        except KeyError:
+            raise argparse.ArgumentTypeError("unknown capability {}".format(name))
+    return caps
+
+
+def run(args):
+    start = time.perf_counter()
+    from ._bpf import fprog, install_fprog
+    from ._capprofile import CapProfile, apply_profile, snapshot
+
+    imported = time.perf_counter()
+    if args.caps is not None:
+        profile = CapProfile.from_caps(args.caps, ambient=args.ambient)
+        apply_profile(profile)
+    capped = time.perf_counter()
+
+    bundle = variant = None
+    if not args.no_cache:
+        from ._syscalltable import native_arch
+
+        arch = native_arch()
+        libseccomp = _libseccomp_version()
+        policy_hash = _policy_hash(args.profile, libseccomp, arch)
+        filename = os.path.join(args.cache_dir, policy_hash.hex() + ".bundle")
+        variant = _variant(arch, snapshot().effective)
+        bundle = _open_bundle(filename, libseccomp)
+    cached = bundle is not None and bundle.arches[:1] == (arch,) and variant in bundle
+    if cached:
+        # zero-copy view into the shared mapping
+        prog, filters = bundle.program(variant)
+    else:
+        bpf, arches = _compile(args.profile)
+        if variant is not None:
+            _update_bundle(filename, policy_hash, variant, bpf, arches, libseccomp)
+        prog, filters = fprog(bpf)
+    loaded = time.perf_counter()
+
+    flags = 0
+    if args.spec_allow:
+        from ._constants import SeccompFilterFlag
+
+        flags |= SeccompFilterFlag.SPEC_ALLOW
+    try:
+        install_fprog(ctypes.addressof(prog), flags, True)
+    except OSError as e:
+        # Kernel < 4.17 rejects SECCOMP_FILTER_FLAG_SPEC_ALLOW
+        if not flags or e.errno not in (errno.EINVAL, errno.ENOSYS):
+            raise
+        sys.stderr.write(
+            "seccomppolicy: Kernel does not support --spec-allow, ignored\n"
+        )
+        install_fprog(ctypes.addressof(prog), 0, True)
+    done = time.perf_counter()
+
+    if args.timing:
+        sys.stderr.write(
+            "seccomppolicy: setup {total:.3f} ms (imports {imports:.3f} ms, "
+            "caps {caps:.3f} ms, {how} {load:.3f} ms, "
+            "install {install:.3f} ms)\n".format(
+                total=(done - start) * 1000,
+                imports=(imported - start) * 1000,
+                caps=(capped - imported) * 1000,
+                how="cached" if cached else "compiled",
+                load=(loaded - capped) * 1000,
+                install=(done - loaded) * 1000,
+            )
+        )
+        sys.stderr.flush()
+    os.execvp(args.command[0], args.command)
+
+
+def scan(args):
+    from . import _scan
+
+    statuses = _scan.scan(tasks=args.tasks, max_workers=args.workers)
+    if args.min_filters:
+        statuses = [s for s in statuses if (s.filters or 0) >= args.min_filters]
+    if args.with_caps:
+        statuses = [s for s in statuses if s.cap_eff]
+    if args.format == "csv":
+        _scan.write_csv(statuses, sys.stdout)
+    else:
+        _scan.write_json(statuses, sys.stdout)
+
+
+def metrics(args):
+    import threading
+
+    from . import _metrics
+
+    counters = _metrics.DenialCounters(args.max_series)
+    if args.socket:
+        _metrics.serve_unix(args.socket, counters)
+    if args.textfile:
+
+        def writer():
+            while True:
+                _metrics.write_textfile(args.textfile, counters)
+                time.sleep(args.interval)
+
+        threading.Thread(target=writer, daemon=True).start()
+    if args.netlink:
+        source = _metrics.follow_netlink()
+    else:
+        source = _metrics.follow_file(args.audit_log)
+    for line in source:
+        record = _metrics.parse_record(line)
+        if record is not None:
+            counters.add(record)
+
+
+def compile_server(args):
+    from ._compileserver import CompileServer
+
+    server = CompileServer(
+        args.socket,
+        maxsize=args.cache_size,
+        max_clients=args.max_clients,
+        max_compiles=args.max_compiles,
+        profile_dirs=args.profile_dir,
+    )
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def _parse_variant(value):
+    from ._watch import WatchVariant
+
+    name, sep, caps = value.partition("=")
+    if not sep or not name or "/" in name:
+        raise argparse.ArgumentTypeError("expected NAME=CAPS, got {}".format(value))
+    return WatchVariant(name, None, frozenset(_parse_caps(caps)))
+
+
+def watch(args):
+    import logging
+
+    from ._watch import DEFAULT_VARIANTS, PolicyWatcher
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s: %(message)s")
+    watcher = PolicyWatcher(
+        args.directories,
+        args.output,
+        variants=args.variants or DEFAULT_VARIANTS,
+        debounce=args.debounce,
+    )
+    with watcher:
+        watcher.sync()
+        watcher.run()
+
+
+def _parser():
+    parser = argparse.ArgumentParser(prog="python -m seccomppolicy")
+    subparsers = parser.add_subparsers(dest="subcommand")
+    subparsers.required = True
+
+    parser_run = subparsers.add_parser(
+        "run", help="run a command with a seccomp profile and capabilities"
+    )
+    parser_run.set_defaults(func=run)
+    parser_run.add_argument(
+        "--profile",
+        default=DEFAULT_PROFILE,
+        help="'default' or path to a container seccomp.json (default: %(default)s)",
+    )
+    parser_run.add_argument(
+        "--caps",
+        type=_parse_caps,
+        default=None,
+        help=(
+            "comma separated list of capabilities or 'default', "
+            "keeps capabilities unchanged when not given"
+        ),
+    )
+    parser_run.add_argument(
+        "--ambient",
+        action="store_true",
+        help="raise capabilities in ambient set, so they survive execve()",
+    )
+    parser_run.add_argument(
+        "--spec-allow",
+        action="store_true",
+        help="do not force speculative store bypass mitigation on the command",
+    )
+    parser_run.add_argument(
+        "--cache-dir",
+        default=_cache_dir(),
+        help="directory for compiled profiles (default: %(default)s)",
+    )
+    parser_run.add_argument(
+        "--no-cache", action="store_true", help="always compile the profile"
+    )
+    parser_run.add_argument(
+        "--timing", action="store_true", help="report setup time on stderr"
+    )
+    parser_run.add_argument("command", nargs=argparse.REMAINDER)
+
+    parser_scan = subparsers.add_parser(
+        "scan", help="report seccomp and capability state of all processes"
+    )
+    parser_scan.set_defaults(func=scan)
+    parser_scan.add_argument(
+        "--tasks", action="store_true", help="include all threads of each process"
+    )
+    parser_scan.add_argument("--format", choices=("json", "csv"), default="json")
+    parser_scan.add_argument(
+        "--min-filters",
+        type=int,
+        default=0,
+        help="only report processes with at least N stacked filters",
+    )
+    parser_scan.add_argument(
+        "--with-caps",
+        action="store_true",
+        help="only report processes with effective capabilities",
+    )
+    parser_scan.add_argument("--workers", type=int, default=None)
+
+    parser_metrics = subparsers.add_parser(
+        "metrics", help="export counters of seccomp audit records"
+    )
+    parser_metrics.set_defaults(func=metrics)
+    source = parser_metrics.add_mutually_exclusive_group()
+    source.add_argument(
+        "--audit-log",
+        default="/var/log/audit/audit.log",
+        help="follow audit log file (default: %(default)s)",
+    )
+    source.add_argument(
+        "--netlink",
+        action="store_true",
+        help="read audit netlink multicast group (needs CAP_AUDIT_READ)",
+    )
+    parser_metrics.add_argument(
+        "--textfile", help="write Prometheus text file, e.g. for node_exporter"
+    )
+    parser_metrics.add_argument(
+        "--socket", help="serve Prometheus text exposition on a Unix socket"
+    )
+    parser_metrics.add_argument(
+        "--interval",
+        type=float,
+        default=15.0,
+        help="text file update interval in seconds (default: %(default)s)",
+    )
+    parser_metrics.add_argument(
+        "--max-series",
+        type=int,
+        default=1024,
+        help="maximum number of (comm, syscall, action) series",
+    )
+
+    parser_server = subparsers.add_parser(
+        "compile-server", help="serve compiled profiles as sealed memfds"
+    )
+    parser_server.set_defaults(func=compile_server)
+    parser_server.add_argument("--socket", required=True, help="Unix socket path")
+    parser_server.add_argument(
+        "--cache-size",
+        type=int,
+        default=64,
+        help="maximum number of cached programs (default: %(default)s)",
+    )
+    parser_server.add_argument(
+        "--max-clients",
+        type=int,
+        default=64,
+        help="maximum number of concurrent clients (default: %(default)s)",
+    )
+    parser_server.add_argument(
+        "--max-compiles",
+        type=int,
+        default=None,
+        help="maximum number of concurrent compilations (default: CPU count)",
+    )
+    parser_server.add_argument(
+        "--profile-dir",
+        action="append",
+        default=[],
+        help="directory of profiles that clients may request (repeatable)",
+    )
+
+    parser_watch = subparsers.add_parser(
+        "watch", help="recompile profiles of directories when they change"
+    )
+    parser_watch.set_defaults(func=watch)
+    parser_watch.add_argument(
+        "--output", required=True, help="directory for compiled programs"
+    )
+    parser_watch.add_argument(
+        "--variant",
+        dest="variants",
+        type=_parse_variant,
+        action="append",
+        help=(
+            "compile a capability variant, NAME=CAPS with a comma separated "
+            "list of capabilities or 'default' (default: no capabilities)"
+        ),
+    )
+    parser_watch.add_argument(
+        "--debounce",
+        type=float,
+        default=0.2,
+        help="quiet period after changes in seconds (default: %(default)s)",
+    )
+    parser_watch.add_argument("directories", nargs="+", help="profile directories")
+    return parser
+
+
+def main(argv=None):
+    parser = _parser()
+    args = parser.parse_args(argv)
+    if args.subcommand == "run":
+        if args.command and args.command[0] == "--":
+            args.command = args.command[1:]
+        if not args.command:
+            parser.error("run: missing command")
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,483 @@
+import collections
+import itertools
+
+from ._bpf import seccomp_data
+from ._constants import ScmpAction, ScmpArch, ScmpCmp, action_precedence
+from . import _seccomp
+from ._containerpolicy import Policy, Rule
+from ._libseccomp import ScmpArg
+
+__all__ = (
+    "ArgSpace",
+    "Cell",
+    "SyscallSpace",
+    "Witness",
+    "accepted",
+    "compare",
+    "equivalent",
+    "evaluate",
+    "merge",
+    "prune",
+    "syscall_rules",
+)
+
+UINT64_MAX = (1 << 64) - 1
+
+# Set of argument values: interval lo..hi (inclusive) that matches the masked
+# pattern and none of the antipatterns. Patterns are (mask, value) tuples,
+# "sample" is the smallest value in the set.
+Cell = collections.namedtuple("Cell", "lo hi pattern antipatterns sample")
+
+# seccomp_data on which two policies disagree
+Witness = collections.namedtuple("Witness", "data action_a action_b")
+
+_MATCH_ALL = (0, 0)
+
+
+def _popcount(x):
+    return bin(x).count("1")
+
+
+def _join(p1, p2):
+    """Intersect two masked patterns, returns None if they are disjoint"""
+    m1, v1 = p1
+    m2, v2 = p2
+    if (v1 ^ v2) & m1 & m2:
+        return None
+    return (m1 | m2, v1 | v2)
+
+
+def _count_le(n, pattern):
+    """Number of values 0 <= x <= n with x & mask == value"""
+    if n < 0:
+        return 0
+    mask, value = pattern
+    total = 0
+    for bit in range(63, -1, -1):
+        b = 1 << bit
+        if n & b:
+            if not value & b:
+                # x has a 0 bit here, lower bits outside the mask are free
+                total += 1 << _popcount(~mask & (b - 1))
+            if mask & b and not value & b:
+                return total
+        elif value & b:
+            return total
+    return total + 1
+
+
+def _count(lo, hi, pattern, antipatterns):
+    """Number of values in lo..hi that match pattern but no antipattern"""
+    # inclusion-exclusion over antipatterns
+    total = 0
+    for r in range(len(antipatterns) + 1):
+        for combo in itertools.combinations(antipatterns, r):
+            p = pattern
+            for ap in combo:
+                p = _join(p, ap)
+                if p is None:
+                    break
+            if p is None:
+                continue
+            n = _count_le(hi, p) - _count_le(lo - 1, p)
+            total += -n if r % 2 else n
+    return total
+
+
+def _first(lo, hi, pattern, antipatterns):
+    """Smallest value in lo..hi that matches pattern but no antipattern"""
+    if not _count(lo, hi, pattern, antipatterns):
+        return None
+    start = lo
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if _count(start, mid, pattern, antipatterns):
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+class ArgSpace:
+    """Partition of a 64bit argument by a set of comparisons
+
+    EQ, NE, LT, LE, GE and GT split the value range into intervals, MASKED_EQ
+    comparisons add masked patterns. All values in a cell satisfy exactly the
+    same comparisons, so one sample per cell is enough to evaluate rules.
+    """
+
+    __slots__ = ("_starts", "_patterns", "_cells")
+
+    def __init__(self, args=()):
+        starts = {0}
+        patterns = set()
+        for arg in args:
+            op = arg.op
+            datum = arg.datum_a
+            if op == ScmpCmp.SCMP_CMP_MASKED_EQ:
+                # pattern with value bits outside the mask never matches
+                if not arg.datum_b & ~datum:
+                    patterns.add((datum, arg.datum_b))
+            elif op in (ScmpCmp.SCMP_CMP_EQ, ScmpCmp.SCMP_CMP_NE):
+                starts.update((datum, datum + 1))
+            elif op in (ScmpCmp.SCMP_CMP_LT, ScmpCmp.SCMP_CMP_GE):
+                starts.add(datum)
+            elif op in (ScmpCmp.SCMP_CMP_LE, ScmpCmp.SCMP_CMP_GT):
+                starts.add(datum + 1)
+            else:
+                raise ValueError(op)
+        starts.discard(UINT64_MAX + 1)
+        self._starts = tuple(sorted(starts))
+        self._patterns = tuple(sorted(patterns))
+        self._cells = None
+
+    @property
+    def cells(self):
+        if self._cells is None:
+            self._cells = tuple(self._iter_cells())
+        return self._cells
+
+    def _iter_cells(self):
+        ends = self._starts[1:] + (UINT64_MAX + 1,)
+        signs = list(itertools.product((True, False), repeat=len(self._patterns)))
+        for lo, end in zip(self._starts, ends):
+            hi = end - 1
+            for sign in signs:
+                pattern = _MATCH_ALL
+                antipatterns = []
+                for p, positive in zip(self._patterns, sign):
+                    if positive:
+                        pattern = _join(pattern, p)
+                        if pattern is None:
+                            break
+                    else:
+                        antipatterns.append(p)
+                if pattern is None:
+                    continue
+                antipatterns = tuple(antipatterns)
+                sample = _first(lo, hi, pattern, antipatterns)
+                if sample is not None:
+                    yield Cell(lo, hi, pattern, antipatterns, sample)
+
+
+class SyscallSpace:
+    """Argument space of a syscall, partitioned by the comparisons of rules
+
+    Accepts any number of rule lists, each a sequence of (action, args).
+    """
+
+    __slots__ = ("indexes", "spaces")
+
+    def __init__(self, *rulelists):
+        by_index = collections.defaultdict(list)
+        for rules in rulelists:
+            for _, args in rules:
+                for arg in args:
+                    by_index[arg.arg].append(arg)
+        self.indexes = tuple(sorted(by_index))
+        self.spaces = tuple(ArgSpace(by_index[i]) for i in self.indexes)
+
+    def __iter__(self):
+        """Iterate over all combinations of cells of the used arguments"""
+        return itertools.product(*(space.cells for space in self.spaces))
+
+    def values(self, cells):
+        """Sample argument values (a0 ... a5) for a combination of cells"""
+        values = [0] * 6
+        for index, cell in zip(self.indexes, cells):
+            values[index] = cell.sample
+        return values
+
+    def partition(self, rules, default_action):
+        """Map each resulting action to its list of cell combinations"""
+        result = collections.defaultdict(list)
+        for cells in self:
+            action = evaluate(rules, default_action, self.values(cells))
+            result[action].append(cells)
+        return dict(result)
+
+
+def _indexes(args):
+    return tuple(sorted(set(arg.arg for arg in args)))
+
+
+def prune(rules, key=None):
+    """Rules of a syscall in the order in which libseccomp evaluates them
+
+    rules is a sequence of (action, args) in insertion order, key extracts
+    (action, args) from other rule objects like in sorted(). The first
+    unconditional rule replaces all other rules, a rule whose comparisons
+    are a superset of another rule's comparisons is never reached and equal
+    rules are merged. libseccomp checks arguments in ascending order and
+    the rule that compares the higher argument numbers takes precedence, so
+    the remaining rules are sorted by their argument numbers in descending
+    order and rules that compare the same arguments by action precedence.
+    The first matching rule wins.
+
+    Raises ValueError when the comparisons of a rule, ordered by argument,
+    equal or start the comparisons of an earlier rule with another action,
+    libseccomp rejects the rule with EEXIST.
+
+    The order is exact when comparisons of the same argument in different
+    rules never match the same value, like EQ comparisons. For overlapping
+    comparisons of an argument (ranges, NE, MASKED_EQ) the result depends on
+    the node order of libseccomp's decision tree, which is not modelled.
+    """
+    keyed = []
+    for rule in rules:
+        action, args = rule if key is None else key(rule)
+        if not args:
+            return [rule]
+        chain = tuple(sorted(set(arg.key() for arg in args)))
+        duplicate = False
+        for _, other_action, _, other_chain in keyed:
+            if other_chain[: len(chain)] != chain:
+                continue
+            if other_action != action:
+                raise ValueError(
+                    "{!r} conflicts with a rule with action {!r}".format(
+                        rule, other_action
+                    )
+                )
+            duplicate = duplicate or other_chain == chain
+        if not duplicate:
+            keyed.append((rule, action, args, chain))
+    keyed = [
+        entry
+        for entry in keyed
+        if not any(set(other[3]) < set(entry[3]) for other in keyed)
+    ]
+    keyed.sort(key=lambda entry: action_precedence(entry[1]))
+    keyed.sort(key=lambda entry: _indexes(entry[2]), reverse=True)
+    return [entry[0] for entry in keyed]
+
+
+def evaluate(rules, default_action, values):
+    """Action of a syscall's pruned rules for argument values"""
+    for action, args in rules:
+        if all(arg.matches(values[arg.arg]) for arg in args):
+            return action
+    return default_action
+
+
+def _resolve(syscall, arch):
+    if isinstance(syscall, str):
+        return _seccomp.Syscall(syscall, arch).nr
+    elif isinstance(syscall, _seccomp.Syscall):
+        if _native(syscall.arch) == arch:
+            return syscall.nr
+        return _seccomp.Syscall(syscall.name, arch).nr
+    else:
+        return int(syscall)
+
+
+def _native(arch):
+    if arch == ScmpArch.SCMP_ARCH_NATIVE:
+        return _seccomp.NATIVE_ARCH
+    return arch
+
+
+def syscall_rules(policy, arch=ScmpArch.SCMP_ARCH_NATIVE):
+    """Map syscall numbers of a Policy to pruned lists of (action, args)
+
+    Rules with the default action are dropped, libseccomp rejects them.
+    """
+    arch = _native(arch)
+    table = collections.defaultdict(list)
+    for rule in policy.rules:
+        if rule.action == policy.default_action:
+            continue
+        nr = _resolve(rule.syscall, arch)
+        if nr < 0:
+            # pseudo syscall, not available on arch
+            continue
+        table[nr].append((rule.action, tuple(rule.args)))
+    return {nr: prune(rules) for nr, rules in table.items()}
+
+
+def _seccomp_data(nr, arch, values):
+    data = seccomp_data(nr=nr, arch=arch)
+    for i, value in enumerate(values):
+        data.args[i] = value
+    return data
+
+
+def accepted(
+    policy, syscall, arch=ScmpArch.SCMP_ARCH_NATIVE, action=ScmpAction.SCMP_ACT_ALLOW
+):
+    """Argument space of a syscall that results in action
+
+    Returns a tuple of argument indexes and a list of cell combinations, the
+    union of the cells is the accepted space.
+    """
+    arch = _native(arch)
+    rules = syscall_rules(policy, arch).get(_resolve(syscall, arch), ())
+    space = SyscallSpace(rules)
+    cells = space.partition(rules, policy.default_action).get(action, [])
+    return space.indexes, cells
+
+
+def compare(policy_a, policy_b, arch=ScmpArch.SCMP_ARCH_NATIVE):
+    """Compare two Policy objects on an architecture
+
+    Returns None when both policies result in the same action for all
+    syscalls and argument values, otherwise a Witness with seccomp_data on
+    which they disagree.
+    """
+    arch = _native(arch)
+    rules_a = syscall_rules(policy_a, arch)
+    rules_b = syscall_rules(policy_b, arch)
+    for nr in sorted(set(rules_a) | set(rules_b)):
+        ra = rules_a.get(nr, ())
+        rb = rules_b.get(nr, ())
+        space = SyscallSpace(ra, rb)
+        for cells in space:
+            values = space.values(cells)
+            action_a = evaluate(ra, policy_a.default_action, values)
+            action_b = evaluate(rb, policy_b.default_action, values)
+            if action_a != action_b:
+                return Witness(_seccomp_data(nr, arch, values), action_a, action_b)
+    if policy_a.default_action != policy_b.default_action:
+        # any syscall without rules
+        nr = next(i for i in itertools.count() if i not in rules_a and i not in rules_b)
+        return Witness(
+            _seccomp_data(nr, arch, ()),
+            policy_a.default_action,
+            policy_b.default_action,
+        )
+    return None
+
+
+def equivalent(policy_a, policy_b, arch=ScmpArch.SCMP_ARCH_NATIVE):
+    """Check if two Policy objects behave the same on an architecture"""
+    return compare(policy_a, policy_b, arch) is None
+
+
+def _blocks(lo, hi):
+    """Split lo..hi into aligned blocks of power of two size"""
+    while lo <= hi:
+        size = lo & -lo if lo else 1 << 64
+        while size > hi - lo + 1:
+            size >>= 1
+        yield lo, size
+        lo += size
+
+
+def _subtract(pattern, antipatterns):
+    """Split pattern minus antipatterns into disjoint masked patterns"""
+    if not antipatterns:
+        return [pattern]
+    ap, rest = antipatterns[0], antipatterns[1:]
+    if _join(pattern, ap) is None:
+        return _subtract(pattern, rest)
+    mask, value = pattern
+    ap_mask, ap_value = ap
+    result = []
+    free = ap_mask & ~mask
+    for bit in range(64):
+        b = 1 << bit
+        if free & b:
+            # values that differ from the antipattern in this bit
+            result.extend(_subtract((mask | b, value | (~ap_value & b)), rest))
+            mask |= b
+            value |= ap_value & b
+    return result
+
+
+def _cell_args(index, cell):
+    """Express a cell as a union of single comparisons on an argument
+
+    Returns a list of disjoint ScmpArg, or [None] if the cell covers all
+    values. libseccomp allows one comparison per argument and rule.
+    """
+    lo, hi, pattern, antipatterns = cell[:4]
+    if lo == hi:
+        return [ScmpArg(index, ScmpCmp.SCMP_CMP_EQ, lo)]
+    if pattern == _MATCH_ALL and not antipatterns:
+        if lo == 0 and hi == UINT64_MAX:
+            return [None]
+        elif lo == 0:
+            return [ScmpArg(index, ScmpCmp.SCMP_CMP_LE, hi)]
+        elif hi == UINT64_MAX:
+            return [ScmpArg(index, ScmpCmp.SCMP_CMP_GE, lo)]
+    if lo == 0 and hi == UINT64_MAX:
+        blocks = [pattern]
+    else:
+        blocks = []
+        for base, size in _blocks(lo, hi):
+            block = _join((UINT64_MAX & ~(size - 1), base), pattern)
+            if block is not None:
+                blocks.append(block)
+    result = []
+    for block in blocks:
+        for mask, value in _subtract(block, antipatterns):
+            if mask == UINT64_MAX:
+                result.append(ScmpArg(index, ScmpCmp.SCMP_CMP_EQ, value))
+            else:
+                result.append(ScmpArg(index, ScmpCmp.SCMP_CMP_MASKED_EQ, mask, value))
+    return result
+
+
+def _simplify(combos, space):
+    """Replace cells of arguments that do not affect the action with None"""
+    combos = set(combos)
+    for d, argspace in enumerate(space.spaces):
+        groups = collections.defaultdict(set)
+        for combo in combos:
+            groups[combo[:d] + combo[d + 1 :]].add(combo[d])
+        combos = set()
+        for rest, cells in groups.items():
+            if None in cells or len(cells) == len(argspace.cells):
+                combos.add(rest[:d] + (None,) + rest[d:])
+            else:
+                combos.update(rest[:d] + (cell,) + rest[d:] for cell in cells)
+    return combos
+
+
+def merge(*policies, arch=ScmpArch.SCMP_ARCH_NATIVE):
+    """Merge policies into one Policy with the semantics of stacked filters
+
+    The Kernel runs all stacked filters and the most restrictive action
+    wins. The merged policy computes the same action for every syscall and
+    argument value on arch with a single filter. Conditional rules are
+    disjoint, so the result does not depend on rule order.
+    """
+    if not policies:
+        raise ValueError("at least one policy is required")
+    arch = _native(arch)
+    default_action = min(
+        (policy.default_action for policy in policies), key=action_precedence
+    )
+    tables = [(syscall_rules(policy, arch), policy) for policy in policies]
+    rules = []
+    for nr in sorted(set().union(*(table for table, _ in tables))):
+        rulelists = [
+            (table.get(nr, ()), policy.default_action) for table, policy in tables
+        ]
+        space = SyscallSpace(*(rl for rl, _ in rulelists))
+        by_action = collections.defaultdict(list)
+        for cells in space:
+            values = space.values(cells)
+            action = min(
+                (evaluate(rl, default, values) for rl, default in rulelists),
+                key=action_precedence,
+            )
+            by_action[action].append(cells)
+        name = _seccomp.Syscall(nr, arch).name
+        if len(by_action) == 1:
+            (action,) = by_action
+            if action != default_action:
+                rules.append(Rule(action, name, ()))
+            continue
+        for action in sorted(by_action, key=action_precedence):
+            if action == default_action:
+                continue
+            for combo in sorted(_simplify(by_action[action], space), key=repr):
+                arglists = [
+                    _cell_args(index, cell) if cell is not None else [None]
+                    for index, cell in zip(space.indexes, combo)
+                ]
+                for args in itertools.product(*arglists):
+                    args = tuple(arg for arg in args if arg is not None)
+                    rules.append(Rule(action, name, args))
+    return Policy(default_action, tuple(rules))
@@ -0,0 +1,341 @@
+import ctypes
+import errno
+import struct
+
+from . import _libc
+from ._constants import Prctl, SeccompFilterFlag, SeccompMode, SeccompOp
+
+__all__ = (
+    "BPF_MAXINSNS",
+    "TsyncError",
+    "accumulators",
+    "decode",
+    "encode",
+    "evaluate",
+    "fprog",
+    "insn",
+    "install_fprog",
+    "seccomp_data",
+    "sock_filter",
+    "sock_fprog",
+    "successors",
+)
+
+
+# instruction classes, sizes, modes and operations, linux/bpf_common.h
+BPF_LD = 0x00
+BPF_LDX = 0x01
+BPF_ST = 0x02
+BPF_STX = 0x03
+BPF_ALU = 0x04
+BPF_JMP = 0x05
+BPF_RET = 0x06
+BPF_MISC = 0x07
+
+BPF_W = 0x00
+BPF_H = 0x08
+BPF_B = 0x10
+
+BPF_IMM = 0x00
+BPF_ABS = 0x20
+BPF_IND = 0x40
+BPF_MEM = 0x60
+BPF_LEN = 0x80
+BPF_MSH = 0xA0
+
+BPF_ADD = 0x00
+BPF_SUB = 0x10
+BPF_MUL = 0x20
+BPF_DIV = 0x30
+BPF_OR = 0x40
+BPF_AND = 0x50
+BPF_LSH = 0x60
+BPF_RSH = 0x70
+BPF_NEG = 0x80
+BPF_MOD = 0x90
+BPF_XOR = 0xA0
+
+BPF_JA = 0x00
+BPF_JEQ = 0x10
+BPF_JGT = 0x20
+BPF_JGE = 0x30
+BPF_JSET = 0x40
+
+BPF_K = 0x00
+BPF_X = 0x08
+BPF_A = 0x10
+
+BPF_TAX = 0x00
+BPF_TXA = 0x80
+
+BPF_MEMWORDS = 16
+BPF_MAXINSNS = 4096
+
+# struct sock_filter in native byte order
+_INSN = struct.Struct("=HBBI")
+_WORD = struct.Struct("=I")
+
+
+def insn(code, k=0, jt=0, jf=0):
+    """Encode a single instruction, like BPF_STMT() and BPF_JUMP()"""
+    return _INSN.pack(code, jt, jf, k & 0xFFFFFFFF)
+
+
+def decode(bpf):
+    """Split a BPF program into (code, jt, jf, k) tuples"""
+    if len(bpf) % _INSN.size:
+        raise ValueError(
+            "BPF program length is not a multiple of {}".format(_INSN.size)
+        )
+    return [_INSN.unpack_from(bpf, i) for i in range(0, len(bpf), _INSN.size)]
+
+
+def encode(insns):
+    """Join (code, jt, jf, k) tuples into a BPF program"""
+    return b"".join(_INSN.pack(*ins) for ins in insns)
+
+
+def successors(index, code, jt, jf, k):
+    """Indexes of the instructions that can follow an instruction"""
+    cls = code & 0x07
+    if cls == BPF_RET:
+        return ()
+    if cls == BPF_JMP:
+        if code & 0xF0 == BPF_JA:
+            return (index + 1 + k,)
+        return (index + 1 + jt, index + 1 + jf)
+    return (index + 1,)
+
+
+def accumulators(insns):
+    """Possible accumulator values on entry of each instruction
+
+    Returns a frozenset per (code, jt, jf, k) tuple. Values are ("ld", offset)
+    for a word loaded from seccomp_data, (code, k, value) for an ALU operation
+    on a value or ("unknown", index). The set of the first instruction
+    contains None. BPF only jumps forward, so a single pass is sufficient.
+    """
+    incoming = [set() for _ in range(len(insns) + 1)]
+    incoming[0].add(None)
+    result = []
+    for i, (code, jt, jf, k) in enumerate(insns):
+        sources = frozenset(incoming[i])
+        cls = code & 0x07
+        if cls == BPF_LD and code & 0xE0 == BPF_ABS:
+            out = {("ld", k)}
+        elif cls == BPF_ALU:
+            out = {(code, k, source) for source in sources}
+        elif cls == BPF_JMP or cls == BPF_LDX or cls == BPF_ST or cls == BPF_STX:
+            out = sources
+        elif cls == BPF_MISC and code & 0xF8 == BPF_TAX:
+            out = sources
+        else:
+            out = {("unknown", i)}
+        for successor in successors(i, code, jt, jf, k):
+            if successor < len(incoming):
+                incoming[successor].update(out)
+        result.append(sources)
+    return result
+
+
+class seccomp_data(ctypes.Structure):
+    """struct seccomp_data, linux/seccomp.h
+
+    Input of a seccomp BPF program.
+    """
+
+    __slots__ = ()
+    _fields_ = [
+        ("nr", ctypes.c_int),
+        ("arch", ctypes.c_uint32),
+        ("instruction_pointer", ctypes.c_uint64),
+        ("args", ctypes.c_uint64 * 6),
+    ]
+
+    def __repr__(self):
+        return (
+            "{self.__class__.__name__}(nr={self.nr}, arch=0x{self.arch:x}, "
+            "instruction_pointer=0x{self.instruction_pointer:x}, args={args})"
+        ).format(self=self, args=tuple(self.args))
+
+
+class sock_filter(ctypes.Structure):
+    """struct sock_filter, linux/filter.h
+
+    A single classic BPF instruction.
+    """
+
+    __slots__ = ()
+    _fields_ = [
+        ("code", ctypes.c_uint16),
+        ("jt", ctypes.c_uint8),
+        ("jf", ctypes.c_uint8),
+        ("k", ctypes.c_uint32),
+    ]
+
+    def __repr__(self):
+        return (
+            "{self.__class__.__name__}(0x{self.code:04x}, {self.jt}, {self.jf}, "
+            "0x{self.k:08x})"
+        ).format(self=self)
+
+
+class sock_fprog(ctypes.Structure):
+    """struct sock_fprog, linux/filter.h"""
+
+    __slots__ = ()
+    _fields_ = [
+        ("len", ctypes.c_ushort),
+        ("filter", ctypes.POINTER(sock_filter)),
+    ]
+
+
+def fprog(bpf):
+    """Create a sock_fprog from a buffer of sock_filter instructions
+
+    Returns the sock_fprog and the sock_filter array. The array is not
+    copied for writable buffers and must be kept alive as long as the
+    sock_fprog is used.
+    """
+    size = ctypes.sizeof(sock_filter)
+    if len(bpf) % size:
+        raise ValueError("BPF program length is not a multiple of {}".format(size))
+    count = len(bpf) // size
+    if isinstance(bpf, bytes):
+        filters = (sock_filter * count).from_buffer_copy(bpf)
+    else:
+        filters = (sock_filter * count).from_buffer(bpf)
+    return sock_fprog(count, filters), filters
+
+
+def _alu(op, a, operand):
+    if op == BPF_ADD:
+        return a + operand
+    if op == BPF_SUB:
+        return a - operand
+    if op == BPF_MUL:
+        return a * operand
+    if op == BPF_DIV:
+        return a // operand
+    if op == BPF_MOD:
+        return a % operand
+    if op == BPF_OR:
+        return a | operand
+    if op == BPF_AND:
+        return a & operand
+    if op == BPF_XOR:
+        return a ^ operand
+    if op == BPF_LSH:
+        return a << operand if operand < 32 else 0
+    if op == BPF_RSH:
+        return a >> operand if operand < 32 else 0
+    if op == BPF_NEG:
+        return -a
+    raise ValueError("invalid ALU operation 0x{:02x}".format(op))
+
+
+def evaluate(bpf, data, trace=None):
+    """Run a seccomp BPF program on a seccomp_data, returns the return value
+
+    A plain interpreter for classic BPF as accepted by seccomp. Loads read
+    the seccomp_data in host byte order. trace is an optional list that
+    receives the index of every executed instruction.
+    """
+    buf = bytes(data)
+    count = len(bpf) // _INSN.size
+    a = x = 0
+    mem = [0] * BPF_MEMWORDS
+    pc = 0
+    while True:
+        if pc >= count:
+            raise ValueError("program does not end with a return")
+        code, jt, jf, k = _INSN.unpack_from(bpf, pc * _INSN.size)
+        if trace is not None:
+            trace.append(pc)
+        pc += 1
+        cls = code & 0x07
+        if cls == BPF_RET:
+            return a if code & 0x18 == BPF_A else k
+        if cls == BPF_LD or cls == BPF_LDX:
+            mode = code & 0xE0
+            if mode == BPF_ABS and cls == BPF_LD:
+                if code & 0x18 != BPF_W or k % 4 or k + 4 > len(buf):
+                    raise ValueError("invalid load at offset {}".format(k))
+                value = _WORD.unpack_from(buf, k)[0]
+            elif mode == BPF_IMM:
+                value = k
+            elif mode == BPF_MEM:
+                value = mem[k]
+            elif mode == BPF_LEN:
+                value = len(buf)
+            else:
+                raise ValueError("invalid load 0x{:04x}".format(code))
+            if cls == BPF_LD:
+                a = value
+            else:
+                x = value
+        elif cls == BPF_ST:
+            mem[k] = a
+        elif cls == BPF_STX:
+            mem[k] = x
+        elif cls == BPF_ALU:
+            operand = x if code & BPF_X else k
+            op = code & 0xF0
+            if op in (BPF_DIV, BPF_MOD) and not operand:
+                # division by zero aborts the program
+                return 0
+            a = _alu(op, a, operand) & 0xFFFFFFFF
+        elif cls == BPF_JMP:
+            op = code & 0xF0
+            if op == BPF_JA:
+                pc += k
+                continue
+            operand = x if code & BPF_X else k
+            if op == BPF_JEQ:
+                cond = a == operand
+            elif op == BPF_JGT:
+                cond = a > operand
+            elif op == BPF_JGE:
+                cond = a >= operand
+            elif op == BPF_JSET:
+                cond = bool(a & operand)
+            else:
+                raise ValueError("invalid jump 0x{:04x}".format(code))
+            pc += jt if cond else jf
+        elif code & 0xF8 == BPF_TXA:
+            a = x
+        else:
+            # BPF_MISC | BPF_TAX
+            x = a
+
+
+class TsyncError(OSError):
+    """Filter could not be synchronized to all threads
+
+    The tid attribute is the Kernel thread id of the offending thread, e.g. a
+    thread that has installed a filter of its own.
+    """
+
+    def __init__(self, tid):
+        super().__init__(
+            errno.ESRCH, "unable to synchronize filter to thread {}".format(tid)
+        )
+        self.tid = tid
+
+
+def install_fprog(addr, flags=0, no_new_privs=True):
+    """Install a sock_fprog on the calling thread
+
+    addr is the address of a struct sock_fprog. Without flags the filter is
+    installed with prctl(PR_SET_SECCOMP), otherwise with seccomp().
+    """
+    if no_new_privs:
+        _libc.prctl(Prctl.PR_SET_NO_NEW_PRIVS, 1)
+    if not flags:
+        _libc.prctl(Prctl.PR_SET_SECCOMP, SeccompMode.FILTER, addr)
+        return 0
+    result = _libc.seccomp(SeccompOp.SET_MODE_FILTER, flags, addr)
+    if result > 0 and flags & SeccompFilterFlag.TSYNC:
+        # Kernel returns the thread id of the thread that failed to sync
+        raise TsyncError(result)
+    return result
@@ -0,0 +1,249 @@
+import collections
+import contextlib
+import ctypes
+import fcntl
+import mmap
+import os
+import struct
+import tempfile
+
+from ._bpf import fprog, install_fprog, sock_filter
+
+__all__ = ("BUNDLE_VERSION", "Bundle", "Variant", "locked", "write_bundle")
+
+BUNDLE_MAGIC = b"SCMPBNDL"
+BUNDLE_VERSION = 1
+
+# condition variant of a compiled policy: native architecture, effective
+# capabilities mask and Kernel release
+Variant = collections.namedtuple("Variant", "machine caps kernel")
+
+# magic, version, arch count, variant count, index offset, sha256 of policy,
+# libseccomp version
+_HEADER = struct.Struct("=8sHHII32s16s")
+_ARCH = struct.Struct("=I")
+# machine, caps, Kernel release, program offset, instruction count
+_ENTRY = struct.Struct("=16sQ64sII")
+_ALIGN = ctypes.sizeof(sock_filter)
+# sock_fprog.len is an unsigned short
+_MAX_COUNT = 0xFFFF
+
+
+def _align(offset):
+    return (offset + _ALIGN - 1) & ~(_ALIGN - 1)
+
+
+def _pack_str(value, size):
+    data = value.encode("ascii")
+    if len(data) > size:
+        raise ValueError("{!r} is longer than {} bytes".format(value, size))
+    return data
+
+
+def _unpack_str(data):
+    return data.rstrip(b"\0").decode("ascii")
+
+
+def write_bundle(filename, policy_hash, arches, programs, libseccomp=""):
+    """Write compiled BPF programs to a bundle file
+
+    policy_hash is the sha256 digest (bytes) of the policy source, arches the
+    filter architectures and programs a mapping of Variant to BPF bytes. The
+    file is replaced atomically, readers that have the old file mapped keep
+    their view.
+    """
+    if len(policy_hash) != 32:
+        raise ValueError("policy_hash must be a sha256 digest")
+    arches = tuple(arches)
+    programs = sorted(programs.items(), key=lambda item: item[0])
+    index_offset = _align(_HEADER.size + _ARCH.size * len(arches))
+    offset = _align(index_offset + _ENTRY.size * len(programs))
+    index = []
+    for variant, bpf in programs:
+        if len(bpf) % _ALIGN:
+            raise ValueError(
+                "BPF program length is not a multiple of {}".format(_ALIGN)
+            )
+        if len(bpf) // _ALIGN > _MAX_COUNT:
+            raise ValueError(
+                "BPF program has more than {} instructions".format(_MAX_COUNT)
+            )
+        index.append(
+            _ENTRY.pack(
+                _pack_str(variant.machine, 16),
+                variant.caps,
+                _pack_str(variant.kernel, 64),
+                offset,
+                len(bpf) // _ALIGN,
+            )
+        )
+        offset += len(bpf)
+
+    buf = bytearray(offset)
+    _HEADER.pack_into(
+        buf,
+        0,
+        BUNDLE_MAGIC,
+        BUNDLE_VERSION,
+        len(arches),
+        len(programs),
+        index_offset,
+        policy_hash,
+        _pack_str(libseccomp, 16),
+    )
+    for i, arch in enumerate(arches):
+        _ARCH.pack_into(buf, _HEADER.size + i * _ARCH.size, arch)
+    buf[index_offset : index_offset + len(index) * _ENTRY.size] = b"".join(index)
+    for (variant, bpf), entry in zip(programs, index):
+        start = _ENTRY.unpack(entry)[3]
+        buf[start : start + len(bpf)] = bpf
+
+    dirname = os.path.dirname(os.path.abspath(filename))
+    fd, tmp = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            # bundles are shared between processes of all users
+            os.fchmod(f.fileno(), 0o644)
+            f.write(buf)
+        os.replace(tmp, filename)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+@contextlib.contextmanager
+def locked(filename):
+    """Exclusive lock for a read-modify-write of a bundle
+
+    The lock is held on a FILENAME.lock file, because write_bundle()
+    replaces the bundle file.
+    """
+    fd = os.open(filename + ".lock", os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+class Bundle:
+    """Memory mapped bundle of compiled BPF programs
+
+    The file is mapped copy-on-write. Programs are never written to, so all
+    processes that map the same bundle share its pages in the page cache.
+    program() returns a sock_fprog that points directly into the mapping,
+    the mapping stays alive as long as a program is referenced.
+
+    With libseccomp, a bundle that was compiled with another libseccomp
+    version is rejected with ValueError.
+    """
+
+    __slots__ = (
+        "policy_hash",
+        "arches",
+        "libseccomp",
+        "_mmap",
+        "_view",
+        "_index",
+        "_programs",
+    )
+
+    def __init__(self, filename, libseccomp=None):
+        with open(filename, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        self._view = memoryview(self._mmap)
+        self._programs = {}
+        try:
+            self._parse()
+            if libseccomp is not None and self.libseccomp != libseccomp:
+                raise ValueError(
+                    "bundle was compiled with libseccomp {}".format(self.libseccomp)
+                )
+        except BaseException:
+            self.close()
+            raise
+
+    def _parse(self):
+        mm = self._mmap
+        if len(mm) < _HEADER.size:
+            raise ValueError("bundle is truncated")
+        magic, version, narches, nvariants, index_offset, digest, lsc = (
+            _HEADER.unpack_from(mm, 0)
+        )
+        if magic != BUNDLE_MAGIC:
+            raise ValueError("not a seccomp policy bundle")
+        if version != BUNDLE_VERSION:
+            raise ValueError("unsupported bundle version {}".format(version))
+        # arch list sits between header and index
+        if not _HEADER.size + narches * _ARCH.size <= index_offset <= len(mm):
+            raise ValueError("invalid index offset in bundle header")
+        if index_offset + nvariants * _ENTRY.size > len(mm):
+            raise ValueError("bundle is truncated")
+        self.policy_hash = digest
+        self.libseccomp = _unpack_str(lsc)
+        self.arches = tuple(
+            _ARCH.unpack_from(mm, _HEADER.size + i * _ARCH.size)[0]
+            for i in range(narches)
+        )
+        index = {}
+        for i in range(nvariants):
+            machine, caps, kernel, offset, count = _ENTRY.unpack_from(
+                mm, index_offset + i * _ENTRY.size
+            )
+            if (
+                offset % _ALIGN
+                or count > _MAX_COUNT
+                or offset + count * _ALIGN > len(mm)
+            ):
+                raise ValueError("invalid program offset in bundle index")
+            variant = Variant(_unpack_str(machine), caps, _unpack_str(kernel))
+            index[variant] = (offset, count)
+        self._index = index
+
+    @property
+    def variants(self):
+        return tuple(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, variant):
+        return variant in self._index
+
+    def bpf(self, variant):
+        """BPF program of a variant as bytes (copy)"""
+        offset, count = self._index[variant]
+        return self._view[offset : offset + count * _ALIGN].tobytes()
+
+    def program(self, variant):
+        """Zero-copy sock_fprog of a variant
+
+        Returns the sock_fprog and the sock_filter array, see fprog().
+        """
+        prog = self._programs.get(variant)
+        if prog is None:
+            offset, count = self._index[variant]
+            prog = fprog(self._view[offset : offset + count * _ALIGN])
+            self._programs[variant] = prog
+        return prog
+
+    def install(self, variant, flags=0, no_new_privs=True):
+        """Install the program of a variant on the calling thread"""
+        prog, filters = self.program(variant)
+        return install_fprog(ctypes.addressof(prog), flags, no_new_privs)
+
+    def close(self):
+        self._programs.clear()
+        try:
+            self._view.release()
+            self._mmap.close()
+        except BufferError:
+            # programs are still referenced, the mapping is released with
+            # the last program.
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
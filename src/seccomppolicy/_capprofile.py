@@ -0,0 +1,289 @@
+import collections
+
+from . import _libc
+from ._constants import Capabilities, PrCapAmbient, Prctl, SecureBits
+
+__all__ = (
+    "CapOp",
+    "CapProfile",
+    "CapState",
+    "DEFAULT_CAPABILITIES",
+    "EXTRA_CAPABILITIES",
+    "apply_profile",
+    "caps_to_mask",
+    "mask_to_caps",
+    "snapshot",
+)
+
+# bit mask of each capability set, securebits as integer
+CapState = collections.namedtuple(
+    "CapState", "effective permitted inheritable bounding ambient securebits"
+)
+
+# a planned capset() or prctl() call
+CapOp = collections.namedtuple("CapOp", "func args")
+
+_SETPCAP = 1 << Capabilities.CAP_SETPCAP
+
+# default capabilities of containers, extra capabilities of some runtimes
+DEFAULT_CAPABILITIES = [
+    Capabilities.CAP_CHOWN,
+    Capabilities.CAP_DAC_OVERRIDE,
+    Capabilities.CAP_FOWNER,
+    Capabilities.CAP_FSETID,
+    Capabilities.CAP_KILL,
+    Capabilities.CAP_SETGID,
+    Capabilities.CAP_SETUID,
+    Capabilities.CAP_SETPCAP,
+    Capabilities.CAP_NET_BIND_SERVICE,
+    Capabilities.CAP_SYS_CHROOT,
+    Capabilities.CAP_SETFCAP,
+]
+
+EXTRA_CAPABILITIES = [
+    Capabilities.CAP_NET_RAW,
+    Capabilities.CAP_MKNOD,
+    Capabilities.CAP_AUDIT_CONTROL,
+]
+
+# securebits flags with their lock bits
+_SECBIT_LOCKS = (
+    (SecureBits.SECBIT_NOROOT, SecureBits.SECBIT_NOROOT_LOCKED),
+    (SecureBits.SECBIT_NO_SETUID_FIXUP, SecureBits.SECBIT_NO_SETUID_FIXUP_LOCKED),
+    (SecureBits.SECBIT_KEEP_CAPS, SecureBits.SECBIT_KEEP_CAPS_LOCKED),
+    (
+        SecureBits.SECBIT_NO_CAP_AMBIENT_RAISE,
+        SecureBits.SECBIT_NO_CAP_AMBIENT_RAISE_LOCKED,
+    ),
+)
+
+
+def caps_to_mask(caps):
+    """Convert an iterable of capabilities to a bit mask"""
+    mask = 0
+    for cap in caps:
+        mask |= 1 << cap
+    return mask
+
+
+def mask_to_caps(mask):
+    """Convert a bit mask to a list of capabilities"""
+    caps = []
+    bit = 0
+    while mask >> bit:
+        if mask & (1 << bit):
+            try:
+                caps.append(Capabilities(bit))
+            except ValueError:
+                # capability unknown to this module
+                caps.append(bit)
+        bit += 1
+    return caps
+
+
+def _bits(mask):
+    bit = 0
+    while mask >> bit:
+        if mask & (1 << bit):
+            yield bit
+        bit += 1
+
+
+def _read_status():
+    for filename in ("/proc/thread-self/status", "/proc/self/status"):
+        try:
+            with open(filename, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            continue
+    raise FileNotFoundError("/proc/self/status")
+
+
+def snapshot():
+    """Capability state of the calling thread
+
+    One capget() call for effective, permitted and inheritable set, one read
+    of /proc/thread-self/status for bounding and ambient set, and one prctl()
+    for securebits.
+    """
+    effective, permitted, inheritable = _libc.capget()
+    bounding = ambient = 0
+    for line in _read_status().splitlines():
+        if line.startswith(b"CapBnd:"):
+            bounding = int(line[7:], 16)
+        elif line.startswith(b"CapAmb:"):
+            ambient = int(line[7:], 16)
+    securebits = _libc.prctl(Prctl.PR_GET_SECUREBITS)
+    return CapState(effective, permitted, inheritable, bounding, ambient, securebits)
+
+
+class CapProfile(
+    collections.namedtuple(
+        "CapProfile",
+        "effective permitted inheritable bounding ambient securebits keepcaps",
+    )
+):
+    """Capability profile for a thread
+
+    Capability sets are bit masks, None keeps the current value. keepcaps
+    (True/False/None) toggles SECBIT_KEEP_CAPS on top of securebits.
+    """
+
+    __slots__ = ()
+
+    def __new__(
+        cls,
+        effective=None,
+        permitted=None,
+        inheritable=None,
+        bounding=None,
+        ambient=None,
+        securebits=None,
+        keepcaps=None,
+    ):
+        return super().__new__(
+            cls,
+            effective,
+            permitted,
+            inheritable,
+            bounding,
+            ambient,
+            securebits,
+            keepcaps,
+        )
+
+    @classmethod
+    def from_caps(cls, caps, inheritable=False, ambient=False, **kwargs):
+        """Profile that limits all sets to caps
+
+        Effective, permitted and bounding set are limited to caps,
+        inheritable and ambient set are cleared unless requested.
+        """
+        mask = caps_to_mask(caps)
+        fields = dict(
+            effective=mask,
+            permitted=mask,
+            inheritable=mask if inheritable or ambient else 0,
+            bounding=mask,
+            ambient=mask if ambient else 0,
+        )
+        fields.update(kwargs)
+        return cls(**fields)
+
+    def target(self, state):
+        """Resolve unset fields against a CapState"""
+        values = [
+            state[i] if value is None else value for i, value in enumerate(self[:6])
+        ]
+        securebits = values[5]
+        if self.keepcaps is not None:
+            if self.keepcaps:
+                securebits |= SecureBits.SECBIT_KEEP_CAPS
+            else:
+                securebits &= ~SecureBits.SECBIT_KEEP_CAPS
+        values[5] = int(securebits)
+        return CapState(*values)
+
+    def plan(self, state):
+        """Minimal list of CapOp to get from state to this profile
+
+        Validates the whole transition first, so a profile that cannot be
+        applied raises before any change is made.
+        """
+        new = self.target(state)
+        _validate(state, new)
+        ops = []
+        # securebits and bounding set need CAP_SETPCAP, before capset()
+        changed = new.securebits ^ state.securebits
+        if changed == SecureBits.SECBIT_KEEP_CAPS:
+            # PR_SET_KEEPCAPS works without CAP_SETPCAP
+            keepcaps = 1 if new.securebits & SecureBits.SECBIT_KEEP_CAPS else 0
+            ops.append(CapOp("prctl", (Prctl.PR_SET_KEEPCAPS, keepcaps)))
+        elif changed:
+            ops.append(CapOp("prctl", (Prctl.PR_SET_SECUREBITS, new.securebits)))
+        for cap in _bits(state.bounding & ~new.bounding):
+            ops.append(CapOp("prctl", (Prctl.PR_CAPBSET_DROP, cap)))
+        # capset() removes caps from ambient set that leave P or I
+        ambient = state.ambient & new.permitted & new.inheritable
+        lower = ambient & ~new.ambient
+        if lower:
+            if not new.ambient:
+                ops.append(
+                    CapOp(
+                        "prctl",
+                        (Prctl.PR_CAP_AMBIENT, PrCapAmbient.PR_CAP_AMBIENT_CLEAR_ALL),
+                    )
+                )
+            else:
+                for cap in _bits(lower):
+                    ops.append(
+                        CapOp(
+                            "prctl",
+                            (
+                                Prctl.PR_CAP_AMBIENT,
+                                PrCapAmbient.PR_CAP_AMBIENT_LOWER,
+                                cap,
+                            ),
+                        )
+                    )
+        if new[:3] != state[:3]:
+            ops.append(CapOp("capset", new[:3]))
+        # raise requires cap in P and I
+        for cap in _bits(new.ambient & ~state.ambient):
+            ops.append(
+                CapOp(
+                    "prctl",
+                    (Prctl.PR_CAP_AMBIENT, PrCapAmbient.PR_CAP_AMBIENT_RAISE, cap),
+                )
+            )
+        return ops
+
+
+def _validate(old, new):
+    setpcap = old.effective & _SETPCAP
+    if new.bounding & ~old.bounding:
+        raise ValueError(
+            "cannot add to bounding set: {}".format(
+                mask_to_caps(new.bounding & ~old.bounding)
+            )
+        )
+    securebits = (new.securebits ^ old.securebits) & ~SecureBits.SECBIT_KEEP_CAPS
+    if (new.bounding != old.bounding or securebits) and not setpcap:
+        raise PermissionError("changing bounding set or securebits needs CAP_SETPCAP")
+    if new.permitted & ~old.permitted:
+        raise ValueError(
+            "cannot add to permitted set: {}".format(
+                mask_to_caps(new.permitted & ~old.permitted)
+            )
+        )
+    if new.effective & ~new.permitted:
+        raise ValueError("effective set must be a subset of permitted set")
+    allowed = old.inheritable | (old.permitted if not setpcap else ~0)
+    if new.inheritable & ~(allowed & (old.inheritable | new.bounding)):
+        raise ValueError("inheritable set exceeds permitted or bounding set")
+    if new.ambient & ~(new.permitted & new.inheritable):
+        raise ValueError("ambient set must be a subset of permitted and inheritable")
+    if new.ambient & ~old.ambient and (
+        new.securebits & SecureBits.SECBIT_NO_CAP_AMBIENT_RAISE
+    ):
+        raise PermissionError("SECBIT_NO_CAP_AMBIENT_RAISE is set")
+    for bit, lock in _SECBIT_LOCKS:
+        if old.securebits & lock and (old.securebits ^ new.securebits) & (bit | lock):
+            raise PermissionError("securebit {} is locked".format(SecureBits(bit)))
+
+
+def apply_profile(profile, state=None):
+    """Apply a CapProfile to the calling thread
+
+    Takes one snapshot (unless state is given), computes the minimal set of
+    calls and skips no-op changes. Returns the list of executed CapOp.
+    """
+    if state is None:
+        state = snapshot()
+    ops = profile.plan(state)
+    for op in ops:
+        if op.func == "capset":
+            _libc.capset(*op.args)
+        else:
+            _libc.prctl(*op.args)
+    return ops
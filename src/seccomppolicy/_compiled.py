@@ -0,0 +1,196 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import ctypes
+import hashlib
+import struct
+import threading
+
+from . import _peephole
+from ._bpf import fprog, install_fprog
+from ._installer import FilterInstaller
+from ._pool import PreparedRules
+from ._seccomp import NATIVE_ARCH, Seccomp
+
+__all__ = ("CompiledPolicy", "PolicyBuilder", "build")
+
+
+class CompiledPolicy:
+    """Immutable result of a policy build
+
+    Holds the BPF program, filter architectures, SECCOMP_FILTER_FLAG_* flags
+    and a sha256 digest of program and architectures. Instances are
+    hashable, can be shared between threads and installed from any thread.
+    The PFC text is generated on first access by building the policy again,
+    it is not needed to install the program.
+    """
+
+    __slots__ = (
+        "_bpf",
+        "_arches",
+        "_flags",
+        "_digest",
+        "_source",
+        "_pfc",
+        "_lock",
+        "_prog",
+        "_filters",
+        "_addr",
+    )
+
+    def __init__(self, bpf, arches=(NATIVE_ARCH,), flags=0, source=None):
+        set_ = object.__setattr__
+        bpf = bytes(bpf)
+        arches = tuple(arches)
+        h = hashlib.sha256(bpf)
+        h.update(struct.pack("={}I".format(len(arches)), *arches))
+        set_(self, "_bpf", bpf)
+        set_(self, "_arches", arches)
+        set_(self, "_flags", int(flags))
+        set_(self, "_digest", h.hexdigest())
+        # (policy, arches, spec_allow) to build the PFC text
+        set_(self, "_source", source)
+        set_(self, "_pfc", None)
+        set_(self, "_lock", threading.Lock())
+        # pinned sock_fprog, the Kernel only reads from it
+        prog, filters = fprog(bpf)
+        set_(self, "_prog", prog)
+        set_(self, "_filters", filters)
+        set_(self, "_addr", ctypes.addressof(prog))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("{} is immutable".format(self.__class__.__name__))
+
+    def __delattr__(self, name):
+        raise AttributeError("{} is immutable".format(self.__class__.__name__))
+
+    @property
+    def bpf(self):
+        """BPF program as bytes"""
+        return self._bpf
+
+    @property
+    def arches(self):
+        return self._arches
+
+    @property
+    def flags(self):
+        return self._flags
+
+    @property
+    def digest(self):
+        """sha256 hex digest of BPF program and architectures"""
+        return self._digest
+
+    @property
+    def pfc(self):
+        """Pseudo filter code, built on first access"""
+        pfc = self._pfc
+        if pfc is None:
+            with self._lock:
+                pfc = self._pfc
+                if pfc is None:
+                    if self._source is None:
+                        raise ValueError("policy source is not available")
+                    policy, arches, spec_allow = self._source
+                    with _seccomp(policy, arches, spec_allow) as sc:
+                        pfc = sc.export_pfc()
+                    object.__setattr__(self, "_pfc", pfc)
+        return pfc
+
+    def __len__(self):
+        """Number of BPF instructions"""
+        return self._prog.len
+
+    def __eq__(self, other):
+        if not isinstance(other, CompiledPolicy):
+            return NotImplemented
+        return (
+            self._digest == other._digest
+            and self._flags == other._flags
+            and self._bpf == other._bpf
+        )
+
+    def __hash__(self):
+        return hash((self._digest, self._flags))
+
+    def install(self, no_new_privs=True):
+        """Install the program on the calling thread"""
+        return install_fprog(self._addr, self._flags, no_new_privs)
+
+    def installer(self, no_new_privs=True):
+        """FilterInstaller for forked children and process pools"""
+        return FilterInstaller(self._bpf, self._flags, no_new_privs)
+
+    def __reduce__(self):
+        return (self.__class__, (self._bpf, self._arches, self._flags))
+
+    def __repr__(self):
+        return "<{self.__class__.__name__} {n} instructions, {digest}>".format(
+            self=self, n=len(self), digest=self._digest[:16]
+        )
+
+
+@contextlib.contextmanager
+def _seccomp(policy, arches, spec_allow):
+    with Seccomp(policy.default_action, spec_allow=spec_allow) as sc:
+        PreparedRules.from_policy(policy, arches).apply(sc)
+        yield sc
+
+
+def build(policy, arches=(), spec_allow=False, optimize=False):
+    """Build a Policy for the native and extra architectures
+
+    Every call uses a private Seccomp context, so builds can run in
+    parallel threads. ctypes releases the GIL while libseccomp generates
+    the program. With optimize the exported program is rewritten by the
+    peephole optimizer, the PFC text still shows the libseccomp program.
+    Rules with the default action are dropped, like IncrementalCompiler
+    does.
+    """
+    arches = tuple(arches)
+    with _seccomp(policy, arches, spec_allow) as sc:
+        sc.precompute()
+        bpf = sc.export_bpf()
+        flags = sc.filter_flags()
+    if optimize:
+        bpf = _peephole.optimize(bpf, NATIVE_ARCH)
+    return CompiledPolicy(
+        bpf, (NATIVE_ARCH,) + arches, flags, source=(policy, arches, spec_allow)
+    )
+
+
+class PolicyBuilder:
+    """Build policies in a thread pool
+
+    submit() returns a concurrent.futures.Future, build_async() an asyncio
+    future that can be awaited on the event loop::
+
+        builder = PolicyBuilder()
+        compiled = await builder.build_async(policy)
+    """
+
+    __slots__ = ("_executor",)
+
+    def __init__(self, max_workers=None):
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+
+    def submit(self, policy, arches=(), spec_allow=False):
+        return self._executor.submit(build, policy, arches, spec_allow)
+
+    def build_async(self, policy, arches=(), spec_allow=False, loop=None):
+        return asyncio.wrap_future(self.submit(policy, arches, spec_allow), loop=loop)
+
+    def map(self, policies, arches=(), spec_allow=False):
+        """Build many policies in parallel, yields CompiledPolicy in order"""
+        futures = [self.submit(policy, arches, spec_allow) for policy in policies]
+        return (future.result() for future in futures)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
@@ -0,0 +1,381 @@
+"""Policy compile server
+
+A long-running service on a Unix stream socket that compiles profiles and
+hands out the BPF programs as sealed memfds. Every request is a single line
+of JSON:
+
+    {"profile": "/etc/containers/seccomp.json", "arches": [...], "caps": [...]}
+    {"policy": {...seccomp.json object...}, "caps": ["CAP_SYS_ADMIN"]}
+    {"stats": true}
+
+"profile" is the absolute path of a file in one of the profile directories
+of the server or "default". "arches" are additional
+filter architectures (default: subArchitectures of the profile), "caps" the
+effective capabilities that are used to evaluate capability conditions
+(default: none). The response is a line of JSON with an attached memfd
+(SCM_RIGHTS) that contains the BPF program. Error responses are generic,
+details are logged by the server.
+"""
+
+import array
+import collections
+import ctypes
+import fcntl
+import hashlib
+import json
+import logging
+import mmap
+import os
+import socket
+import socketserver
+import threading
+
+from ._bpf import fprog, install_fprog
+from ._constants import (
+    F_ADD_SEALS,
+    Capabilities,
+    FileSeal,
+    MemfdFlag,
+    ScmpArch,
+    translate_scmp,
+)
+from ._libc import memfd_create
+
+__all__ = (
+    "CompileServer",
+    "CompileStats",
+    "ServerError",
+    "compile_profile",
+    "install_fd",
+    "request",
+    "sealed_memfd",
+)
+
+log = logging.getLogger(__name__)
+
+DEFAULT_PROFILE = "default"
+
+# upper limit of a request line, inline policies are about 20 KiB
+MAX_REQUEST = 1024 * 1024
+
+_SEALS = (
+    FileSeal.F_SEAL_SEAL
+    | FileSeal.F_SEAL_SHRINK
+    | FileSeal.F_SEAL_GROW
+    | FileSeal.F_SEAL_WRITE
+)
+
+CompileStats = collections.namedtuple(
+    "CompileStats", "hits misses errors rejected compiling currsize"
+)
+
+
+class ServerError(Exception):
+    """Compile server returned an error response"""
+
+
+def sealed_memfd(data, name="seccomppolicy"):
+    """Copy data into a memfd and seal it against any modification
+
+    All duplicates share the file offset, readers should use mmap() or
+    pread().
+    """
+    fd = memfd_create(name, MemfdFlag.MFD_CLOEXEC | MemfdFlag.MFD_ALLOW_SEALING)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view) :]
+        fcntl.fcntl(fd, F_ADD_SEALS, _SEALS)
+    except BaseException:
+        os.close(fd)
+        raise
+    return fd
+
+
+def _load_source(source):
+    """Parse profile source, return policy syscalls, default action, archmap"""
+    if source is None:
+        from . import _defaultpolicy
+
+        return (
+            _defaultpolicy.DEFAULT_ACTION,
+            _defaultpolicy.SYSCALLS,
+            _defaultpolicy.SUB_ARCHITECTURES,
+        )
+    from ._containerpolicy import loads
+
+    config = loads(source)
+    return config["default_action"], config["syscalls"], config["archmap"]
+
+
+def compile_profile(source, arches=None, caps=()):
+    """Compile a profile for the native architecture
+
+    source is the content of a seccomp.json file or None for the default
+    policy. arches are additional filter architectures, None uses the
+    subArchitectures of the profile. Capability conditions are evaluated
+    against caps. Returns the BPF program.
+    """
+    from ._containerpolicy import flatten
+    from ._pool import PreparedRules
+    from ._seccomp import NATIVE_ARCH, Seccomp
+
+    default_action, syscalls, archmap = _load_source(source)
+    if arches is None:
+        arches = archmap.get(NATIVE_ARCH, ())
+    arches = [arch for arch in arches if arch != NATIVE_ARCH]
+    policy = flatten(default_action, syscalls, caps)
+    with Seccomp(policy.default_action) as sc:
+        PreparedRules.from_policy(policy, arches).apply(sc)
+        return sc.export_bpf()
+
+
+def _enum_list(values, cls):
+    if values is None:
+        return None
+    if not isinstance(values, list):
+        raise ValueError("expected a list of names")
+    result = []
+    for value in values:
+        member = translate_scmp(value)
+        if not isinstance(member, cls):
+            raise ValueError("{!r} is not a {}".format(value, cls.__name__))
+        result.append(member)
+    return result
+
+
+def _read_profile(profile, profile_dirs):
+    """Read a profile file that is located in one of profile_dirs"""
+    if not isinstance(profile, str) or not os.path.isabs(profile):
+        raise ValueError("profile must be an absolute path")
+    path = os.path.realpath(profile)
+    for directory in profile_dirs:
+        if os.path.commonpath([directory, path]) == directory:
+            with open(path, "rb") as f:
+                return f.read()
+    raise PermissionError("{} is not in a profile directory".format(path))
+
+
+def _parse_request(req, profile_dirs=()):
+    """Parse a request object, returns (cache key, source, arches, caps)
+
+    Profile files must be located in one of profile_dirs, a list of real
+    paths.
+    """
+    profile = req.get("profile")
+    policy = req.get("policy")
+    if (profile is None) == (policy is None):
+        raise ValueError("request needs either 'profile' or 'policy'")
+    if policy is not None:
+        source = json.dumps(policy, sort_keys=True).encode("utf-8")
+    elif profile == DEFAULT_PROFILE:
+        source = None
+    else:
+        source = _read_profile(profile, profile_dirs)
+    arches = _enum_list(req.get("arches"), ScmpArch)
+    caps = frozenset(_enum_list(req.get("caps"), Capabilities) or ())
+    digest = hashlib.sha256(source if source is not None else b"default")
+    key = (
+        digest.digest(),
+        None if arches is None else tuple(sorted(set(arches))),
+        tuple(sorted(caps)),
+    )
+    return key, source, arches, caps
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        if not server._clients.acquire(blocking=False):
+            server._count("rejected")
+            self._reply({"status": "error", "error": "server busy"})
+            return
+        try:
+            line = self.rfile.readline(MAX_REQUEST + 1)
+            if len(line) > MAX_REQUEST:
+                self._reply({"status": "error", "error": "request too large"})
+                return
+            try:
+                req = json.loads(line.decode("utf-8"))
+                if not isinstance(req, dict):
+                    raise ValueError("request must be a JSON object")
+                if req.get("stats"):
+                    self._reply(dict(status="ok", **server.stats()._asdict()))
+                    return
+                fd, cached = server.program(req)
+            except OSError as e:
+                # do not reveal which files exist on the server
+                log.info("profile not available: %s", e)
+                server._count("errors")
+                self._reply({"status": "error", "error": "profile not available"})
+                return
+            except (ValueError, KeyError, TypeError) as e:
+                log.info("invalid request: %s", e)
+                server._count("errors")
+                self._reply({"status": "error", "error": "invalid request"})
+                return
+            try:
+                self._reply(
+                    {"status": "ok", "cached": cached, "size": os.fstat(fd).st_size},
+                    fd,
+                )
+            finally:
+                os.close(fd)
+        finally:
+            server._clients.release()
+
+    def _reply(self, response, fd=None):
+        data = json.dumps(response).encode("utf-8") + b"\n"
+        if fd is None:
+            self.request.sendall(data)
+        else:
+            fds = array.array("i", [fd])
+            self.request.sendmsg([data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds)])
+
+
+class CompileServer(socketserver.ThreadingUnixStreamServer):
+    """Compile server with a bounded LRU of sealed programs
+
+    At most max_clients connections are served at the same time, further
+    clients get a "server busy" error. At most max_compiles profiles are
+    compiled concurrently. Concurrent requests for the same profile wait
+    for a single compilation. Clients can only request profile files in
+    profile_dirs.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self, path, maxsize=64, max_clients=64, max_compiles=None, profile_dirs=()
+    ):
+        if maxsize < 1:
+            raise ValueError("maxsize must be positive")
+        if max_compiles is None:
+            max_compiles = os.cpu_count() or 1
+        self._maxsize = maxsize
+        self._profile_dirs = tuple(os.path.realpath(d) for d in profile_dirs)
+        self._clients = threading.BoundedSemaphore(max_clients)
+        self._compiles = threading.BoundedSemaphore(max_compiles)
+        self._lock = threading.Lock()
+        # cache key -> sealed memfd, in LRU order
+        self._cache = collections.OrderedDict()
+        # cache key -> Event of a running compilation
+        self._pending = {}
+        self._stats = dict.fromkeys(["hits", "misses", "errors", "rejected"], 0)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        super().__init__(path, _Handler)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _lookup(self, key):
+        # caller holds the lock, returns a duplicate the caller has to close
+        fd = self._cache.get(key)
+        if fd is None:
+            return None
+        self._cache.move_to_end(key)
+        return os.dup(fd)
+
+    def program(self, req):
+        """Sealed memfd of a request object, returns (fd, cached)
+
+        The caller owns and has to close the file descriptor.
+        """
+        key, source, arches, caps = _parse_request(req, self._profile_dirs)
+        while True:
+            with self._lock:
+                fd = self._lookup(key)
+                if fd is not None:
+                    self._stats["hits"] += 1
+                    return fd, True
+                event = self._pending.get(key)
+                if event is None:
+                    self._stats["misses"] += 1
+                    event = self._pending[key] = threading.Event()
+                    break
+            # another thread compiles the same profile
+            event.wait()
+        try:
+            with self._compiles:
+                fd = sealed_memfd(compile_profile(source, arches, caps))
+            with self._lock:
+                self._cache[key] = fd
+                while len(self._cache) > self._maxsize:
+                    os.close(self._cache.popitem(last=False)[1])
+                return os.dup(fd), False
+        finally:
+            with self._lock:
+                del self._pending[key]
+            event.set()
+
+    def stats(self):
+        with self._lock:
+            return CompileStats(
+                currsize=len(self._cache), compiling=len(self._pending), **self._stats
+            )
+
+    def server_close(self):
+        super().server_close()
+        with self._lock:
+            while self._cache:
+                os.close(self._cache.popitem()[1])
+
+
+def _recv_response(sock):
+    fds = array.array("i")
+    data, ancdata, flags, addr = sock.recvmsg(65536, socket.CMSG_SPACE(fds.itemsize))
+    for level, kind, cdata in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(cdata[: len(cdata) - (len(cdata) % fds.itemsize)])
+    while data and not data.endswith(b"\n"):
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        data += chunk
+    fd = fds.pop(0) if fds else None
+    for extra in fds:
+        os.close(extra)
+    response = json.loads(data.decode("utf-8"))
+    if response.get("status") != "ok":
+        if fd is not None:
+            os.close(fd)
+        raise ServerError(response.get("error", "invalid response"))
+    return response, fd
+
+
+def request(path, profile=None, policy=None, arches=None, caps=None, stats=False):
+    """Request a compiled program from a compile server
+
+    Returns the response and a sealed memfd with the BPF program. The
+    caller owns the file descriptor. With stats=True, returns the server
+    statistics as response and None.
+    """
+    if stats:
+        req = {"stats": True}
+    else:
+        req = {"profile": profile} if policy is None else {"policy": policy}
+        if arches is not None:
+            req["arches"] = [ScmpArch(arch).name for arch in arches]
+        if caps is not None:
+            req["caps"] = [Capabilities(cap).name for cap in caps]
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(json.dumps(req, sort_keys=True).encode("utf-8") + b"\n")
+        return _recv_response(sock)
+
+
+def install_fd(fd, flags=0, no_new_privs=True):
+    """Install the BPF program of a (sealed) memfd on the calling thread
+
+    The program is mapped private and passed to the Kernel without a copy.
+    """
+    with mmap.mmap(fd, 0, access=mmap.ACCESS_COPY) as mm:
+        prog, filters = fprog(mm)
+        try:
+            return install_fprog(ctypes.addressof(prog), flags, no_new_privs)
+        finally:
+            del prog, filters
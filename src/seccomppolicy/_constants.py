@@ -5,11 +5,23 @@ __all__ = (
     "Capabilities",
     "CapFlag",
     "CapMode",
+    "FileSeal",
+    "InotifyFlag",
+    "InotifyMask",
+    "MemfdFlag",
+    "PrCapAmbient",
+    "Prctl",
     "ScmpAction",
     "ScmpArch",
     "ScmpCmp",
     "ScmpEnum",
+    "ScmpFilterAttr",
     "ScmpNr",
+    "SecureBits",
+    "SeccompFilterFlag",
+    "SeccompMode",
+    "SeccompOp",
+    "action_precedence",
     "translate_scmp",
 )
 
@@ -35,15 +47,19 @@ class ScmpAction(ScmpEnum):
 
     @classmethod
     def errno(cls, x=0):
-        x = cls._scmp_act_errno(x)
+        x = _scmp_act_errno(x)
         try:
             return cls(x)
         except ValueError:
             return x
 
     @classmethod
-    def trace(cls, x):
-        return cls._scmp_act_trace(x)
+    def trace(cls, x=0):
+        x = _scmp_act_trace(x)
+        try:
+            return cls(x)
+        except ValueError:
+            return x
 
     SCMP_ACT_KILL_PROCESS = 0x80000000
     SCMP_ACT_KILL_THREAD = 0x00000000
@@ -201,6 +217,20 @@ class ScmpCmp(ScmpEnum):
     SCMP_CMP_MASKED_EQ = 7
 
 
+class ScmpFilterAttr(ScmpEnum):
+    """SCMP_FLTATR filter attributes"""
+
+    SCMP_FLTATR_ACT_DEFAULT = 1
+    SCMP_FLTATR_ACT_BADARCH = 2
+    SCMP_FLTATR_CTL_NNP = 3
+    SCMP_FLTATR_CTL_TSYNC = 4
+    SCMP_FLTATR_API_TSKIP = 5
+    SCMP_FLTATR_CTL_LOG = 6
+    SCMP_FLTATR_CTL_SSB = 7
+    SCMP_FLTATR_CTL_OPTIMIZE = 8
+    SCMP_FLTATR_API_SYSRAWRC = 9
+
+
 class ScmpNr(ScmpEnum):
     """NR_SCMP / pseudo syscalls"""
 
@@ -389,22 +419,153 @@ class Prctl(enum.IntEnum):
     PR_GET_KEEPCAPS = 7
     PR_SET_KEEPCAPS = 8
 
+    # seccomp mode, see SeccompMode
+    PR_GET_SECCOMP = 21
+    PR_SET_SECCOMP = 22
+
+    # capability bounding set
+    PR_CAPBSET_READ = 23
+    PR_CAPBSET_DROP = 24
+
+    # see SecureBits
+    PR_GET_SECUREBITS = 27
+    PR_SET_SECUREBITS = 28
+
     # grant new privs druing execve()
     PR_SET_NO_NEW_PRIVS = 38
     PR_GET_NO_NEW_PRIVS = 39
 
+    # ambient capabilities, see PrCapAmbient
+    PR_CAP_AMBIENT = 47
+
+
+class PrCapAmbient(enum.IntEnum):
+    """linux/prctl.h arg2 for PR_CAP_AMBIENT"""
+
+    PR_CAP_AMBIENT_IS_SET = 1
+    PR_CAP_AMBIENT_RAISE = 2
+    PR_CAP_AMBIENT_LOWER = 3
+    PR_CAP_AMBIENT_CLEAR_ALL = 4
+
+
+class SecureBits(enum.IntEnum):
+    """linux/securebits.h, each flag is followed by its lock bit"""
+
+    SECBIT_NOROOT = 1 << 0
+    SECBIT_NOROOT_LOCKED = 1 << 1
+    SECBIT_NO_SETUID_FIXUP = 1 << 2
+    SECBIT_NO_SETUID_FIXUP_LOCKED = 1 << 3
+    SECBIT_KEEP_CAPS = 1 << 4
+    SECBIT_KEEP_CAPS_LOCKED = 1 << 5
+    SECBIT_NO_CAP_AMBIENT_RAISE = 1 << 6
+    SECBIT_NO_CAP_AMBIENT_RAISE_LOCKED = 1 << 7
+
+
+class SeccompMode(enum.IntEnum):
+    """linux/seccomp.h SECCOMP_MODE_*"""
+
+    DISABLED = 0
+    STRICT = 1
+    FILTER = 2
+
+
+class SeccompOp(enum.IntEnum):
+    """linux/seccomp.h operations for seccomp() syscall"""
+
+    SET_MODE_STRICT = 0
+    SET_MODE_FILTER = 1
+    GET_ACTION_AVAIL = 2
+    GET_NOTIF_SIZES = 3
+
+
+class SeccompFilterFlag(enum.IntEnum):
+    """linux/seccomp.h SECCOMP_FILTER_FLAG_* for SET_MODE_FILTER"""
+
+    TSYNC = 1 << 0
+    LOG = 1 << 1
+    SPEC_ALLOW = 1 << 2
+    NEW_LISTENER = 1 << 3
+    TSYNC_ESRCH = 1 << 4
+    WAIT_KILLABLE_RECV = 1 << 5
+
+
+class MemfdFlag(enum.IntEnum):
+    """linux/memfd.h MFD_* flags for memfd_create()"""
+
+    MFD_CLOEXEC = 0x0001
+    MFD_ALLOW_SEALING = 0x0002
+
+
+class FileSeal(enum.IntEnum):
+    """linux/fcntl.h F_SEAL_* for fcntl(F_ADD_SEALS)"""
+
+    F_SEAL_SEAL = 0x0001
+    F_SEAL_SHRINK = 0x0002
+    F_SEAL_GROW = 0x0004
+    F_SEAL_WRITE = 0x0008
+
+
+class InotifyFlag(enum.IntEnum):
+    """linux/inotify.h IN_* flags for inotify_init1()"""
+
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+
+class InotifyMask(enum.IntEnum):
+    """linux/inotify.h IN_* event masks"""
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+
+
+# fcntl(2) commands for file seals, linux/fcntl.h
+F_ADD_SEALS = 1024 + 9
+F_GET_SEALS = 1024 + 10
+
+# SECCOMP_RET_ACTION_FULL / SECCOMP_RET_DATA
+SECCOMP_RET_ACTION_FULL = 0xFFFF0000
+SECCOMP_RET_DATA = 0x0000FFFF
+
+
+def action_precedence(action):
+    """Sort key for actions, most restrictive action first
+
+    The Kernel compares the action part of return values as signed 32bit
+    integers, lowest value wins (KILL_PROCESS, KILL_THREAD, TRAP, ERRNO,
+    USER_NOTIF, TRACE, LOG, ALLOW).
+    """
+    action = int(action)
+    return ((action & SECCOMP_RET_ACTION_FULL) ^ 0x80000000, action & SECCOMP_RET_DATA)
+
+
+def _scmp_names():
+    names = {}
+    for cls in (ScmpAction, ScmpCmp, ScmpArch, Capabilities):
+        # __members__ includes aliases
+        names.update(cls.__members__)
+    names.update(ARCHES_MAP)
+    return names
+
+
+# seccomp.json string -> enum member
+SCMP_NAMES = _scmp_names()
+
 
 def translate_scmp(s):
     """Translate a string to enum member"""
-    if s.startswith("SCMP_ACT_"):
-        return getattr(ScmpAction, s)
-    elif s.startswith("SCMP_CMP_"):
-        return getattr(ScmpCmp, s)
-    elif s.startswith("SCMP_ARCH_"):
-        return getattr(ScmpArch, s)
-    elif s.startswith("CAP_"):
-        return getattr(Capabilities, s)
-    elif s in ARCHES_MAP:
-        return ARCHES_MAP[s]
-    else:
-        raise ValueError(s)
+    try:
+        return SCMP_NAMES[s]
+    except KeyError:
+        raise ValueError(s) from None
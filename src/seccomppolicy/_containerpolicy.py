@@ -1,77 +1,221 @@
+import abc
+import collections
 import json
-import os
 
 from packaging.version import parse as parse_version
 
-from ._constants import translate_scmp
+from ._constants import SCMP_NAMES, ScmpCmp, translate_scmp
+from . import _features
 from . import _seccomp
 from . import _libcap
 
+# a single seccomp rule and a flat list of rules with default action
+Rule = collections.namedtuple("Rule", "action syscall args")
+Policy = collections.namedtuple("Policy", "default_action rules")
+
+
+def _kernel_version(release):
+    return parse_version(release.split("-", 1)[0])
+
 
 # TODO clean up and simplify code
-class _Condition:
-    _current_kernel = parse_version(os.uname().release.split("-", 1)[0])
+class _Condition(abc.ABC):
     _native_arch = _seccomp.NATIVE_ARCH
 
-    def __init__(self, *, arches=None, caps=None, minKernel=None):
+    def __init__(self, *, arches=None, caps=None, minKernel=None, effective=None):
         if arches:
             self.arches = frozenset(arches)
         else:
             self.arches = None
         self.caps = caps
+        # capabilities of the target process, None for the current process
+        self.effective = effective
         if minKernel:
-            self.min_kernel = parse_version(self.min_kernel)
+            self.min_kernel = parse_version(minKernel)
         else:
             self.min_kernel = None
 
-    def _check_arches(self):
+    @property
+    def _current_kernel(self):
+        return _kernel_version(_features.kernel_release())
+
+    def _check_arches(self, arch=None):
         if not self.arches:
             # no arches: applies to all arches
             return None
         else:
-            return self._native_arch in self.arches
+            return (arch or self._native_arch) in self.arches
 
-    def _check_caps(self):
+    def _check_caps(self, effective=None):
         if not self.caps:
             # no capability restriction
             return None
+        if effective is None:
+            effective = self.effective
+        if effective is not None:
+            return any(cap in effective for cap in self.caps)
         return any(_libcap.has_cap(cap) for cap in self.caps)
 
-    def _check_kernel(self):
+    def _check_kernel(self, kernel=None):
         if not self.min_kernel:
             # no Kernel version restriction
             return None
         else:
             # current Kernel version must be equal or greater than min version
-            return self._current_kernel >= self.min_kernel
+            return (kernel or self._current_kernel) >= self.min_kernel
 
+    @abc.abstractmethod
+    def check(self, arch=None, effective=None, kernel=None):
+        """Evaluate the condition for a host
+
+        arch, effective capabilities and parsed Kernel version default to
+        the current process.
+        """
 
-class IncludeCondition(_Condition):
     def __bool__(self):
-        if self._check_arches() is False:
+        return self.check()
+
+
+class IncludeCondition(_Condition):
+    """Ruleset applies when all restrictions are met"""
+
+    def check(self, arch=None, effective=None, kernel=None):
+        if self._check_arches(arch) is False:
             return False
-        if self._check_caps() is False:
+        if self._check_caps(effective) is False:
             return False
-        if self._check_kernel() is False:
+        if self._check_kernel(kernel) is False:
             return False
         return True
 
 
 class ExcludeCondition(_Condition):
-    def __bool__(self):
-        if self._check_arches() is False:
+    """Ruleset is skipped when any restriction is met"""
+
+    def check(self, arch=None, effective=None, kernel=None):
+        if self._check_arches(arch):
             return True
-        if self._check_caps() is False:
+        if self._check_caps(effective):
             return True
-        if self._check_kernel() is False:
+        if self._check_kernel(kernel):
             return True
         return False
 
 
+def flatten(default_action, syscalls, caps=None):
+    """Flatten rulesets into a Policy
+
+    Evaluates includes and excludes of each ruleset and returns a Policy with
+    one Rule per syscall name. Capability conditions are evaluated against
+    caps, a collection of Capabilities, or the current process.
+    """
+    if caps is not None:
+        caps = frozenset(caps)
+    rules = []
+    for ruleset in syscalls:
+        includes = ruleset.get("includes")
+        if includes and not IncludeCondition(effective=caps, **includes):
+            continue
+        excludes = ruleset.get("excludes")
+        if excludes and ExcludeCondition(effective=caps, **excludes):
+            continue
+        action = ruleset["action"]
+        args = tuple(ruleset.get("args") or ())
+        for syscall in ruleset["names"]:
+            rules.append(Rule(action, syscall, args))
+    return Policy(default_action, tuple(rules))
+
+
 def load_file(fname):
-    with open(fname) as f:
-        root = json.load(f)
-    return _parse(root)
+    with open(fname, "rb") as f:
+        return loads(f.read())
+
+
+# keys of seccomp.json objects with enum names as value
+_ENUM_KEYS = frozenset(["action", "defaultAction", "op", "architecture"])
+_ENUM_LIST_KEYS = frozenset(["subArchitectures", "caps", "arches"])
+
+
+def _translate(value):
+    try:
+        return SCMP_NAMES[value]
+    except (KeyError, TypeError):
+        raise ValueError(value) from None
+
+
+def _decode_object(pairs):
+    """object_pairs_hook, translates enum names while the JSON is decoded"""
+    obj = dict(pairs)
+    if "index" in obj:
+        # argument comparison, most common object in large profiles
+        index = obj["index"]
+        op = _translate(obj["op"])
+        if type(op) is not ScmpCmp or not 0 <= index <= 5:
+            raise ValueError("invalid argument {!r}".format(obj))
+        return _seccomp.ScmpArg.unchecked(
+            index, op, obj.get("value", 0), obj.get("valueTwo", 0)
+        )
+    if "action" in obj:
+        # syscall ruleset
+        obj["action"] = _translate(obj["action"])
+        return obj
+    for key in _ENUM_KEYS.intersection(obj):
+        obj[key] = _translate(obj[key])
+    for key in _ENUM_LIST_KEYS.intersection(obj):
+        obj[key] = [_translate(item) for item in obj[key]]
+    return obj
+
+
+def _reject_constant(name):
+    raise ValueError("invalid JSON constant {}".format(name))
+
+
+def _condition(obj):
+    if not obj:
+        return {}
+    result = {}
+    for key in ("caps", "arches", "minKernel"):
+        value = obj.get(key)
+        if value:
+            result[key] = value
+    return result
+
+
+def loads(text):
+    """Decode a seccomp.json profile
+
+    Fast path of load_file(). Enum names are translated by the JSON decoder
+    with a single table lookup, argument comparisons are created without
+    further validation and syscall names are resolved once per name.
+    """
+    root = json.loads(
+        text, object_pairs_hook=_decode_object, parse_constant=_reject_constant
+    )
+    archmap = {}
+    for item in root.get("archMap", ()):
+        archmap[item["architecture"]] = item["subArchitectures"]
+    names = {}
+    syscalls = []
+    for syscall in root["syscalls"]:
+        resolved = []
+        for name in syscall.get("names") or ():
+            obj = names.get(name)
+            if obj is None:
+                obj = names[name] = _seccomp.Syscall(name)
+            resolved.append(obj)
+        syscalls.append(
+            dict(
+                action=syscall["action"],
+                args=syscall.get("args") or [],
+                comment=syscall["comment"],
+                names=resolved,
+                includes=_condition(syscall.get("includes")),
+                excludes=_condition(syscall.get("excludes")),
+            )
+        )
+    return dict(
+        default_action=root["defaultAction"], archmap=archmap, syscalls=syscalls
+    )
 
 
 def _incl_excl(obj):
@@ -1,7 +1,8 @@
+from ._capprofile import DEFAULT_CAPABILITIES, EXTRA_CAPABILITIES  # noqa: F401
 from ._constants import Capabilities, ScmpAction, ScmpArch, ScmpCmp
 from ._libseccomp import ScmpArg
 from . import _seccomp
-from ._containerpolicy import IncludeCondition, ExcludeCondition
+from ._containerpolicy import flatten
 
 __all__ = ("SUB_ARCHITECTURES", "DEFAULT_ACTION", "SYSCALLS")
 
@@ -548,43 +549,14 @@ SYSCALLS = [
 ]
 
 
-DEFAULT_CAPABILITIES = [
-    Capabilities.CAP_CHOWN,
-    Capabilities.CAP_DAC_OVERRIDE,
-    Capabilities.CAP_FOWNER,
-    Capabilities.CAP_FSETID,
-    Capabilities.CAP_KILL,
-    Capabilities.CAP_SETGID,
-    Capabilities.CAP_SETUID,
-    Capabilities.CAP_SETPCAP,
-    Capabilities.CAP_NET_BIND_SERVICE,
-    Capabilities.CAP_SYS_CHROOT,
-    Capabilities.CAP_SETFCAP,
-]
-
-EXTRA_CAPABILITIES = [
-    Capabilities.CAP_NET_RAW,
-    Capabilities.CAP_MKNOD,
-    Capabilities.CAP_AUDIT_CONTROL,
-]
-
-
 def main():
     with _seccomp.Seccomp(DEFAULT_ACTION) as sc:
         for arch in SUB_ARCHITECTURES.get(_seccomp.NATIVE_ARCH, ()):
             sc.add_arch(arch)
-        for ruleset in SYSCALLS:
-            # TODO: check includes and excludes
-            if "includes" in ruleset:
-                if not IncludeCondition(**ruleset["includes"]):
-                    continue
-            if "excludes" in ruleset:
-                if ExcludeCondition(**ruleset["excludes"]):
-                    continue
-            action = ruleset["action"]
-            args = ruleset.get("args", ())
-            for syscall in ruleset["names"]:
-                sc.add_rule(action, syscall, *args)
+        sc.add_rules(
+            (rule.action, _seccomp.Syscall(rule.syscall).nr, rule.args)
+            for rule in flatten(DEFAULT_ACTION, SYSCALLS).rules
+        )
 
         sc.load()
         print(sc.export_pfc())
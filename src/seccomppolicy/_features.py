@@ -0,0 +1,246 @@
+import collections
+import ctypes
+import errno
+import json
+import os
+import tempfile
+import threading
+
+from . import _libc
+from . import _libseccomp as _lsc
+from ._constants import (
+    SECCOMP_RET_ACTION_FULL,
+    ScmpAction,
+    SeccompFilterFlag,
+    SeccompOp,
+)
+
+__all__ = ("Features", "clear_cache", "degrade_action", "kernel_release", "probe")
+
+# actions that are available since seccomp filter mode was added (Linux 3.5)
+_BASE_ACTIONS = (
+    ScmpAction.SCMP_ACT_KILL_THREAD,
+    ScmpAction.SCMP_ACT_TRAP,
+    ScmpAction.SCMP_ACT_ERRNO,
+    ScmpAction.SCMP_ACT_TRACE,
+    ScmpAction.SCMP_ACT_ALLOW,
+)
+
+_PROBE_ACTIONS = _BASE_ACTIONS + (
+    ScmpAction.SCMP_ACT_KILL_PROCESS,
+    ScmpAction.SCMP_ACT_NOTIFY,
+    ScmpAction.SCMP_ACT_LOG,
+)
+
+_PROBE_FLAGS = (
+    SeccompFilterFlag.TSYNC,
+    SeccompFilterFlag.LOG,
+    SeccompFilterFlag.SPEC_ALLOW,
+    SeccompFilterFlag.NEW_LISTENER,
+    SeccompFilterFlag.TSYNC_ESRCH,
+)
+
+# closest replacement for an unavailable action
+_DEGRADE = {
+    ScmpAction.SCMP_ACT_KILL_PROCESS: ScmpAction.SCMP_ACT_KILL_THREAD,
+    ScmpAction.SCMP_ACT_LOG: ScmpAction.SCMP_ACT_ALLOW,
+}
+
+
+class Features(
+    collections.namedtuple("Features", "kernel libseccomp api actions flags")
+):
+    """Seccomp features of the host
+
+    kernel: Kernel release
+    libseccomp: libseccomp version
+    api: libseccomp API level (seccomp_api_get)
+    actions: frozenset of available SECCOMP_RET_* actions
+    flags: bit mask of supported SECCOMP_FILTER_FLAG_*
+    """
+
+    __slots__ = ()
+
+    def has_action(self, action):
+        return (int(action) & SECCOMP_RET_ACTION_FULL) in self.actions
+
+    def has_flag(self, flag):
+        return (self.flags & flag) == flag
+
+    def to_json(self):
+        return json.dumps(
+            {
+                "kernel": self.kernel,
+                "libseccomp": self.libseccomp,
+                "api": self.api,
+                "actions": sorted(self.actions),
+                "flags": self.flags,
+            },
+            sort_keys=True,
+        )
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        return cls(
+            data["kernel"],
+            data["libseccomp"],
+            int(data["api"]),
+            frozenset(int(action) for action in data["actions"]),
+            int(data["flags"]),
+        )
+
+
+def _probe_action(action):
+    """SECCOMP_GET_ACTION_AVAIL, returns None if the op is not supported"""
+    value = ctypes.c_uint32(action)
+    try:
+        _libc.seccomp(SeccompOp.GET_ACTION_AVAIL, 0, ctypes.addressof(value))
+    except OSError as e:
+        if e.errno == errno.EOPNOTSUPP:
+            return False
+        # EINVAL: Kernel < 4.14, ENOSYS/EPERM: no seccomp() or filtered
+        return None
+    return True
+
+
+def _probe_flag(flag):
+    """Probe filter flag with a NULL program
+
+    The Kernel validates flags before it copies the program, EFAULT means
+    the flag is supported.
+    """
+    try:
+        _libc.seccomp(SeccompOp.SET_MODE_FILTER, flag, None)
+    except OSError as e:
+        return e.errno == errno.EFAULT
+    return False
+
+
+def _probe(kernel, libseccomp):
+    actions = set()
+    for action in _PROBE_ACTIONS:
+        available = _probe_action(action)
+        if available is None:
+            # cannot query Kernel, assume base actions
+            actions = set(_BASE_ACTIONS)
+            break
+        if available:
+            actions.add(action)
+    flags = 0
+    for flag in _PROBE_FLAGS:
+        if _probe_flag(flag):
+            flags |= flag
+    return Features(
+        kernel,
+        libseccomp,
+        _lsc.seccomp_api_get(),
+        frozenset(int(action) for action in actions),
+        flags,
+    )
+
+
+def _cache_file(cache_dir, kernel, libseccomp):
+    name = "features-{}-{}.json".format(kernel, libseccomp).replace(os.sep, "_")
+    return os.path.join(cache_dir, name)
+
+
+def _read_cache(filename):
+    try:
+        with open(filename) as f:
+            return Features.from_json(f.read())
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _write_cache(filename, features):
+    dirname = os.path.dirname(filename)
+    try:
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(features.to_json())
+            os.replace(tmp, filename)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    except OSError:
+        # cache is optional
+        pass
+
+
+_features = None
+_lock = threading.Lock()
+
+
+def _filtered():
+    """True if the calling thread runs in seccomp mode or the mode is unknown"""
+    for filename in ("/proc/thread-self/status", "/proc/self/status"):
+        try:
+            with open(filename, "rb") as f:
+                for line in f:
+                    if line.startswith(b"Seccomp:"):
+                        return int(line.split()[1]) != 0
+        except FileNotFoundError:
+            continue
+        except (OSError, ValueError):
+            break
+    return True
+
+
+def kernel_release():
+    """Release of the running Kernel, without probing features"""
+    return os.uname().release
+
+
+def probe(cache_dir=None):
+    """Probe seccomp features of Kernel and libseccomp
+
+    The result is cached in memory for the lifetime of the process. With
+    cache_dir, the result is also cached on disk, keyed by Kernel release and
+    libseccomp version. A filter can hide actions and flags from the probe,
+    so results of a filtered thread are not written to disk.
+    """
+    global _features
+    features = _features
+    if features is not None:
+        return features
+    with _lock:
+        if _features is not None:
+            return _features
+        kernel = kernel_release()
+        libseccomp = str(_lsc.seccomp_version().contents)
+        filename = None
+        if cache_dir is not None:
+            filename = _cache_file(cache_dir, kernel, libseccomp)
+            features = _read_cache(filename)
+        if features is None:
+            features = _probe(kernel, libseccomp)
+            if filename is not None and not _filtered():
+                _write_cache(filename, features)
+        _features = features
+        return features
+
+
+def clear_cache():
+    """Forget in-memory probe result"""
+    global _features
+    with _lock:
+        _features = None
+
+
+def degrade_action(action, features=None):
+    """Replace an unavailable action with the closest available action
+
+    KILL_PROCESS degrades to KILL_THREAD and LOG to ALLOW. Other actions are
+    returned unchanged.
+    """
+    if features is None:
+        features = probe()
+    while not features.has_action(action):
+        fallback = _DEGRADE.get(int(action) & SECCOMP_RET_ACTION_FULL)
+        if fallback is None:
+            break
+        action = fallback
+    return action
@@ -0,0 +1,417 @@
+"""Incremental compilation from per-syscall BPF fragments
+
+A program consists of an architecture dispatch, one syscall dispatch table
+per architecture and a fragment per (architecture, syscall). A fragment
+evaluates all rules of a syscall and ends with a return, so it does not
+depend on its position. Fragments are cached by their normalized rules and
+a new program is linked from cached fragments, only syscalls with changed
+rules are compiled again.
+"""
+
+import collections
+import struct
+import threading
+
+from . import _features
+from ._analysis import prune
+from ._bpf import (
+    BPF_ABS,
+    BPF_ALU,
+    BPF_AND,
+    BPF_JA,
+    BPF_JEQ,
+    BPF_JGE,
+    BPF_JGT,
+    BPF_JMP,
+    BPF_K,
+    BPF_LD,
+    BPF_MAXINSNS,
+    BPF_RET,
+    BPF_W,
+    insn,
+)
+from ._constants import AuditArch, ScmpAction, ScmpArch, ScmpCmp
+from ._libseccomp import ScmpArg
+from ._syscalltable import get_table, native_arch
+
+__all__ = ("CacheInfo", "IncrementalCompiler")
+
+CacheInfo = collections.namedtuple("CacheInfo", "hits misses currsize")
+
+# offsets in struct seccomp_data
+_NR = 0
+_ARCH = 4
+_ARGS = 16
+
+# x32 syscalls use the x86_64 audit arch with __X32_SYSCALL_BIT
+_X32_SYSCALL_BIT = 0x40000000
+
+_INSN_SIZE = 8
+_K_OFFSET = 4
+_K = struct.Struct("=I")
+
+# jump target placeholder for "rule does not match"
+_FAIL = object()
+
+_LD_W_ABS = BPF_LD | BPF_W | BPF_ABS
+
+# calls of the multiplexed socketcall() and ipc() syscalls, architectures with
+# a multiplexer in their syscall table dispatch socket and SysV IPC calls
+# through it in addition to the direct syscall numbers
+_SOCKETCALL = {
+    "socket": 1,
+    "bind": 2,
+    "connect": 3,
+    "listen": 4,
+    "accept": 5,
+    "getsockname": 6,
+    "getpeername": 7,
+    "socketpair": 8,
+    "send": 9,
+    "recv": 10,
+    "sendto": 11,
+    "recvfrom": 12,
+    "shutdown": 13,
+    "setsockopt": 14,
+    "getsockopt": 15,
+    "sendmsg": 16,
+    "recvmsg": 17,
+    "accept4": 18,
+    "recvmmsg": 19,
+    "sendmmsg": 20,
+}
+_IPC = {
+    "semop": 1,
+    "semget": 2,
+    "semctl": 3,
+    "semtimedop": 4,
+    "msgsnd": 11,
+    "msgrcv": 12,
+    "msgget": 13,
+    "msgctl": 14,
+    "shmat": 21,
+    "shmdt": 22,
+    "shmget": 23,
+    "shmctl": 24,
+}
+_MULTIPLEXERS = (("socketcall", _SOCKETCALL), ("ipc", _IPC))
+
+
+def _audit_arch(arch):
+    """Value of seccomp_data.arch"""
+    if arch == ScmpArch.SCMP_ARCH_X32:
+        return int(ScmpArch.SCMP_ARCH_X86_64)
+    return int(arch)
+
+
+def _compare(arch, arg, op, datum_a, datum_b):
+    """Instructions of an argument comparison
+
+    Falls through when the comparison matches, jumps to _FAIL otherwise.
+    Jump offsets to the passing path are relative integers.
+    """
+    offset = _ARGS + 8 * arg
+    if arch & AuditArch.LE:
+        lo, hi = offset, offset + 4
+    else:
+        lo, hi = offset + 4, offset
+    if op == ScmpCmp.SCMP_CMP_MASKED_EQ:
+        mask, datum = datum_a, datum_b & datum_a
+    else:
+        datum = datum_a
+    dlo, dhi = datum & 0xFFFFFFFF, datum >> 32
+
+    if not arch & AuditArch.AA_64BIT:
+        # 32bit architectures only have the lower half
+        if op == ScmpCmp.SCMP_CMP_MASKED_EQ:
+            return [
+                (_LD_W_ABS, lo, 0, 0),
+                (BPF_ALU | BPF_AND | BPF_K, mask & 0xFFFFFFFF, 0, 0),
+                (BPF_JMP | BPF_JEQ | BPF_K, dlo, 0, _FAIL),
+            ]
+        jump = {
+            ScmpCmp.SCMP_CMP_EQ: (BPF_JEQ, 0, _FAIL),
+            ScmpCmp.SCMP_CMP_NE: (BPF_JEQ, _FAIL, 0),
+            ScmpCmp.SCMP_CMP_GT: (BPF_JGT, 0, _FAIL),
+            ScmpCmp.SCMP_CMP_GE: (BPF_JGE, 0, _FAIL),
+            ScmpCmp.SCMP_CMP_LT: (BPF_JGE, _FAIL, 0),
+            ScmpCmp.SCMP_CMP_LE: (BPF_JGT, _FAIL, 0),
+        }[op]
+        return [(_LD_W_ABS, lo, 0, 0), (BPF_JMP | jump[0] | BPF_K, dlo) + jump[1:]]
+
+    if op == ScmpCmp.SCMP_CMP_EQ:
+        return [
+            (_LD_W_ABS, hi, 0, 0),
+            (BPF_JMP | BPF_JEQ | BPF_K, dhi, 0, _FAIL),
+            (_LD_W_ABS, lo, 0, 0),
+            (BPF_JMP | BPF_JEQ | BPF_K, dlo, 0, _FAIL),
+        ]
+    if op == ScmpCmp.SCMP_CMP_NE:
+        return [
+            (_LD_W_ABS, hi, 0, 0),
+            (BPF_JMP | BPF_JEQ | BPF_K, dhi, 0, 2),
+            (_LD_W_ABS, lo, 0, 0),
+            (BPF_JMP | BPF_JEQ | BPF_K, dlo, _FAIL, 0),
+        ]
+    if op == ScmpCmp.SCMP_CMP_MASKED_EQ:
+        return [
+            (_LD_W_ABS, hi, 0, 0),
+            (BPF_ALU | BPF_AND | BPF_K, mask >> 32, 0, 0),
+            (BPF_JMP | BPF_JEQ | BPF_K, dhi, 0, _FAIL),
+            (_LD_W_ABS, lo, 0, 0),
+            (BPF_ALU | BPF_AND | BPF_K, mask & 0xFFFFFFFF, 0, 0),
+            (BPF_JMP | BPF_JEQ | BPF_K, dlo, 0, _FAIL),
+        ]
+    if op in (ScmpCmp.SCMP_CMP_GT, ScmpCmp.SCMP_CMP_GE):
+        # hi > dhi matches, hi < dhi fails, hi == dhi compares lower half
+        last = BPF_JGT if op == ScmpCmp.SCMP_CMP_GT else BPF_JGE
+        return [
+            (_LD_W_ABS, hi, 0, 0),
+            (BPF_JMP | BPF_JGT | BPF_K, dhi, 3, 0),
+            (BPF_JMP | BPF_JEQ | BPF_K, dhi, 0, _FAIL),
+            (_LD_W_ABS, lo, 0, 0),
+            (BPF_JMP | last | BPF_K, dlo, 0, _FAIL),
+        ]
+    if op in (ScmpCmp.SCMP_CMP_LT, ScmpCmp.SCMP_CMP_LE):
+        # hi > dhi fails, hi < dhi matches, hi == dhi compares lower half
+        last = BPF_JGE if op == ScmpCmp.SCMP_CMP_LT else BPF_JGT
+        return [
+            (_LD_W_ABS, hi, 0, 0),
+            (BPF_JMP | BPF_JGT | BPF_K, dhi, _FAIL, 0),
+            (BPF_JMP | BPF_JEQ | BPF_K, dhi, 0, 2),
+            (_LD_W_ABS, lo, 0, 0),
+            (BPF_JMP | last | BPF_K, dlo, _FAIL, 0),
+        ]
+    raise ValueError("invalid compare operator {!r}".format(op))
+
+
+def _fragment(arch, default_action, rules):
+    """Compile the normalized rules of a syscall into a fragment"""
+    code = bytearray()
+    for action, args in rules:
+        insns = []
+        for arg in args:
+            insns.extend(_compare(arch, *arg.key()))
+        end = len(insns) + 1
+        for i, (op, k, jt, jf) in enumerate(insns):
+            if jt is _FAIL:
+                jt = end - i - 1
+            if jf is _FAIL:
+                jf = end - i - 1
+            code += insn(op, k, jt, jf)
+        code += insn(BPF_RET | BPF_K, action)
+        if not args:
+            # unconditional rule, following rules are unreachable
+            return bytes(code)
+    code += insn(BPF_RET | BPF_K, default_action)
+    return bytes(code)
+
+
+class _Program:
+    """Program under construction with label fixups for BPF_JA
+
+    BPF only jumps forward, labels must follow their jumps.
+    """
+
+    __slots__ = ("code", "labels", "fixups")
+
+    def __init__(self):
+        self.code = bytearray()
+        self.labels = {}
+        self.fixups = []
+
+    def __len__(self):
+        return len(self.code) // _INSN_SIZE
+
+    def label(self, name):
+        self.labels[name] = len(self)
+
+    def emit(self, code, k=0, jt=0, jf=0):
+        self.code += insn(code, k, jt, jf)
+
+    def jump(self, name):
+        self.fixups.append((len(self), name))
+        self.emit(BPF_JMP | BPF_JA)
+
+    def link(self):
+        for index, name in self.fixups:
+            offset = self.labels[name] - index - 1
+            _K.pack_into(self.code, index * _INSN_SIZE + _K_OFFSET, offset)
+        return bytes(self.code)
+
+
+class IncrementalCompiler:
+    """Compile policies from cached per-syscall BPF fragments
+
+    Rules of a syscall are normalized like libseccomp does: rules with the
+    default action are dropped and the remaining rules are ordered with
+    _analysis.prune(), the first matching rule wins. Syscall numbers of all
+    architectures come from the static syscall tables. Syscalls that do not
+    exist on an architecture are skipped. On architectures with socketcall()
+    and ipc() the rules of socket and SysV IPC syscalls are also added to
+    the multiplexer, checking only the call number like libseccomp.
+    Programs longer than BPF_MAXINSNS raise ValueError.
+
+    With degrade=True, actions that are not available on the host are
+    replaced like Seccomp(degrade=True) does. By default actions are used as
+    given.
+
+    At most maxsize fragments are kept in an LRU. The compiler is thread
+    safe.
+    """
+
+    __slots__ = ("_maxsize", "_degrade", "_fragments", "_lock", "_hits", "_misses")
+
+    def __init__(self, maxsize=4096, degrade=False):
+        if maxsize < 1:
+            raise ValueError("maxsize must be positive")
+        self._maxsize = maxsize
+        self._degrade = degrade
+        # (arch, nr, default action, rules) -> fragment
+        self._fragments = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = self._misses = 0
+
+    def _resolve_action(self, action):
+        if self._degrade:
+            return int(_features.degrade_action(action))
+        return int(action)
+
+    def _normalize(self, policy):
+        """Map syscall name -> tuple of (action, args) in evaluation order"""
+        default_action = self._resolve_action(policy.default_action)
+        actions = {}
+        rulesets = collections.defaultdict(list)
+        for action, syscall, args in policy.rules:
+            resolved = actions.get(action)
+            if resolved is None:
+                resolved = actions[action] = self._resolve_action(action)
+            if resolved == default_action:
+                # same as libseccomp, rules with the default action are no-ops
+                continue
+            rulesets[getattr(syscall, "name", syscall)].append((resolved, args))
+        normalized = {}
+        for name, rules in rulesets.items():
+            normalized[name] = tuple(
+                (action, tuple(sorted(set(args), key=ScmpArg.key)))
+                for action, args in prune(rules)
+            )
+        return default_action, normalized
+
+    def _get_fragment(self, arch, nr, default_action, rules):
+        key = (arch, nr, default_action, rules)
+        with self._lock:
+            fragment = self._fragments.get(key)
+            if fragment is not None:
+                self._fragments.move_to_end(key)
+                self._hits += 1
+                return fragment
+            self._misses += 1
+        fragment = _fragment(arch, default_action, rules)
+        with self._lock:
+            self._fragments[key] = fragment
+            while len(self._fragments) > self._maxsize:
+                self._fragments.popitem(last=False)
+        return fragment
+
+    def _section(self, arch, default_action, normalized):
+        """Sorted list of (nr, fragment) of an architecture"""
+        numbers = get_table().numbers(arch)
+        rulesets = {}
+        multiplexed = collections.defaultdict(list)
+        for name, rules in normalized.items():
+            nr = numbers.get(name)
+            if nr is not None:
+                rulesets[nr] = rules
+            for multiplexer, calls in _MULTIPLEXERS:
+                call = calls.get(name)
+                if call is None or multiplexer not in numbers:
+                    continue
+                # like libseccomp, only the call number in a0 is checked,
+                # the arguments are in memory
+                arg = ScmpArg(0, ScmpCmp.SCMP_CMP_EQ, call)
+                multiplexed[numbers[multiplexer]].extend(
+                    (action, (arg,)) for action, _ in rules
+                )
+        for nr, rules in multiplexed.items():
+            # rules of socketcall() and ipc() themselves come first
+            rulesets[nr] = tuple(prune(rulesets.get(nr, ()) + tuple(rules)))
+        return [
+            (nr, self._get_fragment(arch, nr, default_action, rules))
+            for nr, rules in sorted(rulesets.items())
+        ]
+
+    def compile(self, policy, arches=(), badarch=ScmpAction.SCMP_ACT_KILL_THREAD):
+        """Compile a Policy to a BPF program for the native and extra arches
+
+        Like a Seccomp filter, syscalls of other architectures return the
+        badarch action.
+        """
+        default_action, normalized = self._normalize(policy)
+        badarch = self._resolve_action(badarch)
+        filter_arches = [native_arch()]
+        for arch in arches:
+            arch = ScmpArch(arch)
+            if arch != ScmpArch.SCMP_ARCH_NATIVE and arch not in filter_arches:
+                filter_arches.append(arch)
+        sections = {
+            arch: self._section(arch, default_action, normalized)
+            for arch in filter_arches
+        }
+
+        # x86_64 and x32 share an audit arch
+        audit_arches = []
+        for arch in filter_arches:
+            audit = _audit_arch(arch)
+            if audit not in audit_arches:
+                audit_arches.append(audit)
+
+        prog = _Program()
+        prog.emit(_LD_W_ABS, _ARCH)
+        for audit in audit_arches:
+            prog.emit(BPF_JMP | BPF_JEQ | BPF_K, audit, 0, 1)
+            prog.jump(("arch", audit))
+        prog.emit(BPF_RET | BPF_K, badarch)
+
+        fragments = []
+        for audit in audit_arches:
+            prog.label(("arch", audit))
+            prog.emit(_LD_W_ABS, _NR)
+            if audit == ScmpArch.SCMP_ARCH_X86_64:
+                prog.emit(BPF_JMP | BPF_JGE | BPF_K, _X32_SYSCALL_BIT, 0, 1)
+                if ScmpArch.SCMP_ARCH_X32 in sections:
+                    prog.jump(("table", ScmpArch.SCMP_ARCH_X32))
+                else:
+                    prog.emit(BPF_RET | BPF_K, badarch)
+                if ScmpArch.SCMP_ARCH_X86_64 not in sections:
+                    prog.emit(BPF_RET | BPF_K, badarch)
+            # x86_64 table follows the x32 check, x32 table comes last
+            tables = [arch for arch in filter_arches if _audit_arch(arch) == audit]
+            tables.sort(key=lambda arch: arch == ScmpArch.SCMP_ARCH_X32)
+            for arch in tables:
+                prog.label(("table", arch))
+                for nr, fragment in sections[arch]:
+                    prog.emit(BPF_JMP | BPF_JEQ | BPF_K, nr, 0, 1)
+                    prog.jump(("fragment", len(fragments)))
+                    fragments.append(fragment)
+                prog.emit(BPF_RET | BPF_K, default_action)
+
+        for i, fragment in enumerate(fragments):
+            prog.label(("fragment", i))
+            prog.code += fragment
+        if len(prog) > BPF_MAXINSNS:
+            raise ValueError(
+                "program has {} instructions, the Kernel accepts {}".format(
+                    len(prog), BPF_MAXINSNS
+                )
+            )
+        return prog.link()
+
+    def cache_info(self):
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, len(self._fragments))
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+            self._hits = self._misses = 0
@@ -0,0 +1,78 @@
+import ctypes
+
+from ._bpf import fprog, install_fprog
+from ._pool import PreparedRules
+from ._seccomp import Seccomp
+
+__all__ = ("FilterInstaller",)
+
+
+class FilterInstaller:
+    """Install a precompiled BPF filter in a forked child
+
+    All expensive work (rule building, BPF generation, ctypes allocations) is
+    done in the parent. Calling the installer only runs
+    prctl(PR_SET_NO_NEW_PRIVS) and a single seccomp() or prctl() call, it
+    does not touch libseccomp. Instances are callable without arguments and
+    can be used as::
+
+        subprocess.Popen(cmd, preexec_fn=installer)
+        multiprocessing.Pool(initializer=installer)
+        concurrent.futures.ProcessPoolExecutor(initializer=installer)
+
+    With the spawn and forkserver start methods, the installer is pickled
+    as its BPF bytes and rebuilt in the child without libseccomp.
+    """
+
+    __slots__ = ("_bpf", "_flags", "_no_new_privs", "_prog", "_filters", "_addr")
+
+    def __init__(self, bpf, flags=0, no_new_privs=True):
+        self._bpf = bytes(bpf)
+        self._flags = int(flags)
+        self._no_new_privs = bool(no_new_privs)
+        # pinned sock_fprog, the kernel reads the program from our memory
+        self._prog, self._filters = fprog(self._bpf)
+        self._addr = ctypes.addressof(self._prog)
+
+    @classmethod
+    def from_seccomp(cls, sc, flags=None, no_new_privs=True):
+        """Create installer from an entered Seccomp filter
+
+        flags defaults to the flags of the filter's attributes.
+        """
+        if flags is None:
+            flags = sc.filter_flags()
+        sc.precompute()
+        return cls(sc.export_bpf(), flags, no_new_privs)
+
+    @classmethod
+    def from_policy(cls, policy, arches=(), flags=0, no_new_privs=True):
+        """Build a Policy and create an installer for its BPF program"""
+        with Seccomp(policy.default_action) as sc:
+            PreparedRules.from_policy(policy, arches).apply(sc)
+            return cls.from_seccomp(sc, flags, no_new_privs)
+
+    @property
+    def bpf(self):
+        """BPF program as bytes"""
+        return self._bpf
+
+    @property
+    def flags(self):
+        return self._flags
+
+    def __len__(self):
+        """Number of BPF instructions"""
+        return self._prog.len
+
+    def __call__(self):
+        """Install filter on the calling thread"""
+        install_fprog(self._addr, self._flags, self._no_new_privs)
+
+    def __reduce__(self):
+        return (self.__class__, (self._bpf, self._flags, self._no_new_privs))
+
+    def __repr__(self):
+        return "<{self.__class__.__name__} {n} instructions, flags={flags}>".format(
+            self=self, n=len(self), flags=self._flags
+        )
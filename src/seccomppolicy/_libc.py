@@ -1,19 +1,43 @@
 import ctypes
-from ctypes.util import find_library
+import errno
+import os
 
-__all__ = ("free",)
+from ._syscalltable import native_arch, resolve_name
 
-_libc_path = find_library("c")
-if _libc_path is None:
-    raise ImportError("Unable to find library libc")
+__all__ = (
+    "capget",
+    "capset",
+    "free",
+    "inotify_add_watch",
+    "inotify_init1",
+    "inotify_rm_watch",
+    "memfd_create",
+    "prctl",
+    "seccomp",
+)
+
+try:
+    # loading by soname skips find_library(), which runs ldconfig
+    _libc = ctypes.CDLL("libc.so.6", use_errno=True)
+except OSError:
+    from ctypes.util import find_library
 
-_libc = ctypes.CDLL(_libc_path, use_errno=True)
+    _libc_path = find_library("c")
+    if _libc_path is None:
+        raise ImportError("Unable to find library libc")
+    _libc = ctypes.CDLL(_libc_path, use_errno=True)
 
 free = _libc.free
 free.argtypes = (ctypes.c_void_p,)
 free.restype = None
 
 
+def _check_errno(result, func, args):
+    if result == -1:
+        raise OSError(ctypes.get_errno(), func.__name__, args)
+    return result
+
+
 def _check_prctl(result, func, args):
     if result == -1:
         raise OSError(ctypes.get_errno(), func.__name__, args)
@@ -36,3 +60,145 @@ _prctl.errcheck = _check_prctl
 def prctl(option, a2=0, a3=0, a4=0, a5=0):
     """Simple prctl syscall interface"""
     return _prctl(option, a2, a3, a4, a5)
+
+
+# glibc >= 2.27
+try:
+    _memfd_create = _libc.memfd_create
+except AttributeError:
+    _memfd_create = None
+else:
+    _memfd_create.argtypes = (ctypes.c_char_p, ctypes.c_uint)
+    _memfd_create.restype = ctypes.c_int
+    _memfd_create.errcheck = _check_errno
+
+
+def memfd_create(name, flags=0):
+    """Create an anonymous file, returns a file descriptor"""
+    if _memfd_create is None:
+        raise OSError(errno.ENOSYS, "memfd_create", (name, flags))
+    return _memfd_create(name.encode("utf-8"), flags)
+
+
+_inotify_init1 = _libc.inotify_init1
+_inotify_init1.argtypes = (ctypes.c_int,)
+_inotify_init1.restype = ctypes.c_int
+_inotify_init1.errcheck = _check_errno
+
+_inotify_add_watch = _libc.inotify_add_watch
+_inotify_add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+_inotify_add_watch.restype = ctypes.c_int
+_inotify_add_watch.errcheck = _check_errno
+
+_inotify_rm_watch = _libc.inotify_rm_watch
+_inotify_rm_watch.argtypes = (ctypes.c_int, ctypes.c_int)
+_inotify_rm_watch.restype = ctypes.c_int
+_inotify_rm_watch.errcheck = _check_errno
+
+
+def inotify_init1(flags=0):
+    """Create an inotify instance, returns a file descriptor"""
+    return _inotify_init1(flags)
+
+
+def inotify_add_watch(fd, path, mask):
+    """Watch a path, returns the watch descriptor"""
+    return _inotify_add_watch(fd, os.fsencode(path), mask)
+
+
+def inotify_rm_watch(fd, wd):
+    return _inotify_rm_watch(fd, wd)
+
+
+def _sys_seccomp():
+    """__NR_seccomp (Linux >= 3.17) of the interpreter's ABI, None if unknown
+
+    The number depends on the ABI of the interpreter, not the machine of the
+    Kernel, e.g. a 32bit interpreter on x86_64 uses the i386 number.
+    """
+    try:
+        return resolve_name("seccomp", native_arch())
+    except (OSError, ValueError):
+        return None
+
+
+_SYS_SECCOMP = _sys_seccomp()
+
+
+def _check_syscall(result, func, args):
+    if result == -1:
+        raise OSError(ctypes.get_errno(), "seccomp", args[1:])
+    return result
+
+
+# syscall(2) is variadic, use a private function pointer for argtypes
+_seccomp = _libc["syscall"]
+_seccomp.argtypes = (ctypes.c_long, ctypes.c_uint, ctypes.c_uint, ctypes.c_void_p)
+_seccomp.restype = ctypes.c_long
+_seccomp.errcheck = _check_syscall
+
+
+def seccomp(operation, flags=0, args=None):
+    """Simple seccomp syscall interface
+
+    args is an address or ctypes pointer, e.g. to a sock_fprog.
+    """
+    if _SYS_SECCOMP is None:
+        raise OSError(errno.ENOSYS, "seccomp", (operation, flags, args))
+    return _seccomp(_SYS_SECCOMP, operation, flags, args)
+
+
+# capget(2) / capset(2), 64bit capabilities
+_LINUX_CAPABILITY_VERSION_3 = 0x20080522
+_LINUX_CAPABILITY_U32S_3 = 2
+
+
+class cap_user_header(ctypes.Structure):
+    __slots__ = ()
+    _fields_ = [("version", ctypes.c_uint32), ("pid", ctypes.c_int)]
+
+
+class cap_user_data(ctypes.Structure):
+    __slots__ = ()
+    _fields_ = [
+        ("effective", ctypes.c_uint32),
+        ("permitted", ctypes.c_uint32),
+        ("inheritable", ctypes.c_uint32),
+    ]
+
+
+_cap_user_data_3 = cap_user_data * _LINUX_CAPABILITY_U32S_3
+
+_capget = _libc.capget
+_capget.argtypes = (ctypes.POINTER(cap_user_header), ctypes.POINTER(cap_user_data))
+_capget.restype = ctypes.c_int
+_capget.errcheck = _check_errno
+
+_capset = _libc.capset
+_capset.argtypes = (ctypes.POINTER(cap_user_header), ctypes.POINTER(cap_user_data))
+_capset.restype = ctypes.c_int
+_capset.errcheck = _check_errno
+
+
+def capget(pid=0):
+    """Get (effective, permitted, inheritable) capability masks of a thread"""
+    header = cap_user_header(_LINUX_CAPABILITY_VERSION_3, pid)
+    data = _cap_user_data_3()
+    _capget(header, data)
+    return (
+        data[0].effective | data[1].effective << 32,
+        data[0].permitted | data[1].permitted << 32,
+        data[0].inheritable | data[1].inheritable << 32,
+    )
+
+
+def capset(effective, permitted, inheritable):
+    """Set capability masks of the calling thread"""
+    header = cap_user_header(_LINUX_CAPABILITY_VERSION_3, 0)
+    data = _cap_user_data_3()
+    for i in range(_LINUX_CAPABILITY_U32S_3):
+        shift = 32 * i
+        data[i].effective = (effective >> shift) & 0xFFFFFFFF
+        data[i].permitted = (permitted >> shift) & 0xFFFFFFFF
+        data[i].inheritable = (inheritable >> shift) & 0xFFFFFFFF
+    _capset(header, data)
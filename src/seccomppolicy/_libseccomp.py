@@ -1,5 +1,4 @@
 import ctypes
-from ctypes.util import find_library
 import errno
 
 from . import _libc
@@ -8,24 +7,40 @@ from ._constants import ScmpArch, ScmpCmp
 __all__ = (
     "ScmpArg",
     "scmp_filter_ctx",
+    "scmp_version",
+    "seccomp_api_get",
     "seccomp_arch_add",
     "seccomp_arch_native",
+    "seccomp_attr_get",
+    "seccomp_attr_set",
+    "seccomp_export_bpf",
     "seccomp_export_pfc",
     "seccomp_init",
     "seccomp_load",
+    "seccomp_merge",
+    "seccomp_precompute",
     "seccomp_release",
+    "seccomp_reset",
     "seccomp_rule_add_array",
+    "seccomp_rule_add_array_unchecked",
     "seccomp_rule_add_exact_array",
+    "seccomp_rule_add_exact_array_unchecked",
     "seccomp_syscall_resolve_name_arch",
     "seccomp_syscall_resolve_num_arch",
+    "seccomp_version",
 )
 
 
-_lsc_path = find_library("seccomp")
-if _lsc_path is None:
-    raise ImportError("Unable to find library libseccomp")
+try:
+    # loading by soname skips find_library(), which runs ldconfig
+    _lsc = ctypes.CDLL("libseccomp.so.2")
+except OSError:
+    from ctypes.util import find_library
 
-_lsc = ctypes.CDLL(_lsc_path)
+    _lsc_path = find_library("seccomp")
+    if _lsc_path is None:
+        raise ImportError("Unable to find library libseccomp")
+    _lsc = ctypes.CDLL(_lsc_path)
 
 # errcheck functions
 
@@ -93,6 +108,13 @@ class ScmpArg(ctypes.Structure):
         # datum_b is only used by SCMP_CMP_MASKED_EQ
         super().__init__(arg, op, datum_a, datum_b)
 
+    @classmethod
+    def unchecked(cls, arg, op, datum_a, datum_b=0):
+        """Create ScmpArg without validation of arg and op"""
+        self = cls.__new__(cls)
+        ctypes.Structure.__init__(self, arg, op, datum_a, datum_b)
+        return self
+
     @classmethod
     def toarray(cls, *args):
         if len(args) > 5:
@@ -102,6 +124,39 @@ class ScmpArg(ctypes.Structure):
             array[i] = arg
         return array
 
+    def key(self):
+        """Hashable (arg, op, datum_a, datum_b) tuple"""
+        return (self.arg, self.op, self.datum_a, self.datum_b)
+
+    def matches(self, value):
+        """Evaluate comparison for a 64bit argument value"""
+        op = self.op
+        if op == ScmpCmp.SCMP_CMP_EQ:
+            return value == self.datum_a
+        elif op == ScmpCmp.SCMP_CMP_NE:
+            return value != self.datum_a
+        elif op == ScmpCmp.SCMP_CMP_LT:
+            return value < self.datum_a
+        elif op == ScmpCmp.SCMP_CMP_LE:
+            return value <= self.datum_a
+        elif op == ScmpCmp.SCMP_CMP_GE:
+            return value >= self.datum_a
+        elif op == ScmpCmp.SCMP_CMP_GT:
+            return value > self.datum_a
+        elif op == ScmpCmp.SCMP_CMP_MASKED_EQ:
+            # datum_a is the mask, datum_b the expected value
+            return (value & self.datum_a) == self.datum_b
+        else:
+            raise ValueError(op)
+
+    def __eq__(self, other):
+        if not isinstance(other, ScmpArg):
+            return NotImplemented
+        return self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
     def __repr__(self):
         return (
             "{self.__class__.__name__}({self.arg}, ScmpCmp.{op}, "
@@ -109,8 +164,28 @@ class ScmpArg(ctypes.Structure):
         ).format(self=self, op=ScmpCmp(self.op)._name_)
 
 
+class scmp_version(ctypes.Structure):
+    __slots__ = ()
+    _fields_ = [
+        ("major", ctypes.c_uint),
+        ("minor", ctypes.c_uint),
+        ("micro", ctypes.c_uint),
+    ]
+
+    def __str__(self):
+        return "{self.major}.{self.minor}.{self.micro}".format(self=self)
+
+
 # functions
 
+seccomp_version = _lsc.seccomp_version
+seccomp_version.argtypes = ()
+seccomp_version.restype = ctypes.POINTER(scmp_version)
+
+seccomp_api_get = _lsc.seccomp_api_get
+seccomp_api_get.argtypes = ()
+seccomp_api_get.restype = ctypes.c_uint
+
 seccomp_init = _lsc.seccomp_init
 seccomp_init.argtypes = (ctypes.c_uint32,)
 seccomp_init.restype = scmp_filter_ctx
@@ -120,6 +195,17 @@ seccomp_release = _lsc.seccomp_release
 seccomp_release.argtypes = (scmp_filter_ctx,)
 seccomp_release.restype = None
 
+seccomp_reset = _lsc.seccomp_reset
+seccomp_reset.argtypes = (scmp_filter_ctx, ctypes.c_uint32)
+seccomp_reset.restype = ctypes.c_int
+seccomp_reset.errcheck = _check_success
+
+# src filter is released on success
+seccomp_merge = _lsc.seccomp_merge
+seccomp_merge.argtypes = (scmp_filter_ctx, scmp_filter_ctx)
+seccomp_merge.restype = ctypes.c_int
+seccomp_merge.errcheck = _check_success
+
 seccomp_load = _lsc.seccomp_load
 seccomp_load.argtypes = (scmp_filter_ctx,)
 seccomp_load.restype = ctypes.c_int
@@ -135,6 +221,20 @@ seccomp_arch_native.argtypes = ()
 seccomp_arch_native.restype = ctypes.c_uint32
 seccomp_arch_native.errcheck = _check_arch
 
+seccomp_attr_get = _lsc.seccomp_attr_get
+seccomp_attr_get.argtypes = (
+    scmp_filter_ctx,
+    ctypes.c_int,
+    ctypes.POINTER(ctypes.c_uint32),
+)
+seccomp_attr_get.restype = ctypes.c_int
+seccomp_attr_get.errcheck = _check_success
+
+seccomp_attr_set = _lsc.seccomp_attr_set
+seccomp_attr_set.argtypes = (scmp_filter_ctx, ctypes.c_int, ctypes.c_uint32)
+seccomp_attr_set.restype = ctypes.c_int
+seccomp_attr_set.errcheck = _check_success
+
 seccomp_rule_add_array = _lsc.seccomp_rule_add_array
 seccomp_rule_add_array.argtypes = (
     scmp_filter_ctx,
@@ -157,11 +257,36 @@ seccomp_rule_add_exact_array.argtypes = (
 seccomp_rule_add_exact_array.restype = ctypes.c_int
 seccomp_rule_add_exact_array.errcheck = _check_success
 
+# separate function objects without errcheck for bulk insertion, the
+# caller checks the negative errno return value.
+seccomp_rule_add_array_unchecked = _lsc["seccomp_rule_add_array"]
+seccomp_rule_add_array_unchecked.argtypes = seccomp_rule_add_array.argtypes
+seccomp_rule_add_array_unchecked.restype = ctypes.c_int
+
+seccomp_rule_add_exact_array_unchecked = _lsc["seccomp_rule_add_exact_array"]
+seccomp_rule_add_exact_array_unchecked.argtypes = seccomp_rule_add_exact_array.argtypes
+seccomp_rule_add_exact_array_unchecked.restype = ctypes.c_int
+
 seccomp_export_pfc = _lsc.seccomp_export_pfc
 seccomp_export_pfc.argtypes = (scmp_filter_ctx, ctypes.c_int)
 seccomp_export_pfc.restype = ctypes.c_int
 seccomp_export_pfc.errcheck = _check_success
 
+seccomp_export_bpf = _lsc.seccomp_export_bpf
+seccomp_export_bpf.argtypes = (scmp_filter_ctx, ctypes.c_int)
+seccomp_export_bpf.restype = ctypes.c_int
+seccomp_export_bpf.errcheck = _check_success
+
+try:
+    seccomp_precompute = _lsc.seccomp_precompute
+except AttributeError:
+    # libseccomp < 2.6
+    seccomp_precompute = None
+else:
+    seccomp_precompute.argtypes = (scmp_filter_ctx,)
+    seccomp_precompute.restype = ctypes.c_int
+    seccomp_precompute.errcheck = _check_success
+
 seccomp_syscall_resolve_name_arch = _lsc.seccomp_syscall_resolve_name_arch
 seccomp_syscall_resolve_name_arch.argtypes = (ctypes.c_uint32, ctypes.c_char_p)
 seccomp_syscall_resolve_name_arch.restype = ctypes.c_int
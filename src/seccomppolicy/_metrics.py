@@ -0,0 +1,274 @@
+import binascii
+import collections
+import os
+import re
+import socket
+import socketserver
+import struct
+import tempfile
+import threading
+import time
+
+from ._constants import SECCOMP_RET_ACTION_FULL, ScmpAction, ScmpArch
+from ._seccomp import Syscall
+
+__all__ = (
+    "DenialCounters",
+    "SeccompRecord",
+    "follow_file",
+    "follow_netlink",
+    "parse_record",
+    "render",
+    "serve_unix",
+    "write_textfile",
+)
+
+# AUDIT_SECCOMP record type, linux/audit.h
+AUDIT_SECCOMP = 1326
+# NETLINK_AUDIT protocol and AUDIT_NLGRP_READLOG multicast group
+NETLINK_AUDIT = 9
+AUDIT_NLGRP_READLOG = 1
+
+_NLMSGHDR = struct.Struct("=IHHII")
+
+# seccomp audit record of a single syscall
+SeccompRecord = collections.namedtuple("SeccompRecord", "pid comm arch syscall action")
+
+_FIELD_RE = re.compile(r'(\w+)=("[^"]*"|\S+)')
+
+# SECCOMP_RET_* action -> metric label
+_ACTION_LABELS = {
+    int(ScmpAction.SCMP_ACT_KILL_PROCESS): "kill_process",
+    int(ScmpAction.SCMP_ACT_KILL_THREAD): "kill_thread",
+    int(ScmpAction.SCMP_ACT_TRAP): "trap",
+    int(ScmpAction.SCMP_ACT_ERRNO) & SECCOMP_RET_ACTION_FULL: "errno",
+    int(ScmpAction.SCMP_ACT_NOTIFY): "notify",
+    int(ScmpAction.SCMP_ACT_TRACE) & SECCOMP_RET_ACTION_FULL: "trace",
+    int(ScmpAction.SCMP_ACT_LOG): "log",
+    int(ScmpAction.SCMP_ACT_ALLOW): "allow",
+}
+
+# series that were evicted from the counters
+OTHER = "__other__"
+
+
+def _decode_comm(value):
+    if value.startswith('"'):
+        return value[1:-1]
+    # audit hex-encodes values with spaces or special characters
+    try:
+        return binascii.unhexlify(value).decode("utf-8", "replace")
+    except (binascii.Error, ValueError):
+        return value
+
+
+def parse_record(line):
+    """Parse a seccomp audit record, returns None for other records
+
+    Accepts lines from audit.log (type=SECCOMP msg=audit(...): ...) and
+    netlink payloads without type prefix.
+    """
+    if "syscall=" not in line or "code=" not in line:
+        return None
+    if line.startswith("type=") and not line.startswith("type=SECCOMP "):
+        return None
+    fields = dict(_FIELD_RE.findall(line))
+    try:
+        arch = int(fields["arch"], 16)
+        nr = int(fields["syscall"])
+        code = int(fields["code"], 16)
+        pid = int(fields.get("pid", "0"))
+    except (KeyError, ValueError):
+        return None
+    action = code & SECCOMP_RET_ACTION_FULL
+    return SeccompRecord(
+        pid,
+        _decode_comm(fields.get("comm", '"?"')),
+        arch,
+        nr,
+        _ACTION_LABELS.get(action, "0x{:08x}".format(action)),
+    )
+
+
+class DenialCounters:
+    """Counters per (comm, syscall, action) in fixed memory
+
+    At most maxsize series are kept. When a new series does not fit, the
+    least recently updated series is folded into an (__other__, __other__,
+    action) series, so per-action totals stay exact.
+    """
+
+    __slots__ = ("_maxsize", "_counters", "_other", "_names", "_lock")
+
+    def __init__(self, maxsize=1024):
+        if maxsize < 1:
+            raise ValueError("maxsize must be positive")
+        self._maxsize = maxsize
+        self._counters = collections.OrderedDict()
+        # action -> count of evicted series, at most one entry per action
+        self._other = {}
+        # (arch, nr) -> syscall name
+        self._names = {}
+        self._lock = threading.Lock()
+
+    def _syscall_name(self, arch, nr):
+        key = (arch, nr)
+        name = self._names.get(key)
+        if name is None:
+            try:
+                name = Syscall(nr, ScmpArch(arch)).name
+            except ValueError:
+                name = str(nr)
+            if len(self._names) < 4096:
+                self._names[key] = name
+        return name
+
+    def add(self, record, count=1):
+        key = (
+            record.comm,
+            self._syscall_name(record.arch, record.syscall),
+            record.action,
+        )
+        counters = self._counters
+        with self._lock:
+            if key in counters:
+                counters[key] += count
+                counters.move_to_end(key)
+                return
+            counters[key] = count
+            if len(counters) > self._maxsize:
+                (_, _, action), evicted = counters.popitem(last=False)
+                self._other[action] = self._other.get(action, 0) + evicted
+
+    def snapshot(self):
+        """Sorted list of ((comm, syscall, action), count)"""
+        with self._lock:
+            items = list(self._counters.items())
+            items.extend(
+                ((OTHER, OTHER, action), count) for action, count in self._other.items()
+            )
+        return sorted(items)
+
+    def __len__(self):
+        return len(self._counters)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render(counters):
+    """Prometheus text exposition of DenialCounters"""
+    lines = [
+        "# HELP seccomp_actions_total Seccomp audit records by comm, syscall "
+        "and action.",
+        "# TYPE seccomp_actions_total counter",
+    ]
+    for (comm, syscall, action), count in counters.snapshot():
+        lines.append(
+            'seccomp_actions_total{{comm="{}",syscall="{}",action="{}"}} {}'.format(
+                _escape(comm), _escape(syscall), action, count
+            )
+        )
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(filename, counters):
+    """Atomically write exposition for node_exporter's textfile collector"""
+    dirname = os.path.dirname(os.path.abspath(filename))
+    fd, tmp = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            os.fchmod(f.fileno(), 0o644)
+            f.write(render(counters))
+        os.replace(tmp, filename)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.request.sendall(render(self.server.counters).encode("utf-8"))
+
+
+def serve_unix(path, counters):
+    """Serve exposition on a Unix stream socket in a daemon thread
+
+    Every client receives the current exposition and the connection is
+    closed. Returns the server, call shutdown() to stop it.
+    """
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    server = socketserver.ThreadingUnixStreamServer(path, _Handler)
+    server.daemon_threads = True
+    server.counters = counters
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def follow_file(filename, poll_interval=0.5, from_start=False):
+    """Follow an audit log file like tail -F, yields lines
+
+    The file is reopened when it is rotated (inode changes) or truncated.
+    """
+    f = None
+    inode = None
+    partial = ""
+    try:
+        while True:
+            if f is None:
+                try:
+                    f = open(filename, errors="replace")
+                except FileNotFoundError:
+                    time.sleep(poll_interval)
+                    continue
+                inode = os.fstat(f.fileno()).st_ino
+                if not from_start:
+                    f.seek(0, os.SEEK_END)
+                # rotated files are read from the start
+                from_start = True
+            line = f.readline()
+            if line.endswith("\n"):
+                yield partial + line
+                partial = ""
+                continue
+            # incomplete line, the rest is not written yet
+            partial += line
+            try:
+                st = os.stat(filename)
+            except FileNotFoundError:
+                st = None
+            if st is None or st.st_ino != inode or st.st_size < f.tell():
+                f.close()
+                f = None
+                partial = ""
+                continue
+            time.sleep(poll_interval)
+    finally:
+        if f is not None:
+            f.close()
+
+
+def follow_netlink():
+    """Follow audit records on the NETLINK_AUDIT multicast group
+
+    Needs CAP_AUDIT_READ. Yields payloads of AUDIT_SECCOMP messages.
+    """
+    with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_AUDIT) as sock:
+        sock.bind((0, 1 << (AUDIT_NLGRP_READLOG - 1)))
+        while True:
+            data = sock.recv(65536)
+            offset = 0
+            while offset + _NLMSGHDR.size <= len(data):
+                length, msgtype = _NLMSGHDR.unpack_from(data, offset)[:2]
+                if length < _NLMSGHDR.size:
+                    break
+                if msgtype == AUDIT_SECCOMP:
+                    payload = data[offset + _NLMSGHDR.size : offset + length]
+                    yield payload.rstrip(b"\0").decode("utf-8", "replace")
+                # NLMSG_ALIGN
+                offset += (length + 3) & ~3
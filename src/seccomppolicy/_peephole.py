@@ -0,0 +1,501 @@
+"""Peephole optimizer for exported seccomp BPF programs
+
+The program is decoded into a graph of instructions and rewritten by a
+few passes that keep the result of every seccomp_data:
+
+- jump threading: jumps to BPF_JA, to jumps with both targets equal and to
+  comparisons whose result is known from the preceding comparisons of the
+  accumulator are redirected to the final target
+- arch dispatch: the comparisons of seccomp_data.arch at the start of the
+  program are reordered, so the native architecture is checked first
+- range coalescing: chains of BPF_JEQ on the same accumulator are sorted
+  and runs of adjacent values with the same target become one range check
+- block merging: identical instructions with identical successors, e.g.
+  return blocks, are shared
+
+Finally the graph is laid out again. Conditional jumps only reach 255
+instructions, far targets get a BPF_JA trampoline or a copy of the target
+return that is shared by the preceding jumps.
+"""
+
+import collections
+import heapq
+import random
+import struct
+
+from ._bpf import (
+    BPF_ABS,
+    BPF_JA,
+    BPF_JEQ,
+    BPF_JGE,
+    BPF_JGT,
+    BPF_JMP,
+    BPF_JSET,
+    BPF_K,
+    BPF_LD,
+    BPF_RET,
+    BPF_W,
+    BPF_X,
+    accumulators,
+    decode,
+    encode,
+    evaluate,
+    seccomp_data,
+    successors,
+)
+from ._constants import ScmpArch
+from ._incremental import _audit_arch
+from ._syscalltable import get_table, native_arch
+
+__all__ = ("Mismatch", "ProgramStats", "optimize", "stats", "verify")
+
+ProgramStats = collections.namedtuple("ProgramStats", "instructions longest_path")
+
+# seccomp_data on which two programs return different actions
+Mismatch = collections.namedtuple("Mismatch", "data before after")
+
+# offsets in struct seccomp_data
+_NR = 0
+_ARCH = 4
+_ARGS = 16
+
+_X32_SYSCALL_BIT = 0x40000000
+
+_LD_W_ABS = BPF_LD | BPF_W | BPF_ABS
+_JA = BPF_JMP | BPF_JA
+_JEQ_K = BPF_JMP | BPF_JEQ | BPF_K
+
+# largest jt / jf offset
+_MAX_OFFSET = 0xFF
+_WORD = struct.Struct("=I")
+
+# accumulator range (lowest, highest, excluded values)
+_UNKNOWN = (0, 0xFFFFFFFF, frozenset())
+
+
+class _Node:
+    """Instruction of the program graph
+
+    jt is the successor of non-jump instructions and the target of BPF_JA,
+    jt and jf are the targets of conditional jumps. order sorts nodes like
+    the input program.
+    """
+
+    __slots__ = ("code", "k", "jt", "jf", "order")
+
+    def __init__(self, code, k, order):
+        self.code = code
+        self.k = k
+        self.jt = None
+        self.jf = None
+        self.order = order
+
+    def targets(self):
+        if self.jf is not None:
+            return (self.jt, self.jf)
+        if self.jt is not None:
+            return (self.jt,)
+        return ()
+
+
+def _is_ret(node):
+    return node.code & 0x07 == BPF_RET
+
+
+def _is_cond(node):
+    return node.code & 0x07 == BPF_JMP and node.code != _JA
+
+
+def _graph(insns):
+    """Decode (code, jt, jf, k) tuples into nodes, returns the entry node"""
+    nodes = [_Node(code, k, (i,)) for i, (code, _, _, k) in enumerate(insns)]
+    for i, ins in enumerate(insns):
+        targets = successors(i, *ins)
+        if any(target >= len(nodes) for target in targets):
+            raise ValueError("instruction {} jumps out of the program".format(i))
+        if targets:
+            nodes[i].jt = nodes[targets[0]]
+        if len(targets) > 1:
+            nodes[i].jf = nodes[targets[1]]
+    if not nodes:
+        raise ValueError("empty BPF program")
+    return nodes[0]
+
+
+def _reachable(entry):
+    """Nodes reachable from entry in topological order
+
+    Ties are broken by the order of the input program, so unchanged parts
+    keep their layout.
+    """
+    indegree = collections.Counter()
+    seen = {entry}
+    stack = [entry]
+    while stack:
+        node = stack.pop()
+        for target in node.targets():
+            indegree[target] += 1
+            if target not in seen:
+                seen.add(target)
+                stack.append(target)
+    result = []
+    ready = [(entry.order, id(entry), entry)]
+    while ready:
+        _, _, node = heapq.heappop(ready)
+        result.append(node)
+        for target in node.targets():
+            indegree[target] -= 1
+            if not indegree[target]:
+                heapq.heappush(ready, (target.order, id(target), target))
+    return result
+
+
+def _outcome(node, known):
+    """Result of a conditional jump for a known accumulator range or None"""
+    if node.code & BPF_X:
+        return None
+    lowest, highest, excluded = known
+    op = node.code & 0xF0
+    k = node.k
+    if op == BPF_JEQ:
+        if lowest == highest:
+            return lowest == k
+        if k < lowest or k > highest or k in excluded:
+            return False
+    elif op == BPF_JGT:
+        if lowest > k:
+            return True
+        if highest <= k:
+            return False
+    elif op == BPF_JGE:
+        if lowest >= k:
+            return True
+        if highest < k:
+            return False
+    elif op == BPF_JSET:
+        if lowest == highest:
+            return bool(lowest & node.k)
+    return None
+
+
+def _refine(node, known, taken):
+    """Accumulator range after a conditional jump"""
+    if node.code & BPF_X:
+        return known
+    lowest, highest, excluded = known
+    op = node.code & 0xF0
+    k = node.k
+    if op == BPF_JEQ:
+        if taken:
+            return (k, k, frozenset())
+        return (lowest, highest, excluded | {k})
+    if op == BPF_JGT:
+        if taken:
+            return (max(lowest, k + 1), highest, excluded)
+        return (lowest, min(highest, k), excluded)
+    if op == BPF_JGE:
+        if taken:
+            return (max(lowest, k), highest, excluded)
+        return (lowest, min(highest, k - 1), excluded)
+    return known
+
+
+def _resolve(node, known=_UNKNOWN):
+    """First node that executes, skipping jumps with a known result"""
+    while node.code & 0x07 == BPF_JMP:
+        if node.code == _JA or node.jt is node.jf:
+            node = node.jt
+            continue
+        taken = _outcome(node, known)
+        if taken is None:
+            break
+        known = _refine(node, known, taken)
+        node = node.jt if taken else node.jf
+    return node
+
+
+def _thread(entry):
+    """Redirect all edges to their final targets, returns the new entry"""
+    for node in reversed(_reachable(entry)):
+        if _is_cond(node):
+            node.jt = _resolve(node.jt, _refine(node, _UNKNOWN, True))
+            node.jf = _resolve(node.jf, _refine(node, _UNKNOWN, False))
+        elif node.jt is not None:
+            node.jt = _resolve(node.jt)
+    return _resolve(entry)
+
+
+def _predecessors(nodes):
+    result = collections.Counter()
+    for node in nodes:
+        for target in node.targets():
+            result[target] += 1
+    return result
+
+
+def _chain(head, predecessors):
+    """BPF_JEQ nodes linked by their false edges, starting at head"""
+    chain = [head]
+    node = head.jf
+    while node.code == _JEQ_K and predecessors[node] == 1:
+        chain.append(node)
+        node = node.jf
+    return chain
+
+
+def _dispatch_native(entry, native):
+    """Move the comparison of the native arch to the front of the dispatch"""
+    if entry.code != _LD_W_ABS or entry.k != _ARCH or entry.jt.code != _JEQ_K:
+        return ()
+    nodes = _reachable(entry)
+    chain = _chain(entry.jt, _predecessors(nodes))
+    checks = [(node.k, node.jt) for node in chain]
+    if native is not None:
+        checks.sort(key=lambda check: check[0] != native)
+    # the false edges keep the chain in place, comparisons are independent
+    for node, (k, target) in zip(chain, checks):
+        node.k = k
+        node.jt = target
+    return frozenset(chain)
+
+
+def _coalesce(entry, skip):
+    """Rewrite BPF_JEQ chains as sorted ranges and single values"""
+    nodes = _reachable(entry)
+    predecessors = _predecessors(nodes)
+    done = set(skip)
+    for node in nodes:
+        if node.code != _JEQ_K or node in done:
+            continue
+        chain = _chain(node, predecessors)
+        done.update(chain)
+        fail = chain[-1].jf
+        # value -> target, the first comparison of a value wins
+        targets = {}
+        for link in chain:
+            targets.setdefault(link.k, link.jt)
+        values = sorted(k for k, target in targets.items() if target is not fail)
+        runs = []
+        for value in values:
+            target = targets[value]
+            if runs and runs[-1][1] == value - 1 and runs[-1][2] is target:
+                runs[-1][1] = value
+            else:
+                runs.append([value, value, target])
+        checks = []
+        for low, high, target in runs:
+            if high - low < 2:
+                # a range check is not shorter than two BPF_JEQ
+                checks.extend((value, value, target) for value in range(low, high + 1))
+            else:
+                checks.append((low, high, target))
+        size = sum(1 if low == high else 2 for low, high, _ in checks)
+        if size >= len(chain):
+            continue
+
+        # build the sorted checks from the end, the head keeps its identity
+        # so its predecessors need not be updated
+        following = fail
+        for i in reversed(range(len(checks))):
+            low, high, target = checks[i]
+            if low == high:
+                check = _Node(_JEQ_K, low, node.order + (i, 0))
+                check.jt = target
+                check.jf = following
+            else:
+                upper = _Node(BPF_JMP | BPF_JGT | BPF_K, high, node.order + (i, 1))
+                upper.jt = following
+                upper.jf = target
+                # below low no later check matches, the checks are sorted
+                check = _Node(BPF_JMP | BPF_JGE | BPF_K, low, node.order + (i, 0))
+                check.jt = upper
+                check.jf = fail
+            following = check
+        if following is fail:
+            node.code = _JA
+            node.k = 0
+            node.jt = fail
+            node.jf = None
+        else:
+            node.code = following.code
+            node.k = following.k
+            node.jt = following.jt
+            node.jf = following.jf
+
+
+def _merge(entry):
+    """Share identical nodes with identical successors, returns the entry"""
+    canonical = {}
+    table = {}
+    for node in reversed(_reachable(entry)):
+        if node.jt is not None:
+            node.jt = canonical.get(node.jt, node.jt)
+        if node.jf is not None:
+            node.jf = canonical.get(node.jf, node.jf)
+        key = (node.code, node.k, id(node.jt), id(node.jf))
+        # the last occurrence is kept, so all edges still point forward
+        canonical[node] = table.setdefault(key, node)
+    return canonical[entry]
+
+
+def _layout(entry):
+    """Lay out the graph as (code, jt, jf, k) tuples
+
+    The program is laid out backwards, so the distance to every target is
+    known when a jump is placed. A target out of reach of a conditional
+    jump gets a BPF_JA trampoline or a copy of the return right after the
+    jump, preceding jumps to the same target share it.
+    """
+    insns = []
+    # node -> number of instructions after its closest copy or trampoline
+    nearest = {}
+
+    def offset(target):
+        return len(insns) - nearest[target] - 1
+
+    def trampoline(target):
+        if _is_ret(target):
+            ins = (target.code, 0, 0, target.k)
+        else:
+            ins = (_JA, 0, 0, offset(target))
+        nearest[target] = len(insns)
+        insns.append(ins)
+
+    for node in reversed(_reachable(entry)):
+        if _is_ret(node):
+            ins = (node.code, 0, 0, node.k)
+        elif node.code == _JA:
+            ins = (_JA, 0, 0, offset(node.jt))
+        elif _is_cond(node):
+            for target in node.targets():
+                if offset(target) > _MAX_OFFSET:
+                    trampoline(target)
+            ins = (node.code, offset(node.jt), offset(node.jf), node.k)
+        else:
+            # the successor must follow
+            if nearest[node.jt] != len(insns) - 1:
+                trampoline(node.jt)
+            ins = (node.code, 0, 0, node.k)
+        nearest[node] = len(insns)
+        insns.append(ins)
+    insns.reverse()
+    return insns
+
+
+def optimize(bpf, native=None):
+    """Optimize a seccomp BPF program, returns the new program as bytes
+
+    native is the ScmpArch that is moved to the front of the arch dispatch.
+    The result is never longer than the input program.
+    """
+    # merge first, so equal fragments become equal jump targets
+    entry = _merge(_thread(_graph(decode(bpf))))
+    audit = None if native is None else _audit_arch(ScmpArch(native))
+    dispatch = _dispatch_native(entry, audit)
+    _coalesce(entry, dispatch)
+    entry = _merge(_thread(entry))
+    result = encode(_layout(entry))
+    if len(result) > len(bpf):
+        return bytes(bpf)
+    return result
+
+
+def stats(bpf):
+    """Number of instructions and instructions on the longest path"""
+    insns = decode(bpf)
+    longest = [0] * len(insns)
+    for i in reversed(range(len(insns))):
+        following = successors(i, *insns[i])
+        longest[i] = 1 + max(
+            (longest[j] for j in following if j < len(insns)), default=0
+        )
+    return ProgramStats(len(insns), longest[0] if insns else 0)
+
+
+def _arg_values(insns):
+    """(offset, value) of comparisons with argument words"""
+    result = set()
+    for (code, _, _, k), sources in zip(insns, accumulators(insns)):
+        if code & 0x07 != BPF_JMP or code == _JA or code & BPF_X:
+            continue
+        for source in sources:
+            if source is not None and source[0] == "ld" and source[1] >= _ARGS:
+                for value in (k - 1, k, k + 1):
+                    result.add((source[1], value & 0xFFFFFFFF))
+    return result
+
+
+def _syscall_numbers(insns, arch):
+    """All syscall numbers of arch and compared numbers"""
+    numbers = get_table().numbers(arch).values()
+    base = _X32_SYSCALL_BIT if arch == ScmpArch.SCMP_ARCH_X32 else 0
+    result = set(range(base, max(numbers, default=base) + 2))
+    for (code, _, _, k), sources in zip(insns, accumulators(insns)):
+        if code & 0x07 == BPF_JMP and code != _JA and ("ld", _NR) in sources:
+            result.update((k - 1, k, k + 1))
+    # seccomp_data.nr is a signed int
+    return sorted(((nr & 0xFFFFFFFF) ^ 0x80000000) - 0x80000000 for nr in result | {-1})
+
+
+def verify(before, after, arches=(ScmpArch.SCMP_ARCH_NATIVE,), samples=8, seed=0):
+    """Compare the results of two programs, returns a list of Mismatch
+
+    Every syscall number of the architectures up to the highest number plus
+    one and all compared numbers are evaluated with arguments 0, also with
+    an architecture that is not part of the filter. Syscalls for which one
+    of the programs loads an argument are evaluated again with the compared
+    argument values (and their neighbours) and samples random arguments.
+    """
+    programs = (decode(before), decode(after))
+    arg_loads = [
+        {
+            i
+            for i, (code, _, _, k) in enumerate(insns)
+            if code == _LD_W_ABS and k >= _ARGS
+        }
+        for insns in programs
+    ]
+    overrides = sorted(_arg_values(programs[0]) | _arg_values(programs[1]))
+    rng = random.Random(seed)
+    randoms = [tuple(rng.getrandbits(64) for _ in range(6)) for _ in range(samples)] + [
+        (0xFFFFFFFFFFFFFFFF,) * 6
+    ]
+
+    cases = []
+    for arch in tuple(arches) + (None,):
+        if arch is None:
+            audit = 0
+            numbers = [0, 1, -1]
+        else:
+            if arch == ScmpArch.SCMP_ARCH_NATIVE:
+                arch = native_arch()
+            arch = ScmpArch(arch)
+            audit = _audit_arch(arch)
+            numbers = set(_syscall_numbers(programs[0], arch))
+            numbers.update(_syscall_numbers(programs[1], arch))
+        cases.extend((audit, nr) for nr in sorted(numbers))
+
+    mismatches = []
+
+    def compare(data):
+        traces = ([], [])
+        results = [
+            evaluate(bpf, data, trace) for bpf, trace in zip((before, after), traces)
+        ]
+        if results[0] != results[1]:
+            mismatches.append(Mismatch(data, results[0], results[1]))
+        return any(
+            pc in loads for trace, loads in zip(traces, arg_loads) for pc in trace
+        )
+
+    for audit, nr in cases:
+        if not compare(seccomp_data(nr, audit)):
+            continue
+        for args in randoms:
+            compare(seccomp_data(nr, audit, 0, args))
+        for offset, value in overrides:
+            data = seccomp_data(nr, audit)
+            buf = bytearray(data)
+            _WORD.pack_into(buf, offset, value)
+            compare(seccomp_data.from_buffer_copy(buf))
+    return mismatches
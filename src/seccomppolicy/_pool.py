@@ -0,0 +1,195 @@
+import contextlib
+import threading
+
+from ._libseccomp import ScmpArg
+from ._seccomp import Seccomp, Syscall
+
+__all__ = ("PreparedRules", "SeccompPool")
+
+
+class PreparedRules:
+    """Rules with resolved syscall numbers and prebuilt argument arrays
+
+    Name resolution and ScmpArg arrays are done once. Applying the rules to a
+    filter is a plain loop over seccomp_rule_add_array() calls. key is a
+    hashable summary of architectures and rules, equal rules have equal keys.
+    """
+
+    __slots__ = ("arches", "key", "_rules")
+
+    def __init__(self, rules, arches=()):
+        self.arches = tuple(arches)
+        arrays = {}
+        prepared = []
+        keys = []
+        for action, syscall, args in rules:
+            if not isinstance(syscall, Syscall):
+                syscall = Syscall(syscall)
+            # identical argument lists share one array
+            key = tuple(args)
+            array = arrays.get(key)
+            if array is None:
+                array = arrays[key] = ScmpArg.toarray(*key)
+            prepared.append((action, syscall.nr, array))
+            keys.append((int(action), syscall.nr, key))
+        self._rules = tuple(prepared)
+        self.key = (tuple(int(arch) for arch in self.arches), tuple(keys))
+
+    @classmethod
+    def from_policy(cls, policy, arches=(), unconditional=False):
+        """Prepare rules of a Policy
+
+        Rules with the default action are dropped, libseccomp rejects them
+        (EACCES) and they do not change the filter, e.g. an SCMP_ACT_ERRNO
+        rule in a profile with SCMP_ACT_ERRNO default. With
+        unconditional=True only rules without argument comparisons are
+        used, e.g. for a shared base template.
+        """
+        default_action = policy.default_action
+        rules = [rule for rule in policy.rules if rule.action != default_action]
+        if unconditional:
+            rules = [rule for rule in rules if not rule.args]
+        return cls(rules, arches)
+
+    def __len__(self):
+        return len(self._rules)
+
+    def apply(self, sc):
+        """Add architectures and rules to an entered Seccomp filter"""
+        for arch in self.arches:
+            sc.add_arch(arch)
+        sc.add_rules(self._rules)
+
+
+class _PooledSeccomp(Seccomp):
+    """Filter context of a SeccompPool
+
+    The context remembers the key of the delta it was built for and is
+    read-only while it holds a variant, so it can be handed out again for an
+    equal delta.
+    """
+
+    __slots__ = ("_delta",)
+
+    def __init__(self, default_action):
+        super().__init__(default_action)
+        self._delta = None
+
+    def _check_writable(self):
+        if self._delta is not None:
+            raise RuntimeError("pooled filter is read-only")
+
+    def reset(self, default_action=None):
+        self._check_writable()
+        super().reset(default_action)
+
+    def merge(self, other):
+        self._check_writable()
+        super().merge(other)
+
+    def set_attr(self, attr, value):
+        self._check_writable()
+        super().set_attr(attr, value)
+
+    def add_arch(self, arch):
+        self._check_writable()
+        super().add_arch(arch)
+
+    def _add_rule(self, action, syscall, args, func):
+        self._check_writable()
+        return super()._add_rule(action, syscall, args, func)
+
+    def add_rules(self, rules, exact=False):
+        self._check_writable()
+        return super().add_rules(rules, exact)
+
+
+class SeccompPool:
+    """Pool of reusable filter contexts derived from a base template
+
+    Each variant starts with the rules of the base template followed by the
+    rules of a small delta. Adding the rules is the expensive part, so an
+    idle context that was built for an equal delta is handed out again as it
+    is. Up to maxsize built variants are kept, least recently used contexts
+    are recycled with seccomp_reset() and rebuilt. Filters of a pool are
+    read-only.
+
+    libseccomp cannot copy a filter or remove rules, every variant that is
+    not in the pool is built from scratch. The pool only pays off when
+    deltas repeat, e.g. tenants with the same capability set. It gives no
+    speedup for more distinct deltas than maxsize.
+    """
+
+    __slots__ = ("_default_action", "_base", "_maxsize", "_idle", "_lock")
+
+    def __init__(self, default_action, base, maxsize=4):
+        if not isinstance(base, PreparedRules):
+            base = PreparedRules(base)
+        self._default_action = default_action
+        self._base = base
+        self._maxsize = maxsize
+        # least recently used first
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _acquire(self, delta):
+        with self._lock:
+            for i in range(len(self._idle) - 1, -1, -1):
+                if self._idle[i]._delta == delta.key:
+                    return self._idle.pop(i)
+            if len(self._idle) >= self._maxsize:
+                sc = self._idle.pop(0)
+            else:
+                sc = None
+        if sc is None:
+            sc = _PooledSeccomp(self._default_action).__enter__()
+        else:
+            sc._delta = None
+            sc.reset(self._default_action)
+        try:
+            self._base.apply(sc)
+            delta.apply(sc)
+        except BaseException:
+            sc.__exit__(None, None, None)
+            raise
+        sc._delta = delta.key
+        return sc
+
+    def _release(self, sc):
+        with self._lock:
+            self._idle.append(sc)
+            if len(self._idle) <= self._maxsize:
+                return
+            sc = self._idle.pop(0)
+        sc.__exit__(None, None, None)
+
+    @contextlib.contextmanager
+    def variant(self, delta=()):
+        """Build a filter from base template and delta rules
+
+        delta is either a PreparedRules object (recommended for deltas that
+        are used more than once) or an iterable of Rule objects. Deltas with
+        equal rules share a pooled filter. The filter is read-only and only
+        valid inside the with block.
+        """
+        if not isinstance(delta, PreparedRules):
+            delta = PreparedRules(delta)
+        sc = self._acquire(delta)
+        try:
+            yield sc
+        finally:
+            self._release(sc)
+
+    def close(self):
+        """Release all idle filter contexts"""
+        with self._lock:
+            idle = self._idle
+            self._idle = []
+        for sc in idle:
+            sc.__exit__(None, None, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,277 @@
+import collections
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import types
+
+from . import __version__
+from ._constants import Capabilities, ScmpAction, ScmpArch, ScmpCmp
+from ._containerpolicy import loads
+from ._libseccomp import ScmpArg
+from ._seccomp import Syscall
+
+__all__ = ("CacheInfo", "ProfileCache", "freeze", "load_file_cached")
+
+# bump when the serialized form changes
+_FORMAT = 1
+
+CacheInfo = collections.namedtuple("CacheInfo", "hits hash_hits misses currsize")
+
+
+def _frozen_condition(cond):
+    return types.MappingProxyType(
+        {
+            key: tuple(value) if key != "minKernel" else value
+            for key, value in cond.items()
+        }
+    )
+
+
+def freeze(config):
+    """Convert a parsed profile into an immutable mapping
+
+    Lists become tuples and dicts read-only mapping proxies. The result is a
+    drop-in replacement for the return value of load_file().
+    """
+    syscalls = tuple(
+        types.MappingProxyType(
+            dict(
+                action=ruleset["action"],
+                args=tuple(ruleset["args"]),
+                comment=ruleset["comment"],
+                names=tuple(ruleset["names"]),
+                includes=_frozen_condition(ruleset["includes"]),
+                excludes=_frozen_condition(ruleset["excludes"]),
+            )
+        )
+        for ruleset in config["syscalls"]
+    )
+    archmap = types.MappingProxyType(
+        {arch: tuple(sub) for arch, sub in config["archmap"].items()}
+    )
+    return types.MappingProxyType(
+        dict(
+            default_action=config["default_action"], archmap=archmap, syscalls=syscalls
+        )
+    )
+
+
+def _dump_condition(cond):
+    result = {}
+    for key, value in cond.items():
+        result[key] = value if key == "minKernel" else [int(v) for v in value]
+    return result
+
+
+def _load_condition(cond):
+    result = {}
+    for key, value in cond.items():
+        if key == "caps":
+            result[key] = [Capabilities(v) for v in value]
+        elif key == "arches":
+            result[key] = [ScmpArch(v) for v in value]
+        else:
+            result[key] = value
+    return result
+
+
+def _dumps(config):
+    """Serialize a parsed profile to JSON with resolved enum values"""
+    return json.dumps(
+        {
+            "format": _FORMAT,
+            "version": __version__,
+            "default_action": int(config["default_action"]),
+            "archmap": [
+                [int(arch), [int(sub) for sub in subs]]
+                for arch, subs in config["archmap"].items()
+            ],
+            "syscalls": [
+                {
+                    "action": int(ruleset["action"]),
+                    "args": [list(arg.key()) for arg in ruleset["args"]],
+                    "comment": ruleset["comment"],
+                    "names": [syscall.name for syscall in ruleset["names"]],
+                    "includes": _dump_condition(ruleset["includes"]),
+                    "excludes": _dump_condition(ruleset["excludes"]),
+                }
+                for ruleset in config["syscalls"]
+            ],
+        },
+        sort_keys=True,
+    )
+
+
+def _loads(text):
+    data = json.loads(text)
+    if data["format"] != _FORMAT or data["version"] != __version__:
+        raise ValueError("incompatible profile cache")
+    return dict(
+        default_action=ScmpAction(data["default_action"]),
+        archmap={
+            ScmpArch(arch): [ScmpArch(sub) for sub in subs]
+            for arch, subs in data["archmap"]
+        },
+        syscalls=[
+            dict(
+                action=ScmpAction(ruleset["action"]),
+                args=[
+                    ScmpArg(arg, ScmpCmp(op), datum_a, datum_b)
+                    for arg, op, datum_a, datum_b in ruleset["args"]
+                ],
+                comment=ruleset["comment"],
+                names=[Syscall(name) for name in ruleset["names"]],
+                includes=_load_condition(ruleset["includes"]),
+                excludes=_load_condition(ruleset["excludes"]),
+            )
+            for ruleset in data["syscalls"]
+        ],
+    )
+
+
+class ProfileCache:
+    """Cache of parsed container profiles
+
+    Profiles are looked up by file identity (path, st_dev, st_ino,
+    st_mtime_ns, st_size). On a miss, the file content is hashed and looked
+    up by its sha256 digest, so a copied or touched file is not parsed again.
+    Parsed profiles are frozen (see freeze()) and kept in a bounded LRU.
+
+    With cache_dir, parsed profiles are also stored on disk as JSON, keyed by
+    content digest, for reuse by other processes.
+    """
+
+    __slots__ = (
+        "_maxsize",
+        "_cache_dir",
+        "_identities",
+        "_profiles",
+        "_lock",
+        "_hits",
+        "_hash_hits",
+        "_misses",
+    )
+
+    def __init__(self, maxsize=32, cache_dir=None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be positive")
+        self._maxsize = maxsize
+        self._cache_dir = cache_dir
+        # file identity -> content digest
+        self._identities = {}
+        # content digest -> frozen profile, in LRU order
+        self._profiles = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = self._hash_hits = self._misses = 0
+
+    def _lookup(self, key):
+        # caller holds the lock
+        profile = self._profiles.get(key)
+        if profile is not None:
+            self._profiles.move_to_end(key)
+        return profile
+
+    def _store(self, identity, digest, profile):
+        with self._lock:
+            self._identities[identity] = digest
+            self._profiles[digest] = profile
+            self._profiles.move_to_end(digest)
+            while len(self._profiles) > self._maxsize:
+                self._profiles.popitem(last=False)
+            if len(self._identities) > 2 * self._maxsize:
+                # forget identities of evicted profiles
+                self._identities = {
+                    key: value
+                    for key, value in self._identities.items()
+                    if value in self._profiles
+                }
+
+    def load(self, fname):
+        """Load and parse a profile, return a frozen profile"""
+        with open(fname, "rb") as f:
+            st = os.fstat(f.fileno())
+            identity = (
+                os.path.abspath(fname),
+                st.st_dev,
+                st.st_ino,
+                st.st_mtime_ns,
+                st.st_size,
+            )
+            with self._lock:
+                digest = self._identities.get(identity)
+                if digest is not None:
+                    profile = self._lookup(digest)
+                    if profile is not None:
+                        self._hits += 1
+                        return profile
+            data = f.read()
+
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            profile = self._lookup(digest)
+            if profile is not None:
+                self._hash_hits += 1
+                self._identities[identity] = digest
+                return profile
+            self._misses += 1
+
+        profile = self._read_disk(digest)
+        if profile is None:
+            config = loads(data)
+            self._write_disk(digest, config)
+            profile = freeze(config)
+        self._store(identity, digest, profile)
+        return profile
+
+    def _disk_file(self, digest):
+        return os.path.join(self._cache_dir, "profile-{}.json".format(digest))
+
+    def _read_disk(self, digest):
+        if self._cache_dir is None:
+            return None
+        try:
+            with open(self._disk_file(digest)) as f:
+                return freeze(_loads(f.read()))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write_disk(self, digest, config):
+        if self._cache_dir is None:
+            return
+        filename = self._disk_file(digest)
+        try:
+            os.makedirs(self._cache_dir, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self._cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    f.write(_dumps(config))
+                os.replace(tmp, filename)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        except OSError:
+            # cache is optional
+            pass
+
+    def cache_info(self):
+        with self._lock:
+            return CacheInfo(
+                self._hits, self._hash_hits, self._misses, len(self._profiles)
+            )
+
+    def clear(self):
+        """Clear in-memory cache, keeps the on-disk cache"""
+        with self._lock:
+            self._identities.clear()
+            self._profiles.clear()
+            self._hits = self._hash_hits = self._misses = 0
+
+
+_default_cache = ProfileCache()
+
+
+def load_file_cached(fname):
+    """load_file() with the process-wide ProfileCache"""
+    return _default_cache.load(fname)
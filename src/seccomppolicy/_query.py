@@ -0,0 +1,218 @@
+import collections
+import threading
+
+from packaging.version import Version
+
+from ._analysis import prune
+from ._capprofile import mask_to_caps, snapshot
+from ._constants import ScmpAction, ScmpArch
+from . import _defaultpolicy
+from . import _features
+from ._containerpolicy import ExcludeCondition, IncludeCondition, _kernel_version
+from ._seccomp import NATIVE_ARCH
+from ._syscalltable import get_table
+
+__all__ = ("Candidate", "Decision", "HostFacts", "PolicyIndex")
+
+# ruleset of a syscall: position of the ruleset in the profile, action,
+# argument comparisons, IncludeCondition / ExcludeCondition or None, comment
+Candidate = collections.namedtuple(
+    "Candidate", "position action args includes excludes comment"
+)
+
+# result of a query, candidate is None for the default and badarch action
+Decision = collections.namedtuple("Decision", "action candidate")
+
+
+class HostFacts(collections.namedtuple("HostFacts", "arch caps kernel")):
+    """Host on which a policy is evaluated
+
+    arch is the native architecture of the container runtime, caps the
+    effective capabilities of the container and kernel the Kernel release
+    (a string or packaging Version). None selects the current process.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, arch=None, caps=None, kernel=None):
+        if arch is None or arch == ScmpArch.SCMP_ARCH_NATIVE:
+            arch = NATIVE_ARCH
+        if caps is None:
+            caps = mask_to_caps(snapshot().effective)
+        if kernel is None:
+            kernel = _features.probe().kernel
+        if not isinstance(kernel, Version):
+            kernel = _kernel_version(kernel)
+        return super().__new__(cls, ScmpArch(arch), frozenset(caps), kernel)
+
+    @classmethod
+    def current(cls):
+        """Facts of the current process"""
+        return cls()
+
+
+def _applies(candidate, facts):
+    includes = candidate.includes
+    if includes is not None and not includes.check(*facts):
+        return False
+    excludes = candidate.excludes
+    if excludes is not None and excludes.check(*facts):
+        return False
+    return True
+
+
+def _rule(candidate):
+    return candidate.action, candidate.args
+
+
+class PolicyIndex:
+    """Index of a container policy by architecture and syscall number
+
+    Maps (arch, nr) to the ordered candidate rulesets of a syscall, so a
+    query only evaluates the rulesets of the queried syscall. Includes and
+    excludes are evaluated per query against HostFacts, the applicable
+    rulesets are resolved in the order of the compiled filter like
+    _analysis.prune(). Resolved orders are cached by the applicable
+    rulesets.
+
+    Arches are indexed on first use. Syscall numbers are the direct numbers
+    of the syscall table, multiplexed socketcall() is not modelled.
+    """
+
+    __slots__ = (
+        "default_action",
+        "archmap",
+        "badarch",
+        "_syscalls",
+        "_index",
+        "_orders",
+        "_lock",
+    )
+
+    def __init__(
+        self,
+        syscalls,
+        default_action=_defaultpolicy.DEFAULT_ACTION,
+        archmap=None,
+        badarch=ScmpAction.SCMP_ACT_KILL_THREAD,
+    ):
+        self.default_action = default_action
+        self.archmap = {
+            arch: frozenset(subarches) for arch, subarches in (archmap or {}).items()
+        }
+        self.badarch = badarch
+        self._syscalls = tuple(syscalls)
+        # arch -> (names, {nr: candidates})
+        self._index = {}
+        # applicable candidates -> candidates in evaluation order
+        self._orders = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        """Index a load_file() or loads() result"""
+        return cls(
+            config["syscalls"], config["default_action"], config["archmap"], **kwargs
+        )
+
+    @classmethod
+    def default(cls, **kwargs):
+        """Index the built-in default policy"""
+        return cls(
+            _defaultpolicy.SYSCALLS,
+            _defaultpolicy.DEFAULT_ACTION,
+            _defaultpolicy.SUB_ARCHITECTURES,
+            **kwargs
+        )
+
+    def _build(self, arch):
+        names = get_table().numbers(arch)
+        table = collections.defaultdict(list)
+        for position, ruleset in enumerate(self._syscalls):
+            includes = ruleset.get("includes")
+            excludes = ruleset.get("excludes")
+            candidate = Candidate(
+                position,
+                ruleset["action"],
+                tuple(ruleset.get("args") or ()),
+                IncludeCondition(**includes) if includes else None,
+                ExcludeCondition(**excludes) if excludes else None,
+                ruleset.get("comment", ""),
+            )
+            for name in ruleset["names"]:
+                # str or Syscall
+                nr = names.get(getattr(name, "name", name))
+                if nr is not None:
+                    table[nr].append(candidate)
+        return names, {nr: tuple(candidates) for nr, candidates in table.items()}
+
+    def _arch(self, arch):
+        if arch == ScmpArch.SCMP_ARCH_NATIVE:
+            arch = NATIVE_ARCH
+        result = self._index.get(arch)
+        if result is None:
+            with self._lock:
+                result = self._index.get(arch)
+                if result is None:
+                    result = self._index[arch] = self._build(arch)
+        return result
+
+    def _nr(self, names, syscall):
+        if isinstance(syscall, int):
+            return syscall
+        name = getattr(syscall, "name", syscall)
+        try:
+            return names[name]
+        except KeyError:
+            raise ValueError("unknown syscall {!r}".format(name)) from None
+
+    def candidates(self, syscall, arch=ScmpArch.SCMP_ARCH_NATIVE):
+        """All rulesets of a syscall in profile order, conditions unevaluated"""
+        names, table = self._arch(arch)
+        return table.get(self._nr(names, syscall), ())
+
+    def query(self, syscall, args=(), arch=None, facts=None):
+        """Action for a syscall with argument values on an arch
+
+        syscall is a name, Syscall or number, args up to six argument values
+        (missing values are 0) and arch defaults to the native arch of the
+        facts. Returns a Decision.
+        """
+        if facts is None:
+            facts = HostFacts.current()
+        if arch is None:
+            arch = facts.arch
+        elif arch == ScmpArch.SCMP_ARCH_NATIVE:
+            arch = NATIVE_ARCH
+        if arch != facts.arch and arch not in self.archmap.get(facts.arch, ()):
+            # architecture is not part of the filter
+            return Decision(self.badarch, None)
+        names, table = self._arch(arch)
+        candidates = table.get(self._nr(names, syscall))
+        if not candidates:
+            return Decision(self.default_action, None)
+        # libseccomp rejects rules with the default action
+        applicable = tuple(
+            c
+            for c in candidates
+            if c.action != self.default_action and _applies(c, facts)
+        )
+        order = self._orders.get(applicable)
+        if order is None:
+            order = self._orders[applicable] = tuple(prune(applicable, key=_rule))
+        values = tuple(args) + (0,) * (6 - len(args))
+        for candidate in order:
+            if all(arg.matches(values[arg.arg]) for arg in candidate.args):
+                return Decision(candidate.action, candidate)
+        return Decision(self.default_action, None)
+
+    def query_batch(self, queries, facts=None):
+        """Answer many queries for the same host
+
+        queries is an iterable of (syscall, args) or (syscall, args, arch)
+        tuples. Returns a list of Decisions in order.
+        """
+        if facts is None:
+            facts = HostFacts.current()
+        query = self.query
+        return [query(*q, facts=facts) for q in queries]
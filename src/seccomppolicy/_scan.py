@@ -0,0 +1,133 @@
+import collections
+import concurrent.futures
+import csv
+import json
+import os
+
+from ._capprofile import mask_to_caps
+
+__all__ = ("ProcStatus", "parse_status", "scan", "write_csv", "write_json")
+
+# seccomp and capability state of a process or thread
+ProcStatus = collections.namedtuple(
+    "ProcStatus",
+    "pid tid name seccomp filters no_new_privs "
+    "cap_inh cap_prm cap_eff cap_bnd cap_amb",
+)
+
+# /proc/PID/status field -> (ProcStatus field, parser)
+_FIELDS = {
+    b"Name": ("name", lambda value: value.decode("utf-8", "replace")),
+    b"Seccomp": ("seccomp", int),
+    b"Seccomp_filters": ("filters", int),
+    b"NoNewPrivs": ("no_new_privs", lambda value: value == b"1"),
+    b"CapInh": ("cap_inh", lambda value: int(value, 16)),
+    b"CapPrm": ("cap_prm", lambda value: int(value, 16)),
+    b"CapEff": ("cap_eff", lambda value: int(value, 16)),
+    b"CapBnd": ("cap_bnd", lambda value: int(value, 16)),
+    b"CapAmb": ("cap_amb", lambda value: int(value, 16)),
+}
+
+_CAP_FIELDS = ("cap_inh", "cap_prm", "cap_eff", "cap_bnd", "cap_amb")
+
+# status files are about 1.5 KiB
+_BUFSIZE = 16384
+
+
+def parse_status(data, pid, tid=None):
+    """Parse content of a /proc status file
+
+    Fields that are not provided by the Kernel are None, e.g. Seccomp_filters
+    on Kernels older than 5.9.
+    """
+    values = dict.fromkeys(ProcStatus._fields)
+    values["pid"] = pid
+    values["tid"] = pid if tid is None else tid
+    for line in data.split(b"\n"):
+        key, sep, value = line.partition(b":")
+        field = _FIELDS.get(key)
+        if field is not None:
+            values[field[0]] = field[1](value.strip())
+    return ProcStatus(**values)
+
+
+def _read(path):
+    """Read a /proc file with a single read(), None if the process is gone"""
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+    except (FileNotFoundError, ProcessLookupError):
+        return None
+    try:
+        return os.read(fd, _BUFSIZE)
+    except ProcessLookupError:
+        return None
+    finally:
+        os.close(fd)
+
+
+def _pids(proc):
+    return [int(name) for name in os.listdir(proc) if name.isdigit()]
+
+
+def _scan_pid(proc, pid, tasks):
+    results = []
+    data = _read("{}/{}/status".format(proc, pid))
+    if data is None:
+        return results
+    results.append(parse_status(data, pid))
+    if tasks:
+        try:
+            tids = _pids("{}/{}/task".format(proc, pid))
+        except (FileNotFoundError, ProcessLookupError):
+            return results
+        for tid in sorted(tids):
+            if tid == pid:
+                # main thread, already covered by process status
+                continue
+            data = _read("{}/{}/task/{}/status".format(proc, pid, tid))
+            if data is not None:
+                results.append(parse_status(data, pid, tid))
+    return results
+
+
+def scan(tasks=False, max_workers=None, proc="/proc"):
+    """Scan seccomp and capability state of all processes
+
+    With tasks=True, all threads of each process are scanned, too. Each
+    status file is read with one read() call, processes that exit during the
+    scan are skipped. Returns a list of ProcStatus sorted by pid and tid.
+    """
+    pids = sorted(_pids(proc))
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as pool:
+        chunks = pool.map(lambda pid: _scan_pid(proc, pid, tasks), pids)
+        return [status for chunk in chunks for status in chunk]
+
+
+def _record(status):
+    record = status._asdict()
+    for field in _CAP_FIELDS:
+        mask = record[field]
+        if mask is not None:
+            record[field] = [
+                cap.name if hasattr(cap, "name") else str(cap)
+                for cap in mask_to_caps(mask)
+            ]
+    return record
+
+
+def write_json(statuses, fileobj):
+    """Write statuses as JSON list, capability masks as lists of names"""
+    json.dump([_record(status) for status in statuses], fileobj, indent=2)
+    fileobj.write("\n")
+
+
+def write_csv(statuses, fileobj):
+    """Write statuses as CSV, capability names are separated by spaces"""
+    writer = csv.writer(fileobj)
+    writer.writerow(ProcStatus._fields)
+    for status in statuses:
+        record = _record(status)
+        for field in _CAP_FIELDS:
+            if record[field] is not None:
+                record[field] = " ".join(record[field])
+        writer.writerow(["" if value is None else value for value in record.values()])
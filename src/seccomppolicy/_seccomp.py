@@ -1,43 +1,158 @@
+import ctypes
+import errno
 import functools
 import tempfile
 
+from . import _features
 from . import _libseccomp as _lsc
+from ._bpf import TsyncError, fprog, install_fprog
 from ._libseccomp import ScmpArg
-from ._constants import ScmpArch
+from ._constants import ScmpArch, ScmpFilterAttr, SeccompFilterFlag
 
 __all__ = (
+    "RuleErrors",
     "ScmpArg",
     "Syscall",
     "Seccomp",
+    "TsyncError",
     "NATIVE_ARCH",
+    "install_fprog",
 )
 
 # current CPU arch
 NATIVE_ARCH = _lsc.seccomp_arch_native()
 
+# filter attributes that map to SECCOMP_FILTER_FLAG_*
+_ATTR_FLAGS = (
+    (ScmpFilterAttr.SCMP_FLTATR_CTL_TSYNC, SeccompFilterFlag.TSYNC),
+    (ScmpFilterAttr.SCMP_FLTATR_CTL_LOG, SeccompFilterFlag.LOG),
+    (ScmpFilterAttr.SCMP_FLTATR_CTL_SSB, SeccompFilterFlag.SPEC_ALLOW),
+)
+
+
+class RuleErrors(OSError):
+    """One or more rules could not be added
+
+    The failures attribute is a list of ((action, nr, args), errno) tuples.
+    errno is the errno of the first failure.
+    """
+
+    def __init__(self, failures):
+        super().__init__(
+            failures[0][1], "{} rule(s) could not be added".format(len(failures))
+        )
+        self.failures = failures
+
 
 class Seccomp:
-    __slots__ = ("_default_action", "_ctx")
+    """libseccomp filter context
+
+    With degrade=True, actions that are not available on the host are
+    replaced with the closest available action, e.g. KILL_PROCESS with
+    KILL_THREAD or LOG with ALLOW (see _features.probe()), and rules whose
+    resolved action equals the default action are skipped. By default
+    actions are used as given and libseccomp rejects such rules (EACCES).
 
-    def __init__(self, default_action):
+    With spec_allow=True, the filter is loaded with SCMP_FLTATR_CTL_SSB
+    (SECCOMP_FILTER_FLAG_SPEC_ALLOW) and the Kernel does not force the
+    speculative store bypass mitigation on the task. With degrade=True, the
+    option is ignored on Kernels without the flag.
+    """
+
+    __slots__ = ("_default_action", "_degrade", "_spec_allow", "_ctx")
+
+    def __init__(self, default_action, degrade=False, spec_allow=False):
         self._default_action = default_action
+        self._degrade = degrade
+        self._spec_allow = spec_allow
         self._ctx = None
 
     def __enter__(self):
         if self._ctx is not None:
             raise RuntimeError
-        self._ctx = _lsc.seccomp_init(self._default_action)
+        self._ctx = _lsc.seccomp_init(self.resolve_action(self._default_action))
+        try:
+            self._set_spec_allow()
+        except BaseException:
+            self.__exit__(None, None, None)
+            raise
         return self
 
+    def _set_spec_allow(self):
+        if not self._spec_allow:
+            return
+        if self._degrade and not _features.probe().has_flag(
+            SeccompFilterFlag.SPEC_ALLOW
+        ):
+            return
+        self.set_attr(ScmpFilterAttr.SCMP_FLTATR_CTL_SSB, 1)
+
     def __exit__(self, exc_type, exc_val, exc_tb):
         sc = self._ctx
         self._ctx = None
-        _lsc.seccomp_release(sc)
+        if sc is not None:
+            _lsc.seccomp_release(sc)
+
+    def reset(self, default_action=None):
+        """Reset filter to its initial state
+
+        Removes all rules and architectures, and resets attributes except
+        spec_allow. The context is reused instead of released and initialized
+        again.
+        """
+        if self._ctx is None:
+            # seccomp_reset(NULL, ...) resets libseccomp's global state
+            raise RuntimeError("filter is not initialized")
+        if default_action is not None:
+            self._default_action = default_action
+        _lsc.seccomp_reset(self._ctx, self.resolve_action(self._default_action))
+        self._set_spec_allow()
+
+    def merge(self, other):
+        """Merge rules of another filter into this filter
+
+        libseccomp requires that both filters have the same attributes and
+        no architecture in common. The other filter is consumed.
+        """
+        if self._ctx is None or other._ctx is None:
+            raise RuntimeError("filter is not initialized")
+        _lsc.seccomp_merge(self._ctx, other._ctx)
+        other._ctx = None
+
+    def get_attr(self, attr):
+        """Get filter attribute (ScmpFilterAttr)"""
+        value = ctypes.c_uint32()
+        _lsc.seccomp_attr_get(self._ctx, attr, ctypes.byref(value))
+        return value.value
+
+    def set_attr(self, attr, value):
+        """Set filter attribute (ScmpFilterAttr)"""
+        _lsc.seccomp_attr_set(self._ctx, attr, value)
 
     def add_arch(self, arch):
         _lsc.seccomp_arch_add(self._ctx, arch)
 
+    def resolve_action(self, action):
+        """Action that is used for the filter, degraded if not available"""
+        if self._degrade:
+            return _features.degrade_action(action)
+        return action
+
+    def _rule_action(self, action):
+        """Resolve rule action, returns None if rule is skipped
+
+        With degrade, rules with the default action are skipped, e.g. a LOG
+        rule that was degraded to ALLOW in a filter with ALLOW default.
+        """
+        resolved = self.resolve_action(action)
+        if self._degrade and resolved == self.resolve_action(self._default_action):
+            return None
+        return resolved
+
     def _add_rule(self, action, syscall, args, func):
+        action = self._rule_action(action)
+        if action is None:
+            return
         if not isinstance(syscall, Syscall):
             syscall = Syscall(syscall)
         arg_array = ScmpArg.toarray(*args)
@@ -52,6 +167,47 @@ class Seccomp:
     def add_rule_exact(self, action, syscall, *args):
         self._add_rule(action, syscall, args, _lsc.seccomp_rule_add_exact_array)
 
+    def add_rules(self, rules, exact=False):
+        """Add many rules in a tight loop
+
+        rules is an iterable of (action, nr, args) tuples with resolved
+        syscall numbers. args is a tuple of ScmpArg or a prebuilt ScmpArg
+        array. Identical argument tuples share one array. All rules are
+        tried, failures are reported together with RuleErrors. Returns the
+        number of added rules.
+        """
+        if exact:
+            func = _lsc.seccomp_rule_add_exact_array_unchecked
+        else:
+            func = _lsc.seccomp_rule_add_array_unchecked
+        ctx = self._ctx
+        rule_action = self._rule_action
+        actions = {}
+        arrays = {}
+        failures = []
+        added = 0
+        for action, nr, args in rules:
+            try:
+                resolved = actions[action]
+            except KeyError:
+                resolved = actions[action] = rule_action(action)
+            if resolved is None:
+                continue
+            if type(args) is tuple:
+                array = arrays.get(args)
+                if array is None:
+                    array = arrays[args] = ScmpArg.toarray(*args)
+            else:
+                array = args
+            result = func(ctx, resolved, nr, len(array), array)
+            if result:
+                failures.append(((action, nr, args), -result))
+            else:
+                added += 1
+        if failures:
+            raise RuleErrors(failures)
+        return added
+
     def _export(self, func):
         with tempfile.TemporaryFile() as f:
             func(self._ctx, f.fileno())
@@ -61,8 +217,52 @@ class Seccomp:
     def export_pfc(self):
         return self._export(_lsc.seccomp_export_pfc).decode("utf-8")
 
+    def export_bpf(self):
+        """Export BPF program as bytes (array of struct sock_filter)"""
+        return self._export(_lsc.seccomp_export_bpf)
+
+    def precompute(self):
+        """Generate BPF program ahead of load/export
+
+        No-op with libseccomp < 2.6.
+        """
+        if _lsc.seccomp_precompute is not None:
+            _lsc.seccomp_precompute(self._ctx)
+
+    def filter_flags(self):
+        """SECCOMP_FILTER_FLAG_* for the current filter attributes
+
+        SCMP_FLTATR_CTL_SSB is only queried with spec_allow, attributes that
+        libseccomp does not know (EINVAL) are not set.
+        """
+        flags = 0
+        for attr, flag in _ATTR_FLAGS:
+            if attr == ScmpFilterAttr.SCMP_FLTATR_CTL_SSB and not self._spec_allow:
+                continue
+            try:
+                value = self.get_attr(attr)
+            except OSError as e:
+                if e.errno != errno.EINVAL:
+                    raise
+                continue
+            if value:
+                flags |= flag
+        return flags
+
     def load(self):
-        _lsc.seccomp_load(self._ctx)
+        """Load filter into the Kernel
+
+        With SCMP_FLTATR_CTL_TSYNC the filter is applied to all threads of
+        the process. libseccomp does not report which thread failed to
+        synchronize, so TSYNC filters are exported and installed directly.
+        TsyncError carries the offending thread id.
+        """
+        if not self.get_attr(ScmpFilterAttr.SCMP_FLTATR_CTL_TSYNC):
+            _lsc.seccomp_load(self._ctx)
+            return
+        prog, filters = fprog(self.export_bpf())
+        no_new_privs = self.get_attr(ScmpFilterAttr.SCMP_FLTATR_CTL_NNP)
+        install_fprog(ctypes.addressof(prog), self.filter_flags(), no_new_privs)
 
 
 @functools.total_ordering
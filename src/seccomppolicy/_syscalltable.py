@@ -0,0 +1,393 @@
+"""Static syscall tables for all architectures
+
+The tables are generated from libseccomp with
+
+    python -m seccomppolicy._syscalltable [FILENAME]
+
+and resolve syscall names and numbers without libseccomp.
+"""
+
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+
+from ._constants import ScmpArch
+
+__all__ = (
+    "TABLE_FILE",
+    "TABLE_VERSION",
+    "SyscallTable",
+    "generate",
+    "get_table",
+    "native_arch",
+    "resolve_name",
+    "resolve_num",
+)
+
+TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "syscalls.bin")
+TABLE_MAGIC = b"SCMPSYSC"
+TABLE_VERSION = 1
+
+# __NR_SCMP_ERROR, name is unknown on an architecture
+NR_ERROR = -1
+
+# magic, version, arch count, name count, name blob size, libseccomp version
+_HEADER = struct.Struct("<8sHHII16s")
+_U32 = struct.Struct("<I")
+_I32 = struct.Struct("<i")
+# arch, offset of numbers, count of reverse entries
+_ARCH = struct.Struct("<III")
+# syscall number, name index
+_REVERSE = struct.Struct("<iI")
+
+# number ranges that are scanned for each architecture
+_SCAN_BASES = (0, 4000, 5000, 6000, 0x40000000, 0xF0000)
+_SCAN_SIZE = 1100
+
+# uname machine -> architecture of the running interpreter
+_MACHINES = {
+    "x86_64": ScmpArch.SCMP_ARCH_X86_64,
+    "amd64": ScmpArch.SCMP_ARCH_X86_64,
+    "i386": ScmpArch.SCMP_ARCH_X86,
+    "i486": ScmpArch.SCMP_ARCH_X86,
+    "i586": ScmpArch.SCMP_ARCH_X86,
+    "i686": ScmpArch.SCMP_ARCH_X86,
+    "aarch64": ScmpArch.SCMP_ARCH_AARCH64,
+    "armv8l": ScmpArch.SCMP_ARCH_ARM,
+    "armv7l": ScmpArch.SCMP_ARCH_ARM,
+    "armv6l": ScmpArch.SCMP_ARCH_ARM,
+    "ppc": ScmpArch.SCMP_ARCH_PPC,
+    "ppc64": ScmpArch.SCMP_ARCH_PPC64,
+    "ppc64le": ScmpArch.SCMP_ARCH_PPC64LE,
+    "s390": ScmpArch.SCMP_ARCH_S390,
+    "s390x": ScmpArch.SCMP_ARCH_S390X,
+    "riscv64": ScmpArch.SCMP_ARCH_RISCV64,
+    "parisc": ScmpArch.SCMP_ARCH_PARISC,
+    "parisc64": ScmpArch.SCMP_ARCH_PARISC64,
+}
+
+
+# 32bit interpreter on a 64bit Kernel -> compat architecture
+_COMPAT = {
+    ScmpArch.SCMP_ARCH_X86_64: ScmpArch.SCMP_ARCH_X86,
+    ScmpArch.SCMP_ARCH_AARCH64: ScmpArch.SCMP_ARCH_ARM,
+    ScmpArch.SCMP_ARCH_PPC64: ScmpArch.SCMP_ARCH_PPC,
+    ScmpArch.SCMP_ARCH_S390X: ScmpArch.SCMP_ARCH_S390,
+    ScmpArch.SCMP_ARCH_PARISC64: ScmpArch.SCMP_ARCH_PARISC,
+}
+
+# ELF header of the interpreter, e_flags is at offset 36 in 32bit ELF files
+_ELF_HEADER_SIZE = 52
+_ELFCLASS64 = 2
+_ELFDATA2LSB = 1
+_EM_X86_64 = 62
+_EF_MIPS_ABI2 = 0x20
+
+
+def _interpreter_elf():
+    """(is 64bit, e_machine, e_flags) of the interpreter or None"""
+    try:
+        with open(sys.executable, "rb") as f:
+            header = f.read(_ELF_HEADER_SIZE)
+    except OSError:
+        return None
+    if len(header) < _ELF_HEADER_SIZE or header[:4] != b"\x7fELF":
+        return None
+    order = "<" if header[5] == _ELFDATA2LSB else ">"
+    (machine,) = struct.unpack_from(order + "H", header, 18)
+    (flags,) = struct.unpack_from(order + "I", header, 36)
+    return header[4] == _ELFCLASS64, machine, flags
+
+
+def _machine():
+    """uname machine, platform.machine() costs milliseconds to import"""
+    return os.uname().machine
+
+
+def native_arch():
+    """Architecture of the running interpreter without libseccomp
+
+    The machine of the Kernel is refined with the ABI of the interpreter,
+    e.g. x32 or MIPS n32 binaries have 32bit pointers on a 64bit Kernel.
+    """
+    machine = _machine()
+    is64 = sys.maxsize > 2**32
+    if machine.startswith("mips"):
+        little = sys.byteorder == "little"
+        if is64:
+            return ScmpArch.SCMP_ARCH_MIPSEL64 if little else ScmpArch.SCMP_ARCH_MIPS64
+        elf = _interpreter_elf()
+        if machine.startswith("mips64") and elf and elf[2] & _EF_MIPS_ABI2:
+            if little:
+                return ScmpArch.SCMP_ARCH_MIPSEL64N32
+            return ScmpArch.SCMP_ARCH_MIPS64N32
+        return ScmpArch.SCMP_ARCH_MIPSEL if little else ScmpArch.SCMP_ARCH_MIPS
+    try:
+        arch = _MACHINES[machine]
+    except KeyError:
+        raise ValueError("unsupported machine {}".format(machine)) from None
+    if not is64 and arch in _COMPAT:
+        elf = _interpreter_elf()
+        if arch == ScmpArch.SCMP_ARCH_X86_64 and elf and elf[1] == _EM_X86_64:
+            return ScmpArch.SCMP_ARCH_X32
+        return _COMPAT[arch]
+    return arch
+
+
+class SyscallTable:
+    """Memory mapped syscall tables
+
+    Names are stored once, sorted, with an offset index. Each architecture
+    has an array of syscall numbers in name order and a reverse index sorted
+    by number. Lookups are binary searches in the mapping, nothing is
+    decoded up front.
+    """
+
+    __slots__ = (
+        "libseccomp",
+        "_mmap",
+        "_nnames",
+        "_names_offset",
+        "_blob_offset",
+        "_arches",
+    )
+
+    def __init__(self, filename=TABLE_FILE):
+        with open(filename, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._parse()
+        except BaseException:
+            self._mmap.close()
+            raise
+
+    def _parse(self):
+        mm = self._mmap
+        if len(mm) < _HEADER.size:
+            raise ValueError("syscall table is truncated")
+        magic, version, narches, nnames, blob_size, lsc = _HEADER.unpack_from(mm, 0)
+        if magic != TABLE_MAGIC:
+            raise ValueError("not a syscall table")
+        if version != TABLE_VERSION:
+            raise ValueError("unsupported syscall table version {}".format(version))
+        self.libseccomp = lsc.rstrip(b"\0").decode("ascii")
+        self._nnames = nnames
+        self._names_offset = _HEADER.size
+        self._blob_offset = self._names_offset + nnames * _U32.size
+        offset = _align4(self._blob_offset + blob_size)
+        arches = {}
+        for i in range(narches):
+            arch, numbers, nreverse = _ARCH.unpack_from(mm, offset + i * _ARCH.size)
+            reverse = numbers + nnames * _I32.size
+            if reverse + nreverse * _REVERSE.size > len(mm):
+                raise ValueError("syscall table is truncated")
+            arches[arch] = (numbers, reverse, nreverse)
+        self._arches = arches
+
+    @property
+    def arches(self):
+        return tuple(ScmpArch(arch) for arch in self._arches)
+
+    def _arch(self, arch):
+        if arch == ScmpArch.SCMP_ARCH_NATIVE:
+            arch = native_arch()
+        try:
+            return self._arches[arch]
+        except KeyError:
+            raise ValueError("no syscall table for {!r}".format(arch)) from None
+
+    def _name(self, index):
+        mm = self._mmap
+        start = (
+            self._blob_offset
+            + _U32.unpack_from(mm, self._names_offset + index * _U32.size)[0]
+        )
+        end = mm.find(b"\0", start)
+        return mm[start:end]
+
+    def _name_index(self, name):
+        lo, hi = 0, self._nnames
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name(mid) < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._nnames and self._name(lo) == name:
+            return lo
+        return None
+
+    def names(self):
+        """Sorted list of all known syscall names"""
+        return [self._name(i).decode("ascii") for i in range(self._nnames)]
+
+    def resolve_name(self, name, arch=ScmpArch.SCMP_ARCH_NATIVE):
+        """Syscall number of a name, negative for pseudo syscalls
+
+        Raises ValueError for unknown names like
+        seccomp_syscall_resolve_name_arch().
+        """
+        numbers = self._arch(arch)[0]
+        index = self._name_index(name.encode("ascii"))
+        if index is None:
+            raise ValueError((arch, name))
+        nr = _I32.unpack_from(self._mmap, numbers + index * _I32.size)[0]
+        if nr == NR_ERROR:
+            raise ValueError((arch, name))
+        return nr
+
+    def resolve_num(self, nr, arch=ScmpArch.SCMP_ARCH_NATIVE):
+        """Syscall name of a number, raises ValueError for unknown numbers"""
+        _, reverse, nreverse = self._arch(arch)
+        mm = self._mmap
+        lo, hi = 0, nreverse
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _REVERSE.unpack_from(mm, reverse + mid * _REVERSE.size)[0] < nr:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < nreverse:
+            found, index = _REVERSE.unpack_from(mm, reverse + lo * _REVERSE.size)
+            if found == nr:
+                return self._name(index).decode("ascii")
+        raise ValueError((arch, nr))
+
+    def numbers(self, arch=ScmpArch.SCMP_ARCH_NATIVE):
+        """Map names to syscall numbers, without pseudo syscalls
+
+        Multiplexed syscalls like socket() on x86 have a pseudo number but
+        also a direct syscall number on newer Kernels, the mapping contains
+        the direct number.
+        """
+        _, reverse, nreverse = self._arch(arch)
+        result = {}
+        for i in range(nreverse):
+            nr, index = _REVERSE.unpack_from(self._mmap, reverse + i * _REVERSE.size)
+            result[self._name(index).decode("ascii")] = nr
+        return result
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _align4(offset):
+    return (offset + 3) & ~3
+
+
+_table = None
+_lock = threading.Lock()
+
+
+def get_table():
+    """Process-wide SyscallTable of the package, mapped on first use"""
+    global _table
+    table = _table
+    if table is None:
+        with _lock:
+            if _table is None:
+                _table = SyscallTable()
+            table = _table
+    return table
+
+
+def resolve_name(name, arch=ScmpArch.SCMP_ARCH_NATIVE):
+    return get_table().resolve_name(name, arch)
+
+
+def resolve_num(nr, arch=ScmpArch.SCMP_ARCH_NATIVE):
+    return get_table().resolve_num(nr, arch)
+
+
+def _scan(lsc, arch):
+    """Map syscall numbers of an architecture to names with libseccomp"""
+    result = {}
+    for base in _SCAN_BASES:
+        for nr in range(base, base + _SCAN_SIZE):
+            try:
+                result[nr] = lsc.seccomp_syscall_resolve_num_arch(arch, nr)
+            except ValueError:
+                pass
+    return result
+
+
+def generate(filename=TABLE_FILE):
+    """Generate syscall tables for all ScmpArch members with libseccomp"""
+    from . import _libseccomp as lsc
+
+    scans = {}
+    for arch in ScmpArch:
+        if arch == ScmpArch.SCMP_ARCH_NATIVE:
+            continue
+        scan = _scan(lsc, arch)
+        # skip architectures that are unknown to libseccomp
+        if scan:
+            scans[arch] = scan
+    names = sorted({name for scan in scans.values() for name in scan.values()})
+    encoded = [name.encode("ascii") for name in names]
+
+    offsets = []
+    blob = bytearray()
+    for name in encoded:
+        offsets.append(len(blob))
+        blob += name + b"\0"
+
+    tables = []
+    for arch, scan in sorted(scans.items()):
+        numbers = []
+        for name in encoded:
+            try:
+                numbers.append(lsc.seccomp_syscall_resolve_name_arch(arch, name))
+            except ValueError:
+                numbers.append(NR_ERROR)
+        index = {name: i for i, name in enumerate(names)}
+        reverse = sorted((nr, index[name]) for nr, name in scan.items())
+        tables.append((arch, numbers, reverse))
+
+    buf = bytearray(
+        _HEADER.pack(
+            TABLE_MAGIC,
+            TABLE_VERSION,
+            len(tables),
+            len(names),
+            len(blob),
+            str(lsc.seccomp_version().contents).encode("ascii"),
+        )
+    )
+    for offset in offsets:
+        buf += _U32.pack(offset)
+    buf += blob
+    buf += b"\0" * (_align4(len(buf)) - len(buf))
+    data_offset = len(buf) + len(tables) * _ARCH.size
+    for arch, numbers, reverse in tables:
+        buf += _ARCH.pack(arch, data_offset, len(reverse))
+        data_offset += len(numbers) * _I32.size + len(reverse) * _REVERSE.size
+    for arch, numbers, reverse in tables:
+        for nr in numbers:
+            buf += _I32.pack(nr)
+        for entry in reverse:
+            buf += _REVERSE.pack(*entry)
+
+    dirname = os.path.dirname(os.path.abspath(filename))
+    fd, tmp = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            os.fchmod(f.fileno(), 0o644)
+            f.write(buf)
+        os.replace(tmp, filename)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+if __name__ == "__main__":
+    generate(*sys.argv[1:])
@@ -0,0 +1,248 @@
+import bisect
+import collections
+import struct
+
+from ._bpf import BPF_JA, BPF_JMP, BPF_RET, BPF_X, accumulators, decode
+from ._compiled import CompiledPolicy, build
+from ._constants import SECCOMP_RET_DATA, ScmpAction
+
+__all__ = (
+    "DATUM",
+    "ERRNO",
+    "TRACE",
+    "FilterTemplate",
+    "LayoutError",
+    "ParamKind",
+)
+
+MAX_ERRNO = 4095
+
+# kind of a template parameter: sentinel values of the two probe builds,
+# largest value and encoding of a value as BPF immediate
+ParamKind = collections.namedtuple("ParamKind", "name base_a base_b maximum encode")
+
+# errno of SCMP_ACT_ERRNO, libseccomp rejects values above MAX_ERRNO
+ERRNO = ParamKind("errno", 0xF00, 0xE00, MAX_ERRNO, ScmpAction.errno)
+# data of SCMP_ACT_TRACE, 16 bit return data
+TRACE = ParamKind("trace", 0xF000, 0xE000, SECCOMP_RET_DATA, ScmpAction.trace)
+# 32bit datum of an EQ, NE or MASKED_EQ argument comparison
+DATUM = ParamKind("datum", 0x5EC00000, 0x5ED00000, 0xFFFFFFFF, int)
+
+_K = struct.Struct("=I")
+# offset of k in struct sock_filter
+_K_OFFSET = 4
+_INSN_SIZE = 8
+
+
+class LayoutError(ValueError):
+    """Parameter values would change the layout of the program
+
+    libseccomp shares return instructions with equal values and orders
+    comparisons of an argument by value, a full build is required.
+    """
+
+
+def _groups(insns):
+    """Group instructions whose immediate libseccomp orders or shares
+
+    Returns a list with a hashable key per instruction or None. Return
+    instructions share a group, comparisons are grouped by the value in
+    the accumulator (seccomp_data offset and AND masks).
+    """
+    keys = []
+    for (code, _, _, _), sources in zip(insns, accumulators(insns)):
+        cls = code & 0x07
+        if cls == BPF_RET:
+            keys.append("ret")
+        elif cls == BPF_JMP and code & 0xF0 != BPF_JA and not code & BPF_X:
+            keys.append(sources)
+        else:
+            keys.append(None)
+    return keys
+
+
+class FilterTemplate:
+    """Policy compiled once, variants are created by patching immediates
+
+    factory is a callable that receives a dict of parameter values and
+    returns a Policy, params maps parameter names to ERRNO, TRACE or DATUM::
+
+        def factory(values):
+            return Policy(
+                ScmpAction.SCMP_ACT_ALLOW,
+                (
+                    Rule(ScmpAction.errno(values["errno"]), "getpriority", ()),
+                    Rule(
+                        ScmpAction.SCMP_ACT_EPERM,
+                        "personality",
+                        (ScmpArg(0, ScmpCmp.SCMP_CMP_EQ, values["persona"]),),
+                    ),
+                ),
+            )
+
+        template = FilterTemplate(factory, {"errno": ERRNO, "persona": DATUM})
+        compiled = template.instantiate(errno=errno.EACCES, persona=0x0008)
+
+    The template builds the policy twice with different sentinel values and
+    records the instructions whose immediates follow the sentinels. All
+    other instructions must be identical, otherwise the program structure
+    depends on the values and ValueError is raised.
+
+    A patched program is byte-identical to a full build. Values that libseccomp
+    would lay out differently raise LayoutError in patch(): a return value
+    equal to another return value of the program, or a datum that is equal to
+    another immediate compared with the same argument or sorts on the other
+    side of it. instantiate() falls back to a full build for those values.
+    """
+
+    __slots__ = (
+        "params",
+        "_factory",
+        "_build_args",
+        "_bpf",
+        "_arches",
+        "_flags",
+        "_offsets",
+        "_neighbors",
+    )
+
+    def __init__(self, factory, params, arches=(), spec_allow=False):
+        self.params = dict(params)
+        self._factory = factory
+        self._build_args = (tuple(arches), spec_allow)
+        names = sorted(self.params)
+        probe_a = {}
+        probe_b = {}
+        for i, name in enumerate(names):
+            kind = self.params[name]
+            probe_a[name] = kind.base_a + i
+            probe_b[name] = kind.base_b + i
+        compiled_a = build(factory(probe_a), arches, spec_allow)
+        compiled_b = build(factory(probe_b), arches, spec_allow)
+        bpf_a = compiled_a.bpf
+        bpf_b = compiled_b.bpf
+        if len(bpf_a) != len(bpf_b):
+            raise ValueError("program length depends on parameter values")
+
+        # (encoded sentinel a, encoded sentinel b) -> parameter name
+        sentinels = {}
+        for name in names:
+            encode = self.params[name].encode
+            sentinels[int(encode(probe_a[name])), int(encode(probe_b[name]))] = name
+        insns = decode(bpf_a)
+        offsets = {name: [] for name in names}
+        patched = {}
+        for i, (ins_a, ins_b) in enumerate(zip(insns, decode(bpf_b))):
+            # code, jt and jf must be equal, k equal or a pair of sentinels
+            name = sentinels.get((ins_a[3], ins_b[3]))
+            if ins_a[:3] != ins_b[:3] or (ins_a[3] != ins_b[3] and name is None):
+                raise ValueError("instruction {} depends on parameter values".format(i))
+            if name is not None:
+                offsets[name].append(i * _INSN_SIZE + _K_OFFSET)
+                patched[i] = name
+        unused = [name for name in names if not offsets[name]]
+        if unused:
+            raise ValueError("unused parameters: {}".format(", ".join(unused)))
+
+        # name -> [(fixed immediates, index of the sentinel among them or None
+        # for unordered returns, [(other parameter, other sentinel is lower)])]
+        keys = _groups(insns)
+        members = collections.defaultdict(list)
+        for i, key in enumerate(keys):
+            if key is not None:
+                members[key].append(i)
+        neighbors = {name: [] for name in names}
+        for i, name in patched.items():
+            group = members[keys[i]]
+            fixed = sorted({insns[j][3] for j in group if j not in patched})
+            others = sorted(
+                (patched[j], insns[j][3] < insns[i][3])
+                for j in group
+                if j in patched and patched[j] != name
+            )
+            if keys[i] == "ret":
+                neighbors[name].append((frozenset(fixed), None, others))
+            else:
+                index = bisect.bisect_left(fixed, insns[i][3])
+                neighbors[name].append((fixed, index, others))
+
+        self._bpf = bpf_a
+        self._arches = compiled_a.arches
+        self._flags = compiled_a.flags
+        self._offsets = {name: tuple(offsets[name]) for name in names}
+        self._neighbors = {name: tuple(neighbors[name]) for name in names}
+
+    @property
+    def offsets(self):
+        """Byte offsets of the patched immediates of each parameter"""
+        return dict(self._offsets)
+
+    def _words(self, values):
+        if values.keys() != self._offsets.keys():
+            missing = set(self._offsets) - set(values)
+            extra = set(values) - set(self._offsets)
+            raise TypeError(
+                "missing parameters {}, unknown parameters {}".format(
+                    sorted(missing), sorted(extra)
+                )
+            )
+        words = {}
+        for name, value in values.items():
+            kind = self.params[name]
+            if not 0 <= value <= kind.maximum:
+                raise ValueError(
+                    "{} parameter {} out of range: {}".format(kind.name, name, value)
+                )
+            words[name] = int(kind.encode(value))
+        return words
+
+    def _check_layout(self, words):
+        for name, word in words.items():
+            for fixed, index, others in self._neighbors[name]:
+                if index is None:
+                    conflict = word in fixed
+                else:
+                    position = bisect.bisect_left(fixed, word)
+                    conflict = position != index or (
+                        position < len(fixed) and fixed[position] == word
+                    )
+                if conflict:
+                    raise LayoutError(
+                        "{} parameter {} changes the program layout".format(
+                            self.params[name].name, name
+                        )
+                    )
+                for other, lower in others:
+                    other_word = words[other]
+                    if other_word == word or (
+                        index is not None and (other_word < word) != lower
+                    ):
+                        raise LayoutError(
+                            "parameters {} and {} change the program layout".format(
+                                name, other
+                            )
+                        )
+
+    def patch(self, **values):
+        """BPF program for parameter values as bytes
+
+        Raises LayoutError when the values need a full build.
+        """
+        words = self._words(values)
+        self._check_layout(words)
+        buf = bytearray(self._bpf)
+        pack_into = _K.pack_into
+        for name, offsets in self._offsets.items():
+            word = words[name]
+            for offset in offsets:
+                pack_into(buf, offset, word)
+        return bytes(buf)
+
+    def instantiate(self, **values):
+        """CompiledPolicy for parameter values, patched or fully built"""
+        try:
+            bpf = self.patch(**values)
+        except LayoutError:
+            arches, spec_allow = self._build_args
+            return build(self._factory(values), arches, spec_allow)
+        return CompiledPolicy(bpf, self._arches, self._flags)
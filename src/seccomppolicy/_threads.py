@@ -0,0 +1,203 @@
+import concurrent.futures
+import os
+import sys
+import threading
+
+from ._installer import FilterInstaller
+from ._scan import parse_status, _read
+
+__all__ = (
+    "ThreadFilterError",
+    "ThreadSandbox",
+    "gettid",
+    "thread_status",
+    "thread_statuses",
+)
+
+
+def gettid():
+    """Kernel thread id of the calling thread"""
+    get_native_id = getattr(threading, "get_native_id", None)
+    if get_native_id is not None:
+        return get_native_id()
+    # Python < 3.8, /proc/thread-self -> PID/task/TID
+    return int(os.readlink("/proc/thread-self").rsplit("/", 1)[1])
+
+
+def thread_status(tid=None):
+    """ProcStatus of a thread of the current process, None if it is gone"""
+    if tid is None:
+        tid = gettid()
+    data = _read("/proc/self/task/{}/status".format(tid))
+    if data is None:
+        return None
+    return parse_status(data, os.getpid(), tid)
+
+
+def thread_statuses():
+    """ProcStatus of all threads of the current process, sorted by tid"""
+    tids = sorted(int(name) for name in os.listdir("/proc/self/task"))
+    statuses = (thread_status(tid) for tid in tids)
+    return [status for status in statuses if status is not None]
+
+
+def _starttime(tid):
+    """Start time of a thread in clock ticks, None if it is gone
+
+    Thread ids are reused, the start time tells threads with the same id
+    apart.
+    """
+    data = _read("/proc/self/task/{}/stat".format(tid))
+    if data is None:
+        return None
+    # comm may contain spaces and parentheses, starttime is field 22
+    return int(data.rsplit(b")", 1)[1].split()[19])
+
+
+def _filters(status):
+    if status.filters is not None:
+        return status.filters
+    # Seccomp_filters was added in Linux 5.9, mode 2 is SECCOMP_MODE_FILTER
+    return 1 if status.seccomp == 2 else 0
+
+
+class ThreadFilterError(RuntimeError):
+    """Threads are not in the expected seccomp state
+
+    The statuses attribute holds the ProcStatus of the offending threads.
+    """
+
+    def __init__(self, message, statuses):
+        super().__init__(message)
+        self.statuses = statuses
+
+
+# ThreadPoolExecutor(initializer=) was added in Python 3.7
+_HAS_INITIALIZER = sys.version_info >= (3, 7)
+
+
+class _InitExecutor(concurrent.futures.ThreadPoolExecutor):
+    """ThreadPoolExecutor that runs an initializer on Python < 3.7
+
+    The initializer runs before the first task of each worker thread. When
+    it fails, the task fails and the next task retries it.
+    """
+
+    def __init__(self, max_workers, initializer):
+        super().__init__(max_workers)
+        self._initializer = initializer
+        self._local = threading.local()
+
+    def _run(self, fn, args, kwargs):
+        if not getattr(self._local, "initialized", False):
+            self._initializer()
+            self._local.initialized = True
+        return fn(*args, **kwargs)
+
+    def submit(self, fn, *args, **kwargs):
+        return super().submit(self._run, fn, args, kwargs)
+
+
+class ThreadSandbox:
+    """Install a compiled filter on selected threads only
+
+    seccomp filters are per thread. Without SECCOMP_FILTER_FLAG_TSYNC a
+    filter only applies to the calling thread and threads it creates later,
+    other threads of the process stay unfiltered. The sandbox is callable
+    and can be used as thread pool initializer::
+
+        sandbox = ThreadSandbox(build(policy))
+        with sandbox.executor(max_workers=4) as pool:
+            pool.map(parse_untrusted, documents)
+        sandbox.verify()
+
+    Threads with a filter of their own make later TSYNC installations in
+    the same process fail with TsyncError.
+    """
+
+    __slots__ = ("_installer", "_tids", "_lock")
+
+    def __init__(self, policy, no_new_privs=True):
+        if isinstance(policy, FilterInstaller):
+            installer = policy
+        elif hasattr(policy, "installer"):
+            # CompiledPolicy
+            installer = policy.installer(no_new_privs)
+        else:
+            installer = FilterInstaller(policy, no_new_privs=no_new_privs)
+        self._installer = installer
+        # thread id -> start time
+        self._tids = {}
+        self._lock = threading.Lock()
+
+    @property
+    def tids(self):
+        """Thread ids of live sandboxed threads
+
+        Threads that have exited are forgotten, even when a new thread got
+        the same id.
+        """
+        with self._lock:
+            for tid, starttime in list(self._tids.items()):
+                if _starttime(tid) != starttime:
+                    del self._tids[tid]
+            return frozenset(self._tids)
+
+    def install(self):
+        """Install the filter on the calling thread, returns its thread id"""
+        self._installer()
+        tid = gettid()
+        starttime = _starttime(tid)
+        with self._lock:
+            self._tids[tid] = starttime
+        return tid
+
+    __call__ = install
+
+    def executor(self, max_workers=None, initializer=None, initargs=()):
+        """ThreadPoolExecutor with a filter on every worker thread
+
+        The filter is installed before the optional initializer runs.
+        """
+
+        def init():
+            self.install()
+            if initializer is not None:
+                initializer(*initargs)
+
+        if _HAS_INITIALIZER:
+            return concurrent.futures.ThreadPoolExecutor(max_workers, initializer=init)
+        return _InitExecutor(max_workers, init)
+
+    def verify(self, min_filters=1):
+        """Verify sandboxed threads through /proc/self/task
+
+        Sandboxed threads must have at least min_filters filters and
+        no_new_privs set. Threads that have exited are ignored. Returns
+        the ProcStatus of all live sandboxed threads.
+        """
+        tids = self.tids
+        statuses = [thread_status(tid) for tid in sorted(tids)]
+        statuses = [status for status in statuses if status is not None]
+        failed = [
+            status
+            for status in statuses
+            if _filters(status) < min_filters or not status.no_new_privs
+        ]
+        if failed:
+            raise ThreadFilterError(
+                "threads without filter: {}".format(
+                    ", ".join(str(status.tid) for status in failed)
+                ),
+                failed,
+            )
+        return statuses
+
+    def outside(self):
+        """ProcStatus of all threads that were not sandboxed
+
+        Threads started by a sandboxed thread inherit its filter, they show
+        up here with filters.
+        """
+        tids = self.tids
+        return [status for status in thread_statuses() if status.tid not in tids]
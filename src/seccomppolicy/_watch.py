@@ -0,0 +1,332 @@
+"""Watch profile directories and recompile changed profiles
+
+Profiles (*.json) in the watched directories are compiled once per variant
+into BPF programs in an output directory. The watcher uses inotify on the
+directories, debounces bursts of events and re-parses only the profiles
+that changed. A variant is only compiled again when its flattened policy
+changed, e.g. an edit of a CAP_SYS_ADMIN ruleset does not affect variants
+without CAP_SYS_ADMIN. Programs are written to a temporary file and
+renamed over the old program, readers never see a partial file.
+
+Output files are named PROFILE.VARIANT.bpf, PROFILE is the file name of
+the profile without the .json suffix. A file name must be unique across
+the watched directories, duplicates are rejected and keep the old output.
+When a watched directory is deleted or moved away, the output of its
+profiles is removed and the directory is no longer watched.
+"""
+
+import collections
+import errno
+import logging
+import os
+import select
+import struct
+import tempfile
+import time
+
+from ._compiled import build
+from ._constants import InotifyFlag, InotifyMask
+from ._containerpolicy import flatten, load_file
+from ._libc import inotify_add_watch, inotify_init1, inotify_rm_watch
+from ._seccomp import NATIVE_ARCH
+
+__all__ = ("PolicyWatcher", "Update", "WatchVariant")
+
+log = logging.getLogger(__name__)
+
+# name of the variant in output file names, extra filter arches (None for
+# the subArchitectures of the profile) and effective capabilities
+WatchVariant = collections.namedtuple("WatchVariant", "name arches caps")
+
+DEFAULT_VARIANTS = (WatchVariant("default", None, frozenset()),)
+
+# result of an update: profile path, written and removed output files,
+# variants with unchanged policy, parse and compile time in seconds
+Update = collections.namedtuple(
+    "Update", "profile written removed unchanged parse_time compile_time"
+)
+
+_WATCH_MASK = (
+    InotifyMask.IN_CLOSE_WRITE
+    | InotifyMask.IN_MOVED_TO
+    | InotifyMask.IN_MOVED_FROM
+    | InotifyMask.IN_DELETE
+    | InotifyMask.IN_DELETE_SELF
+    | InotifyMask.IN_MOVE_SELF
+    | InotifyMask.IN_ONLYDIR
+)
+
+# wd, mask, cookie, len of the name that follows
+_EVENT = struct.Struct("=iIII")
+
+SUFFIX = ".json"
+OUTPUT_SUFFIX = ".bpf"
+
+
+def _write_atomic(filename, data):
+    dirname, basename = os.path.split(filename)
+    fd, tmpname = tempfile.mkstemp(prefix="." + basename, dir=dirname)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmpname, filename)
+    except BaseException:
+        os.unlink(tmpname)
+        raise
+
+
+class PolicyWatcher:
+    """Compile profiles of directories and keep the output up to date
+
+    ::
+
+        with PolicyWatcher(["/etc/containers/seccomp.d"], "/run/seccomp") as w:
+            w.sync()
+            w.run()
+
+    debounce is the quiet period in seconds after the last event before
+    profiles are recompiled, max_delay limits the delay of an update
+    during a continuous stream of events.
+    """
+
+    def __init__(
+        self,
+        directories,
+        output_dir,
+        variants=DEFAULT_VARIANTS,
+        debounce=0.2,
+        max_delay=2.0,
+    ):
+        self.directories = [os.path.abspath(d) for d in directories]
+        self.output_dir = output_dir
+        self.variants = tuple(variants)
+        names = [variant.name for variant in self.variants]
+        if len(set(names)) != len(names):
+            raise ValueError("variant names must be unique")
+        self.debounce = debounce
+        self.max_delay = max_delay
+        # (profile path, variant name) -> flattened policy and arches
+        self._built = {}
+        self._fd = inotify_init1(InotifyFlag.IN_CLOEXEC | InotifyFlag.IN_NONBLOCK)
+        self._wds = {}
+        try:
+            for directory in self.directories:
+                wd = inotify_add_watch(self._fd, directory, _WATCH_MASK)
+                self._wds[wd] = directory
+        except BaseException:
+            os.close(self._fd)
+            raise
+
+    def fileno(self):
+        return self._fd
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def profiles(self):
+        """Profile paths in all watched directories"""
+        result = []
+        for directory in self.directories:
+            try:
+                names = os.listdir(directory)
+            except FileNotFoundError:
+                continue
+            for name in sorted(names):
+                if name.endswith(SUFFIX) and not name.startswith("."):
+                    result.append(os.path.join(directory, name))
+        return result
+
+    def duplicates(self, profile):
+        """Profiles with the same file name in other watched directories"""
+        directory, name = os.path.split(profile)
+        result = []
+        for other in self.directories:
+            path = os.path.join(other, name)
+            if other != directory and os.path.isfile(path):
+                result.append(path)
+        return result
+
+    def output(self, profile, variant):
+        """Output file of a profile variant"""
+        name = os.path.basename(profile)[: -len(SUFFIX)]
+        return os.path.join(
+            self.output_dir, "{}.{}{}".format(name, variant.name, OUTPUT_SUFFIX)
+        )
+
+    def sync(self):
+        """Compile all profiles, returns a list of Updates"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        return self.update(self.profiles())
+
+    def update(self, profiles):
+        """Recompile or remove the output of profiles
+
+        Profiles that can not be parsed or compiled keep their old output.
+        Profiles with the same file name in other directories are updated,
+        too. Returns a list of Updates.
+        """
+        profiles = set(profiles)
+        for profile in list(profiles):
+            profiles.update(self.duplicates(profile))
+        updates = []
+        for profile in sorted(profiles):
+            try:
+                if os.path.isfile(profile):
+                    result = self._compile(profile)
+                else:
+                    result = self._remove(profile)
+            except Exception:
+                log.exception("failed to update %s", profile)
+                continue
+            updates.append(result)
+            log.info(
+                "%s: %d written, %d removed, %d unchanged, "
+                "parse %.1f ms, compile %.1f ms",
+                profile,
+                len(result.written),
+                len(result.removed),
+                len(result.unchanged),
+                result.parse_time * 1000,
+                result.compile_time * 1000,
+            )
+        return updates
+
+    def _compile(self, profile):
+        duplicates = self.duplicates(profile)
+        if duplicates:
+            raise ValueError(
+                "{} has the same name as {}".format(profile, ", ".join(duplicates))
+            )
+        start = time.perf_counter()
+        config = load_file(profile)
+        parsed = time.perf_counter()
+        written = []
+        unchanged = []
+        for variant in self.variants:
+            arches = variant.arches
+            if arches is None:
+                arches = config["archmap"].get(NATIVE_ARCH, ())
+            arches = tuple(arch for arch in arches if arch != NATIVE_ARCH)
+            policy = flatten(config["default_action"], config["syscalls"], variant.caps)
+            key = (profile, variant.name)
+            output = self.output(profile, variant)
+            if self._built.get(key) == (policy, arches) and os.path.exists(output):
+                unchanged.append(variant.name)
+                continue
+            _write_atomic(output, build(policy, arches).bpf)
+            self._built[key] = (policy, arches)
+            written.append(output)
+        compiled = time.perf_counter()
+        return Update(
+            profile, written, [], unchanged, parsed - start, compiled - parsed
+        )
+
+    def _remove(self, profile):
+        removed = []
+        for variant in self.variants:
+            self._built.pop((profile, variant.name), None)
+            if self.duplicates(profile):
+                # output belongs to the profile in another directory
+                continue
+            output = self.output(profile, variant)
+            try:
+                os.unlink(output)
+            except FileNotFoundError:
+                continue
+            removed.append(output)
+        return Update(profile, [], removed, [], 0.0, 0.0)
+
+    def _read_events(self):
+        """Profile paths of pending events, all profiles after an overflow"""
+        changed = set()
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    break
+                raise
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = data[offset : offset + length].rstrip(b"\0")
+                offset += length
+                if mask & InotifyMask.IN_Q_OVERFLOW:
+                    log.warning("inotify queue overflow, rescanning")
+                    changed.update(self.profiles())
+                    changed.update(profile for profile, _ in self._built)
+                    continue
+                directory = self._wds.get(wd)
+                if directory is None:
+                    continue
+                if mask & (InotifyMask.IN_IGNORED | InotifyMask.IN_MOVE_SELF):
+                    # directory was deleted, moved or unmounted
+                    changed.update(self._unwatch(wd, mask))
+                    continue
+                if mask & InotifyMask.IN_ISDIR:
+                    continue
+                name = os.fsdecode(name)
+                if name.endswith(SUFFIX) and not name.startswith("."):
+                    changed.add(os.path.join(directory, name))
+        return changed
+
+    def _unwatch(self, wd, mask):
+        """Stop watching a directory, returns the profiles built from it"""
+        directory = self._wds.pop(wd)
+        log.warning("%s is gone, no longer watched", directory)
+        if not mask & InotifyMask.IN_IGNORED:
+            # the Kernel keeps the watch of a moved directory
+            try:
+                inotify_rm_watch(self._fd, wd)
+            except OSError:
+                pass
+        return set(
+            profile
+            for profile, _ in self._built
+            if os.path.dirname(profile) == directory
+        )
+
+    def poll(self, timeout=None):
+        """Wait for changes and update changed profiles
+
+        Waits up to timeout seconds (None: forever) for the first event,
+        then until no event arrived for debounce seconds. Returns a list of
+        Updates, empty when the timeout expired.
+        """
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return []
+        first = time.monotonic()
+        changed = self._read_events()
+        while True:
+            remaining = self.max_delay - (time.monotonic() - first)
+            if remaining <= 0:
+                break
+            if not select.select([self._fd], [], [], min(self.debounce, remaining))[0]:
+                break
+            changed.update(self._read_events())
+        start = time.perf_counter()
+        updates = self.update(sorted(changed))
+        if updates:
+            log.info(
+                "updated %d profiles in %.1f ms, %.1f ms after first event",
+                len(updates),
+                (time.perf_counter() - start) * 1000,
+                (time.monotonic() - first) * 1000,
+            )
+        return updates
+
+    def run(self):
+        """Watch forever"""
+        while True:
+            self.poll()
@@ -0,0 +1,24 @@
+import os
+import traceback
+
+import pytest
+
+
+def _in_child(func):
+    """Run func in a forked child, filters must not leak into pytest"""
+    pid = os.fork()
+    if pid == 0:
+        try:
+            func()
+        except BaseException:
+            traceback.print_exc()
+            os._exit(1)
+        os._exit(0)
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+
+
+@pytest.fixture
+def in_child():
+    """Function that runs a callable in a forked child and checks its exit"""
+    return _in_child
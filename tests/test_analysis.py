@@ -0,0 +1,242 @@
+import itertools
+import random
+
+import pytest
+
+from seccomppolicy._analysis import (
+    ArgSpace,
+    SyscallSpace,
+    compare,
+    equivalent,
+    evaluate,
+    merge,
+    prune,
+    syscall_rules,
+)
+from seccomppolicy._bpf import evaluate as evaluate_bpf, seccomp_data
+from seccomppolicy._constants import ScmpAction, ScmpCmp, action_precedence
+from seccomppolicy._containerpolicy import Policy, Rule
+from seccomppolicy._defaultpolicy import DEFAULT_ACTION, SYSCALLS
+from seccomppolicy._incremental import IncrementalCompiler
+from seccomppolicy._libseccomp import ScmpArg
+from seccomppolicy._pool import PreparedRules
+from seccomppolicy._query import HostFacts, PolicyIndex
+from seccomppolicy._seccomp import NATIVE_ARCH, Seccomp, Syscall
+
+ORDER_ACTIONS = [
+    ScmpAction.SCMP_ACT_EPERM,
+    ScmpAction.SCMP_ACT_EACCES,
+    ScmpAction.SCMP_ACT_TRAP,
+    ScmpAction.SCMP_ACT_LOG,
+    ScmpAction.SCMP_ACT_KILL_THREAD,
+]
+
+
+def _rules(name):
+    """Conditional rules of the default policy for a syscall"""
+    return tuple(
+        Rule(ruleset["action"], name, tuple(ruleset["args"]))
+        for ruleset in SYSCALLS
+        if name in ruleset["names"] and ruleset.get("args")
+    )
+
+
+def _check_witness(witness, policy_a, policy_b):
+    values = list(witness.data.args)
+    for policy, action in [(policy_a, witness.action_a), (policy_b, witness.action_b)]:
+        rules = [
+            (rule.action, rule.args)
+            for rule in policy.rules
+            if rule.syscall == "socket"
+        ]
+        assert evaluate(prune(rules), policy.default_action, values) == action
+    assert witness.action_a != witness.action_b
+
+
+def test_argspace_cells():
+    space = ArgSpace([ScmpArg(0, ScmpCmp.SCMP_CMP_MASKED_EQ, 2080505856, 0)])
+    assert sorted(cell.sample for cell in space.cells) == [0, 1 << 17]
+    space = ArgSpace(
+        [ScmpArg(0, ScmpCmp.SCMP_CMP_EQ, 16), ScmpArg(0, ScmpCmp.SCMP_CMP_GT, 20)]
+    )
+    assert [(c.lo, c.hi) for c in space.cells] == [
+        (0, 15),
+        (16, 16),
+        (17, 20),
+        (21, (1 << 64) - 1),
+    ]
+
+
+def test_socket_equivalent():
+    rules = _rules("socket")
+    policy = Policy(DEFAULT_ACTION, rules)
+    assert equivalent(policy, policy)
+    # order and duplicated rules do not matter
+    assert equivalent(policy, Policy(DEFAULT_ACTION, rules[::-1] + rules[:1]))
+    # a0 != 16 is the same as a0 < 16 or a0 > 16
+    split = tuple(rule for rule in rules if rule.args[0].key()[:2] != (0, 1))
+    split += (
+        Rule(
+            ScmpAction.SCMP_ACT_ALLOW, "socket", (ScmpArg(0, ScmpCmp.SCMP_CMP_LT, 16),)
+        ),
+        Rule(
+            ScmpAction.SCMP_ACT_ALLOW, "socket", (ScmpArg(0, ScmpCmp.SCMP_CMP_GT, 16),)
+        ),
+    )
+    assert equivalent(policy, Policy(DEFAULT_ACTION, split))
+
+
+def test_socket_witness():
+    rules = _rules("socket")
+    policy_a = Policy(DEFAULT_ACTION, rules)
+    # without the explicit ERRNO rule, AF_NETLINK/NETLINK_AUDIT still fails
+    policy_b = Policy(DEFAULT_ACTION, rules[1:])
+    assert equivalent(policy_a, policy_b)
+    # but not with a different default action
+    policy_c = Policy(ScmpAction.SCMP_ACT_KILL, rules[1:])
+    witness = compare(policy_a, policy_c)
+    assert witness is not None
+    assert witness.data.args[0] == 16
+    assert witness.data.args[2] == 9
+    _check_witness(witness, policy_a, policy_c)
+
+
+def test_clone_witness():
+    rules = _rules("clone")[:1]
+    policy_a = Policy(DEFAULT_ACTION, rules)
+    assert equivalent(policy_a, policy_a)
+    # a single flag more in the mask
+    mask = rules[0].args[0].datum_a | 1
+    policy_b = Policy(
+        DEFAULT_ACTION,
+        (
+            Rule(
+                ScmpAction.SCMP_ACT_ALLOW,
+                "clone",
+                (ScmpArg(0, ScmpCmp.SCMP_CMP_MASKED_EQ, mask, 0),),
+            ),
+        ),
+    )
+    witness = compare(policy_a, policy_b)
+    assert witness is not None
+    assert witness.data.args[0] & 1
+    assert witness.action_a == ScmpAction.SCMP_ACT_ALLOW
+    assert witness.action_b == DEFAULT_ACTION
+
+
+def test_unconditional_rule_shadows():
+    policy_a = Policy(DEFAULT_ACTION, (Rule(ScmpAction.SCMP_ACT_ALLOW, "read", ()),))
+    policy_b = Policy(
+        DEFAULT_ACTION,
+        policy_a.rules
+        + (
+            Rule(
+                ScmpAction.SCMP_ACT_EPERM, "read", (ScmpArg(0, ScmpCmp.SCMP_CMP_EQ, 5),)
+            ),
+        ),
+    )
+    assert equivalent(policy_a, policy_b)
+
+
+def _stacked(policies, values, nr):
+    return min(
+        (
+            evaluate(syscall_rules(p).get(nr, ()), p.default_action, values)
+            for p in policies
+        ),
+        key=action_precedence,
+    )
+
+
+def test_merge():
+    base = Policy(
+        DEFAULT_ACTION,
+        _rules("socket")
+        + _rules("clone")
+        + (Rule(ScmpAction.SCMP_ACT_ALLOW, "read", ()),),
+    )
+    app = Policy(
+        ScmpAction.SCMP_ACT_ALLOW,
+        (
+            Rule(
+                ScmpAction.SCMP_ACT_EPERM,
+                "socket",
+                (ScmpArg(0, ScmpCmp.SCMP_CMP_NE, 1),),
+            ),
+            Rule(
+                ScmpAction.SCMP_ACT_EPERM,
+                "clone",
+                (ScmpArg(0, ScmpCmp.SCMP_CMP_MASKED_EQ, 0x10000000, 0x10000000),),
+            ),
+            Rule(
+                ScmpAction.SCMP_ACT_KILL, "read", (ScmpArg(0, ScmpCmp.SCMP_CMP_GT, 9),)
+            ),
+        ),
+    )
+    policies = (base, app)
+    merged = merge(*policies)
+    assert merged.default_action == DEFAULT_ACTION
+    tables = [syscall_rules(p) for p in (merged,) + policies]
+    for nr in set().union(*tables):
+        space = SyscallSpace(*(table.get(nr, ()) for table in tables))
+        rules = tables[0].get(nr, ())
+        for cells in space:
+            values = space.values(cells)
+            assert evaluate(rules, merged.default_action, values) == _stacked(
+                policies, values, nr
+            )
+    # libseccomp accepts the merged rules
+    with Seccomp(merged.default_action) as sc:
+        PreparedRules.from_policy(merged).apply(sc)
+        assert sc.export_bpf()
+
+
+def _random_rules(rng):
+    rules = []
+    for _ in range(rng.randrange(1, 5)):
+        args = tuple(
+            ScmpArg(i, ScmpCmp.SCMP_CMP_EQ, rng.randrange(3))
+            for i in range(3)
+            if rng.random() < 0.4
+        )
+        rules.append((rng.choice(ORDER_ACTIONS), args))
+    return rules
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_libseccomp_order(seed):
+    """prune(), IncrementalCompiler and PolicyIndex agree with libseccomp"""
+    rng = random.Random(seed)
+    nr = Syscall("getpriority").nr
+    facts = HostFacts(caps=(), kernel="5.10")
+    compiler = IncrementalCompiler()
+    for _ in range(50):
+        rules = _random_rules(rng)
+        policy = Policy(
+            ScmpAction.SCMP_ACT_ALLOW,
+            tuple(Rule(action, "getpriority", args) for action, args in rules),
+        )
+        try:
+            with Seccomp(policy.default_action, degrade=False) as sc:
+                PreparedRules.from_policy(policy).apply(sc)
+                expected = sc.export_bpf()
+        except OSError:
+            # equal comparisons with different actions
+            with pytest.raises(ValueError):
+                prune(rules)
+            continue
+        pruned = prune(rules)
+        bpf = compiler.compile(policy)
+        index = PolicyIndex(
+            [
+                dict(names=["getpriority"], action=action, args=args)
+                for action, args in rules
+            ],
+            policy.default_action,
+        )
+        for values in itertools.product(range(4), repeat=3):
+            action = evaluate_bpf(expected, seccomp_data(nr, NATIVE_ARCH, 0, values))
+            assert evaluate(pruned, policy.default_action, values) == action, rules
+            data = seccomp_data(nr, NATIVE_ARCH, 0, values)
+            assert evaluate_bpf(bpf, data) == action, rules
+            assert index.query(nr, values, facts=facts).action == action, rules
@@ -0,0 +1,73 @@
+import pytest
+
+from seccomppolicy._bpf import (
+    BPF_A,
+    BPF_ABS,
+    BPF_ALU,
+    BPF_AND,
+    BPF_IMM,
+    BPF_JA,
+    BPF_JEQ,
+    BPF_JSET,
+    BPF_JMP,
+    BPF_K,
+    BPF_LD,
+    BPF_LDX,
+    BPF_MISC,
+    BPF_RET,
+    BPF_TAX,
+    BPF_TXA,
+    BPF_W,
+    BPF_X,
+    accumulators,
+    encode,
+    evaluate,
+    insn,
+    seccomp_data,
+)
+from seccomppolicy._constants import ScmpAction, ScmpArch
+
+
+def test_evaluate():
+    bpf = b"".join(
+        [
+            insn(BPF_LD | BPF_W | BPF_ABS, 0),
+            insn(BPF_JMP | BPF_JEQ | BPF_K, 39, 0, 1),
+            insn(BPF_RET | BPF_K, ScmpAction.SCMP_ACT_EPERM),
+            insn(BPF_LD | BPF_W | BPF_ABS, 16),
+            insn(BPF_ALU | BPF_AND | BPF_K, 0xF0),
+            insn(BPF_JMP | BPF_JSET | BPF_K, 0x10, 0, 1),
+            insn(BPF_JMP | BPF_JA, 1),
+            insn(BPF_RET | BPF_A),
+            insn(BPF_LDX | BPF_W | BPF_IMM, 7),
+            insn(BPF_MISC | BPF_TXA),
+            insn(BPF_MISC | BPF_TAX),
+            insn(BPF_JMP | BPF_JEQ | BPF_X, 0, 1, 0),
+            insn(BPF_RET | BPF_K, ScmpAction.SCMP_ACT_ALLOW),
+            insn(BPF_RET | BPF_A),
+        ]
+    )
+    arch = ScmpArch.SCMP_ARCH_X86_64
+    assert evaluate(bpf, seccomp_data(39, arch)) == ScmpAction.SCMP_ACT_EPERM
+    assert evaluate(bpf, seccomp_data(1, arch, 0, (0x1F,))) == 7
+    assert evaluate(bpf, seccomp_data(1, arch, 0, (0x20,))) == 0x20
+    with pytest.raises(ValueError):
+        evaluate(insn(BPF_LD | BPF_W | BPF_ABS, 0), seccomp_data())
+
+
+def test_trace_accumulators():
+    insns = [
+        (BPF_LD | BPF_W | BPF_ABS, 0, 0, 4),
+        (BPF_JMP | BPF_JEQ | BPF_K, 0, 2, 0xC000003E),
+        (BPF_LD | BPF_W | BPF_ABS, 0, 0, 16),
+        (BPF_ALU | BPF_AND | BPF_K, 0, 0, 0xF0),
+        (BPF_RET | BPF_A, 0, 0, 0),
+    ]
+    sources = accumulators(insns)
+    assert sources[1] == {("ld", 4)}
+    assert sources[3] == {("ld", 16)}
+    assert sources[4] == {("ld", 4), (BPF_ALU | BPF_AND | BPF_K, 0xF0, ("ld", 16))}
+    trace = []
+    data = seccomp_data(0, 0xC000003E, 0, (0x1F,))
+    assert evaluate(encode(insns), data, trace) == 0x10
+    assert trace == [0, 1, 2, 3, 4]
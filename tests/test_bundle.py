@@ -0,0 +1,111 @@
+import fcntl
+import hashlib
+import os
+import struct
+
+import pytest
+
+from seccomppolicy._bundle import Bundle, Variant, locked, write_bundle
+from seccomppolicy._constants import ScmpAction
+from seccomppolicy._seccomp import NATIVE_ARCH, Seccomp
+
+HASH = hashlib.sha256(b"policy").digest()
+
+
+def _bpf(*syscalls):
+    with Seccomp(ScmpAction.SCMP_ACT_ALLOW) as sc:
+        for syscall in syscalls:
+            sc.add_rule(ScmpAction.SCMP_ACT_EPERM, syscall)
+        return sc.export_bpf()
+
+
+def test_roundtrip(tmp_path):
+    filename = str(tmp_path / "policy.bundle")
+    v1 = Variant("x86_64", 0x1F, "5.10.0")
+    v2 = Variant("x86_64", 0, "6.1.0-1")
+    programs = {v1: _bpf("getpriority"), v2: _bpf("getpriority", "setpriority")}
+    write_bundle(filename, HASH, [NATIVE_ARCH], programs, "2.5.4")
+
+    with Bundle(filename) as bundle:
+        assert bundle.policy_hash == HASH
+        assert bundle.arches == (NATIVE_ARCH,)
+        assert bundle.libseccomp == "2.5.4"
+        assert len(bundle) == 2
+        assert set(bundle.variants) == {v1, v2}
+        assert Variant("x86_64", 0, "5.10.0") not in bundle
+        for variant, bpf in programs.items():
+            assert bundle.bpf(variant) == bpf
+            prog, filters = bundle.program(variant)
+            assert prog.len == len(bpf) // 8
+            # program points into the mapping
+            assert bytes(filters) == bpf
+
+
+def test_install(tmp_path, in_child):
+    filename = str(tmp_path / "policy.bundle")
+    variant = Variant("x86_64", 0, "")
+    write_bundle(filename, HASH, [NATIVE_ARCH], {variant: _bpf("getpriority")})
+
+    def child():
+        with Bundle(filename) as bundle:
+            bundle.install(variant)
+            with pytest.raises(PermissionError):
+                os.getpriority(os.PRIO_PROCESS, 0)
+
+    in_child(child)
+
+
+def test_invalid(tmp_path):
+    filename = tmp_path / "policy.bundle"
+    filename.write_bytes(b"\0" * 128)
+    with pytest.raises(ValueError):
+        Bundle(str(filename))
+
+
+@pytest.mark.parametrize("narches, index_offset", [(0xFFFF, None), (1, 0x7FFFFFFF)])
+def test_corrupt_header(tmp_path, narches, index_offset):
+    filename = tmp_path / "policy.bundle"
+    variant = Variant("x86_64", 0, "")
+    write_bundle(str(filename), HASH, [NATIVE_ARCH], {variant: _bpf()})
+    data = bytearray(filename.read_bytes())
+    # header: magic, version, arch count, variant count, index offset
+    struct.pack_into("=H", data, 10, narches)
+    if index_offset is not None:
+        struct.pack_into("=I", data, 16, index_offset)
+    filename.write_bytes(bytes(data))
+    with pytest.raises(ValueError):
+        Bundle(str(filename))
+
+
+def test_libseccomp_version(tmp_path):
+    filename = str(tmp_path / "policy.bundle")
+    variant = Variant("x86_64", 0, "")
+    write_bundle(filename, HASH, [NATIVE_ARCH], {variant: _bpf()}, "2.5.4")
+    with Bundle(filename, "2.5.4") as bundle:
+        assert variant in bundle
+    with pytest.raises(ValueError):
+        Bundle(filename, "2.5.5")
+
+
+def test_max_instructions(tmp_path):
+    filename = str(tmp_path / "policy.bundle")
+    variant = Variant("x86_64", 0, "")
+    with pytest.raises(ValueError):
+        write_bundle(filename, HASH, [], {variant: b"\0" * 8 * 0x10000})
+    write_bundle(filename, HASH, [], {variant: b"\0" * 8 * 0xFFFF})
+    with Bundle(filename) as bundle:
+        assert bundle.program(variant)[0].len == 0xFFFF
+
+
+def test_locked(tmp_path):
+    filename = str(tmp_path / "policy.bundle")
+    with locked(filename):
+        fd = os.open(filename + ".lock", os.O_RDWR)
+        try:
+            # flock() locks of another open file description conflict
+            with pytest.raises(BlockingIOError):
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        finally:
+            os.close(fd)
+    with locked(filename):
+        pass
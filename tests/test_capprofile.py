@@ -0,0 +1,85 @@
+import os
+import traceback
+
+import pytest
+
+from seccomppolicy._capprofile import (
+    DEFAULT_CAPABILITIES,
+    EXTRA_CAPABILITIES,
+    CapOp,
+    CapProfile,
+    CapState,
+    apply_profile,
+    caps_to_mask,
+    snapshot,
+)
+from seccomppolicy._constants import Capabilities, Prctl, SecureBits
+
+ALL = (1 << 41) - 1
+ROOT = CapState(ALL, ALL, 0, ALL, 0, 0)
+
+
+def test_plan_minimal():
+    profile = CapProfile.from_caps(DEFAULT_CAPABILITIES + EXTRA_CAPABILITIES)
+    ops = profile.plan(ROOT)
+    drops = [op for op in ops if op.args[0] == Prctl.PR_CAPBSET_DROP]
+    assert len(drops) == 41 - len(DEFAULT_CAPABILITIES + EXTRA_CAPABILITIES)
+    assert ops[-1].func == "capset"
+    # applying the same profile again is a no-op
+    assert profile.plan(profile.target(ROOT)) == []
+
+
+def test_plan_invalid():
+    mask = caps_to_mask([Capabilities.CAP_CHOWN])
+    state = CapState(mask, mask, 0, mask, 0, 0)
+    with pytest.raises(ValueError):
+        CapProfile(permitted=ALL).plan(state)
+    # bounding set drop needs CAP_SETPCAP
+    with pytest.raises(PermissionError):
+        CapProfile(bounding=0).plan(state)
+    with pytest.raises(ValueError):
+        CapProfile(ambient=mask).plan(state)
+
+
+def test_plan_keepcaps():
+    mask = caps_to_mask([Capabilities.CAP_CHOWN])
+    state = CapState(mask, mask, 0, mask, 0, 0)
+    # keepcaps alone does not need CAP_SETPCAP
+    assert CapProfile(keepcaps=True).plan(state) == [
+        CapOp("prctl", (Prctl.PR_SET_KEEPCAPS, 1))
+    ]
+    state = state._replace(securebits=SecureBits.SECBIT_KEEP_CAPS)
+    assert CapProfile(keepcaps=False).plan(state) == [
+        CapOp("prctl", (Prctl.PR_SET_KEEPCAPS, 0))
+    ]
+    with pytest.raises(PermissionError):
+        CapProfile(keepcaps=False, securebits=SecureBits.SECBIT_NOROOT).plan(state)
+    state = state._replace(
+        securebits=SecureBits.SECBIT_KEEP_CAPS | SecureBits.SECBIT_KEEP_CAPS_LOCKED
+    )
+    with pytest.raises(PermissionError):
+        CapProfile(keepcaps=False).plan(state)
+
+
+@pytest.mark.skipif(
+    not snapshot().effective & (1 << Capabilities.CAP_SETPCAP),
+    reason="requires CAP_SETPCAP",
+)
+def test_apply_profile():
+    caps = DEFAULT_CAPABILITIES + EXTRA_CAPABILITIES
+    profile = CapProfile.from_caps(caps, keepcaps=True)
+    pid = os.fork()
+    if pid == 0:
+        try:
+            apply_profile(profile)
+            state = snapshot()
+            assert state.effective == state.permitted == caps_to_mask(caps)
+            assert state.bounding == caps_to_mask(caps)
+            assert state.inheritable == state.ambient == 0
+            assert apply_profile(profile) == []
+        except BaseException:
+            traceback.print_exc()
+            os._exit(1)
+        os._exit(0)
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
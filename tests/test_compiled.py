@@ -0,0 +1,120 @@
+import asyncio
+import contextlib
+import os
+import pickle
+
+import pytest
+
+from seccomppolicy import _compiled
+from seccomppolicy._bpf import evaluate, seccomp_data
+from seccomppolicy._compiled import CompiledPolicy, PolicyBuilder, build
+from seccomppolicy._constants import (
+    ScmpAction,
+    ScmpArch,
+    ScmpCmp,
+    ScmpFilterAttr,
+    SeccompFilterFlag,
+)
+from seccomppolicy._containerpolicy import Policy, Rule
+from seccomppolicy._features import probe
+from seccomppolicy._incremental import IncrementalCompiler
+from seccomppolicy._libseccomp import ScmpArg
+from seccomppolicy._seccomp import NATIVE_ARCH
+
+
+def _policy(limit):
+    return Policy(
+        ScmpAction.SCMP_ACT_ALLOW,
+        (
+            Rule(ScmpAction.SCMP_ACT_EPERM, "getpriority", ()),
+            Rule(
+                ScmpAction.SCMP_ACT_EPERM,
+                "setpriority",
+                (ScmpArg(2, ScmpCmp.SCMP_CMP_LT, limit),),
+            ),
+        ),
+    )
+
+
+def test_compiled_policy(in_child):
+    compiled = build(_policy(0), [ScmpArch.SCMP_ARCH_X86])
+    assert compiled.arches == (NATIVE_ARCH, ScmpArch.SCMP_ARCH_X86)
+    assert len(compiled) == len(compiled.bpf) // 8
+    assert len(compiled.digest) == 64
+    assert "getpriority" in compiled.pfc
+    with pytest.raises(AttributeError):
+        compiled.flags = 1
+    with pytest.raises(AttributeError):
+        del compiled._bpf
+
+    same = build(_policy(0), [ScmpArch.SCMP_ARCH_X86])
+    assert same == compiled
+    assert len({same, compiled, build(_policy(1))}) == 2
+
+    copy = pickle.loads(pickle.dumps(compiled))
+    assert copy == compiled
+    with pytest.raises(ValueError):
+        copy.pfc
+
+    def child():
+        compiled.install()
+        with pytest.raises(PermissionError):
+            os.getpriority(os.PRIO_PROCESS, 0)
+
+    in_child(child)
+
+
+def test_policy_builder():
+    policies = [_policy(limit) for limit in range(16)]
+    with PolicyBuilder(4) as builder:
+        results = list(builder.map(policies))
+        assert results == [build(policy) for policy in policies]
+
+        loop = asyncio.new_event_loop()
+        try:
+            compiled = loop.run_until_complete(
+                builder.build_async(policies[0], loop=loop)
+            )
+        finally:
+            loop.close()
+        assert isinstance(compiled, CompiledPolicy)
+        assert compiled == results[0]
+
+
+def test_build_log_flag(monkeypatch):
+    if not probe().has_flag(SeccompFilterFlag.LOG):
+        pytest.skip("SECCOMP_FILTER_FLAG_LOG not supported")
+    seccomp = _compiled._seccomp
+
+    @contextlib.contextmanager
+    def logged(*args):
+        with seccomp(*args) as sc:
+            sc.set_attr(ScmpFilterAttr.SCMP_FLTATR_CTL_LOG, 1)
+            yield sc
+
+    monkeypatch.setattr(_compiled, "_seccomp", logged)
+    compiled = build(_policy(0))
+    assert compiled.flags == SeccompFilterFlag.LOG
+    assert compiled.installer().flags == SeccompFilterFlag.LOG
+
+
+def test_build_default_action_rules():
+    # rules with the default action are dropped like IncrementalCompiler does
+    policy = Policy(
+        ScmpAction.SCMP_ACT_ERRNO,
+        (
+            Rule(ScmpAction.SCMP_ACT_ALLOW, "getpriority", ()),
+            Rule(ScmpAction.SCMP_ACT_ERRNO, "kexec_load", ()),
+            Rule(
+                ScmpAction.SCMP_ACT_ERRNO,
+                "setpriority",
+                (ScmpArg(2, ScmpCmp.SCMP_CMP_LT, 10),),
+            ),
+        ),
+    )
+    compiled = build(policy)
+    incremental = IncrementalCompiler().compile(policy)
+    for nr in range(460):
+        for args in [(0,) * 6, (0, 0, 20, 0, 0, 0)]:
+            data = seccomp_data(nr, NATIVE_ARCH, 0, args)
+            assert evaluate(compiled.bpf, data) == evaluate(incremental, data)
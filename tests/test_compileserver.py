@@ -0,0 +1,122 @@
+import fcntl
+import json
+import os
+import threading
+
+import pytest
+
+from seccomppolicy._compileserver import (
+    CompileServer,
+    ServerError,
+    compile_profile,
+    install_fd,
+    request,
+)
+from seccomppolicy._constants import F_GET_SEALS, Capabilities, FileSeal
+
+POLICY = {
+    "defaultAction": "SCMP_ACT_ALLOW",
+    "syscalls": [
+        {"names": ["getpriority"], "action": "SCMP_ACT_EPERM", "comment": ""},
+        {
+            "names": ["setpriority"],
+            "action": "SCMP_ACT_EPERM",
+            "comment": "",
+            "excludes": {"caps": ["CAP_SYS_NICE"]},
+        },
+    ],
+}
+
+
+@pytest.fixture
+def server(tmp_path):
+    path = str(tmp_path / "compile.sock")
+    profiles = tmp_path / "profiles"
+    profiles.mkdir()
+    server = CompileServer(path, maxsize=2, profile_dirs=[str(profiles)])
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_compile_server(server, tmp_path, in_child):
+    path = server.server_address
+    response, fd = request(path, policy=POLICY)
+    try:
+        assert response["cached"] is False
+        assert fcntl.fcntl(fd, F_GET_SEALS) & FileSeal.F_SEAL_WRITE
+        bpf = os.pread(fd, response["size"], 0)
+        assert bpf == compile_profile(json.dumps(POLICY).encode("utf-8"))
+
+        def child():
+            install_fd(fd)
+            with pytest.raises(PermissionError):
+                os.getpriority(os.PRIO_PROCESS, 0)
+
+        in_child(child)
+    finally:
+        os.close(fd)
+
+    response, fd = request(path, policy=POLICY)
+    os.close(fd)
+    assert response["cached"] is True
+
+    # capability variant evaluates the excludes condition
+    response, fd = request(path, policy=POLICY, caps=[Capabilities.CAP_SYS_NICE])
+    os.close(fd)
+    assert response["cached"] is False
+
+    profile = tmp_path / "profiles" / "seccomp.json"
+    profile.write_text(json.dumps(POLICY))
+    response, fd = request(path, profile=str(profile))
+    os.close(fd)
+    assert response["cached"] is False
+
+    with pytest.raises(ServerError) as exc:
+        request(path, profile=str(tmp_path / "profiles" / "missing.json"))
+    assert str(exc.value) == "profile not available"
+
+    stats, fd = request(path, stats=True)
+    assert fd is None
+    assert stats["hits"] == 1
+    assert stats["misses"] == 3
+    assert stats["errors"] == 1
+    assert stats["currsize"] == 2
+
+
+def test_compile_server_paths(server, tmp_path):
+    path = server.server_address
+    outside = tmp_path / "outside.json"
+    outside.write_text(json.dumps(POLICY))
+    link = tmp_path / "profiles" / "link.json"
+    link.symlink_to(outside)
+    # outside of the profile directories, the same error as a missing file
+    for profile in [
+        str(outside),
+        str(tmp_path / "profiles" / ".." / "outside.json"),
+        str(link),
+        "/etc/passwd",
+    ]:
+        with pytest.raises(ServerError) as exc:
+            request(path, profile=profile)
+        assert str(exc.value) == "profile not available"
+    with pytest.raises(ServerError) as exc:
+        request(path, profile="outside.json")
+    assert str(exc.value) == "invalid request"
+
+
+def test_compile_server_default_action_rule(server):
+    # ERRNO ruleset under an ERRNO default, like container profiles
+    policy = {
+        "defaultAction": "SCMP_ACT_ERRNO",
+        "syscalls": [
+            {"names": ["read", "write"], "action": "SCMP_ACT_ALLOW", "comment": ""},
+            {"names": ["kexec_load"], "action": "SCMP_ACT_ERRNO", "comment": ""},
+        ],
+    }
+    response, fd = request(server.server_address, policy=policy)
+    os.close(fd)
+    assert response["cached"] is False
+    assert response["size"] > 0
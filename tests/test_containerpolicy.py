@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+from seccomppolicy import _features
+from seccomppolicy._constants import ScmpAction, ScmpArch, ScmpCmp, translate_scmp
+from seccomppolicy._containerpolicy import IncludeCondition, _Condition, _parse, loads
+
+PROFILE = {
+    "defaultAction": "SCMP_ACT_ERRNO",
+    "archMap": [
+        {
+            "architecture": "SCMP_ARCH_X86_64",
+            "subArchitectures": ["SCMP_ARCH_X86", "SCMP_ARCH_X32"],
+        }
+    ],
+    "syscalls": [
+        {"names": ["read", "write"], "action": "SCMP_ACT_ALLOW", "comment": ""},
+        {
+            "names": ["personality", "read"],
+            "action": "SCMP_ACT_ALLOW",
+            "comment": "",
+            "args": [
+                {"index": 0, "value": 8, "valueTwo": 0, "op": "SCMP_CMP_EQ"},
+                {"index": 1, "value": 3, "valueTwo": 1, "op": "SCMP_CMP_MASKED_EQ"},
+            ],
+        },
+        {
+            "names": ["socket"],
+            "action": "SCMP_ACT_ALLOW",
+            "comment": "",
+            "includes": {"caps": ["CAP_AUDIT_WRITE"], "arches": ["amd64"]},
+            "excludes": {"minKernel": "4.8"},
+        },
+    ],
+}
+
+
+def test_translate_scmp():
+    assert translate_scmp("SCMP_ACT_ALLOW") is ScmpAction.SCMP_ACT_ALLOW
+    assert translate_scmp("SCMP_CMP_EQ") is ScmpCmp.SCMP_CMP_EQ
+    assert translate_scmp("amd64") is ScmpArch.SCMP_ARCH_X86_64
+    with pytest.raises(ValueError):
+        translate_scmp("SCMP_ACT_INVALID")
+
+
+def test_loads():
+    text = json.dumps(PROFILE)
+    assert loads(text) == _parse(json.loads(text))
+    # syscall objects are resolved once per name
+    syscalls = loads(text)["syscalls"]
+    assert syscalls[0]["names"][0] is syscalls[1]["names"][1]
+
+
+@pytest.mark.parametrize(
+    "arg",
+    [
+        {"index": 6, "value": 0, "valueTwo": 0, "op": "SCMP_CMP_EQ"},
+        {"index": 0, "value": 0, "valueTwo": 0, "op": "SCMP_ACT_ALLOW"},
+        {"index": 0, "value": 0, "valueTwo": 0, "op": "SCMP_CMP_INVALID"},
+    ],
+)
+def test_loads_invalid_arg(arg):
+    profile = dict(PROFILE, syscalls=[dict(PROFILE["syscalls"][1], args=[arg])])
+    with pytest.raises(ValueError):
+        loads(json.dumps(profile))
+
+
+def test_loads_constant():
+    with pytest.raises(ValueError):
+        loads('{"defaultAction": NaN, "syscalls": []}')
+
+
+def test_condition_abstract():
+    with pytest.raises(TypeError):
+        _Condition()
+    includes = IncludeCondition(arches=[ScmpArch.SCMP_ARCH_X86])
+    assert not includes.check(arch=ScmpArch.SCMP_ARCH_AARCH64)
+    assert includes.check(arch=ScmpArch.SCMP_ARCH_X86)
+
+
+def test_condition_kernel(monkeypatch):
+    def probe():
+        raise AssertionError("Kernel conditions must not probe features")
+
+    monkeypatch.setattr(_features, "probe", probe)
+    monkeypatch.setattr(_features, "kernel_release", lambda: "5.10.0-21-amd64")
+    assert IncludeCondition(minKernel="5.10").check()
+    assert not IncludeCondition(minKernel="5.11").check()
@@ -0,0 +1,48 @@
+from seccomppolicy import _features
+from seccomppolicy._constants import ScmpAction
+from seccomppolicy._seccomp import Seccomp
+
+
+def test_probe_cached(tmp_path):
+    features = _features.probe()
+    assert _features.probe() is features
+    assert features.has_action(ScmpAction.SCMP_ACT_ALLOW)
+    assert features.has_action(ScmpAction.SCMP_ACT_EPERM)
+
+    _features.clear_cache()
+    try:
+        on_disk = _features.probe(str(tmp_path))
+        assert len(list(tmp_path.iterdir())) == 1
+        _features.clear_cache()
+        assert _features.probe(str(tmp_path)) == on_disk
+    finally:
+        _features.clear_cache()
+
+
+def test_degrade_action():
+    features = _features.probe()._replace(
+        actions=frozenset([ScmpAction.SCMP_ACT_KILL_THREAD, ScmpAction.SCMP_ACT_ALLOW])
+    )
+    degrade = _features.degrade_action
+    assert (
+        degrade(ScmpAction.SCMP_ACT_KILL_PROCESS, features)
+        == ScmpAction.SCMP_ACT_KILL_THREAD
+    )
+    assert degrade(ScmpAction.SCMP_ACT_LOG, features) == ScmpAction.SCMP_ACT_ALLOW
+    # no replacement
+    assert degrade(ScmpAction.SCMP_ACT_TRAP, features) == ScmpAction.SCMP_ACT_TRAP
+
+
+def test_probe_filtered(tmp_path, in_child):
+    def child():
+        _features.clear_cache()
+        with Seccomp(ScmpAction.SCMP_ACT_ALLOW) as sc:
+            sc.add_rule(ScmpAction.SCMP_ACT_EPERM, "getpriority")
+            sc.load()
+        assert _features._filtered()
+        _features.probe(str(tmp_path))
+        # a filtered process does not write the disk cache
+        assert list(tmp_path.iterdir()) == []
+
+    assert not _features._filtered()
+    in_child(child)
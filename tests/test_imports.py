@@ -1,9 +1,29 @@
 def test_import():
     import seccomppolicy  # noqa: F401
+    import seccomppolicy.__main__  # noqa: F401
+    import seccomppolicy._analysis  # noqa: F401
+    import seccomppolicy._bpf  # noqa: F401
+    import seccomppolicy._bundle  # noqa: F401
+    import seccomppolicy._capprofile  # noqa: F401
+    import seccomppolicy._compiled  # noqa: F401
+    import seccomppolicy._compileserver  # noqa: F401
     import seccomppolicy._constants  # noqa: F401
     import seccomppolicy._containerpolicy  # noqa: F401
     import seccomppolicy._defaultpolicy  # noqa: F401
+    import seccomppolicy._features  # noqa: F401
+    import seccomppolicy._incremental  # noqa: F401
+    import seccomppolicy._installer  # noqa: F401
     import seccomppolicy._libc  # noqa: F401
     import seccomppolicy._libcap  # noqa: F401
     import seccomppolicy._libseccomp  # noqa: F401
+    import seccomppolicy._metrics  # noqa: F401
+    import seccomppolicy._peephole  # noqa: F401
+    import seccomppolicy._pool  # noqa: F401
+    import seccomppolicy._profilecache  # noqa: F401
+    import seccomppolicy._query  # noqa: F401
+    import seccomppolicy._scan  # noqa: F401
     import seccomppolicy._seccomp  # noqa: F401
+    import seccomppolicy._syscalltable  # noqa: F401
+    import seccomppolicy._template  # noqa: F401
+    import seccomppolicy._threads  # noqa: F401
+    import seccomppolicy._watch  # noqa: F401
@@ -0,0 +1,151 @@
+import ctypes
+import os
+
+import pytest
+
+from seccomppolicy import _defaultpolicy, _features
+from seccomppolicy._bpf import evaluate, fprog, install_fprog, seccomp_data
+from seccomppolicy._constants import ScmpAction, ScmpArch, ScmpCmp
+from seccomppolicy._containerpolicy import Policy, Rule, flatten
+from seccomppolicy._incremental import IncrementalCompiler
+from seccomppolicy._libseccomp import ScmpArg
+from seccomppolicy._pool import PreparedRules
+from seccomppolicy._seccomp import NATIVE_ARCH, Seccomp, Syscall
+
+ARGS = [(0,) * 6, (1, 2, 3, 4, 5, 6), (0x7E020000,) * 6, (2**64 - 1,) * 6]
+
+
+def _libseccomp(policy, arches=()):
+    with Seccomp(policy.default_action) as sc:
+        PreparedRules.from_policy(policy, arches).apply(sc)
+        return sc.export_bpf()
+
+
+def _assert_equivalent(expected, bpf, arch, numbers):
+    for nr in numbers:
+        for args in ARGS:
+            data = seccomp_data(nr, arch, 0, args)
+            assert evaluate(bpf, data) == evaluate(expected, data), (arch, nr, args)
+
+
+@pytest.mark.parametrize("arches", [(), (ScmpArch.SCMP_ARCH_X86,)])
+def test_default_policy(arches):
+    policy = flatten(_defaultpolicy.DEFAULT_ACTION, _defaultpolicy.SYSCALLS)
+    expected = _libseccomp(policy, arches)
+    bpf = IncrementalCompiler().compile(policy, arches)
+    for arch in (NATIVE_ARCH,) + arches + (ScmpArch.SCMP_ARCH_PPC64,):
+        _assert_equivalent(expected, bpf, arch, range(460))
+
+
+def test_incremental(in_child):
+    compiler = IncrementalCompiler()
+    rules = [
+        Rule(ScmpAction.SCMP_ACT_EPERM, "getpriority", ()),
+        Rule(
+            ScmpAction.SCMP_ACT_EPERM,
+            "setpriority",
+            (ScmpArg(2, ScmpCmp.SCMP_CMP_LT, 10),),
+        ),
+        Rule(
+            ScmpAction.SCMP_ACT_TRAP,
+            "personality",
+            (ScmpArg(0, ScmpCmp.SCMP_CMP_MASKED_EQ, 0xFF, 0x08),),
+        ),
+    ]
+    policy = Policy(ScmpAction.SCMP_ACT_ALLOW, tuple(rules))
+    bpf = compiler.compile(policy)
+    assert compiler.cache_info() == (0, 3, 3)
+    numbers = [Syscall(rule.syscall).nr for rule in rules]
+    _assert_equivalent(_libseccomp(policy), bpf, NATIVE_ARCH, numbers)
+
+    # change a single rule, other fragments are reused
+    rules[1] = Rule(
+        ScmpAction.SCMP_ACT_EPERM, "setpriority", (ScmpArg(2, ScmpCmp.SCMP_CMP_GE, 5),)
+    )
+    policy = Policy(ScmpAction.SCMP_ACT_ALLOW, tuple(rules))
+    bpf = compiler.compile(policy)
+    assert compiler.cache_info() == (2, 4, 4)
+    _assert_equivalent(_libseccomp(policy), bpf, NATIVE_ARCH, numbers)
+
+    def child():
+        prog, filters = fprog(bpf)
+        install_fprog(ctypes.addressof(prog))
+        with pytest.raises(PermissionError):
+            os.getpriority(os.PRIO_PROCESS, 0)
+
+    in_child(child)
+
+
+def test_multiplexed():
+    """socketcall() and ipc() calls are filtered on x86 like libseccomp"""
+    policy = Policy(
+        ScmpAction.SCMP_ACT_ALLOW,
+        (
+            Rule(
+                ScmpAction.SCMP_ACT_EPERM,
+                "socket",
+                (ScmpArg(0, ScmpCmp.SCMP_CMP_EQ, 16),),
+            ),
+            Rule(ScmpAction.SCMP_ACT_EACCES, "shmget", ()),
+            Rule(ScmpAction.SCMP_ACT_TRAP, "recv", ()),
+        ),
+    )
+    arches = (ScmpArch.SCMP_ARCH_X86,)
+    expected = _libseccomp(policy, arches)
+    bpf = IncrementalCompiler().compile(policy, arches)
+    for nr in (102, 117, 359, 395):
+        for call in range(26):
+            for args in [(call, 16), (call, 2), (call, 16, 16), (16,)]:
+                data = seccomp_data(nr, ScmpArch.SCMP_ARCH_X86, 0, args)
+                assert evaluate(bpf, data) == evaluate(expected, data), (nr, args)
+
+    # rules of the multiplexer itself come first
+    policy = Policy(
+        ScmpAction.SCMP_ACT_EPERM,
+        (
+            Rule(ScmpAction.SCMP_ACT_ALLOW, "socketcall", ()),
+            Rule(
+                ScmpAction.SCMP_ACT_KILL,
+                "socket",
+                (ScmpArg(0, ScmpCmp.SCMP_CMP_EQ, 2),),
+            ),
+        ),
+    )
+    bpf = IncrementalCompiler().compile(policy, arches)
+    data = seccomp_data(102, ScmpArch.SCMP_ARCH_X86, 0, (1,))
+    assert evaluate(bpf, data) == ScmpAction.SCMP_ACT_ALLOW
+
+
+def test_maxinsns():
+    policy = flatten(_defaultpolicy.DEFAULT_ACTION, _defaultpolicy.SYSCALLS)
+    arches = [
+        ScmpArch.SCMP_ARCH_X86,
+        ScmpArch.SCMP_ARCH_X32,
+        ScmpArch.SCMP_ARCH_ARM,
+        ScmpArch.SCMP_ARCH_AARCH64,
+        ScmpArch.SCMP_ARCH_MIPSEL,
+        ScmpArch.SCMP_ARCH_MIPSEL64,
+        ScmpArch.SCMP_ARCH_MIPSEL64N32,
+    ]
+    with pytest.raises(ValueError):
+        IncrementalCompiler().compile(policy, arches)
+
+
+def test_degrade(monkeypatch):
+    # pretend that the Kernel lacks SECCOMP_RET_LOG
+    def degrade_action(action):
+        if action == ScmpAction.SCMP_ACT_LOG:
+            return ScmpAction.SCMP_ACT_ALLOW
+        return action
+
+    monkeypatch.setattr(_features, "degrade_action", degrade_action)
+    policy = Policy(
+        ScmpAction.SCMP_ACT_ALLOW,
+        (Rule(ScmpAction.SCMP_ACT_LOG, "getpriority", ()),),
+    )
+    data = seccomp_data(Syscall("getpriority").nr, NATIVE_ARCH, 0, ARGS[0])
+    # actions are used as given by default, like Seccomp
+    bpf = IncrementalCompiler().compile(policy)
+    assert evaluate(bpf, data) == ScmpAction.SCMP_ACT_LOG
+    bpf = IncrementalCompiler(degrade=True).compile(policy)
+    assert evaluate(bpf, data) == ScmpAction.SCMP_ACT_ALLOW
@@ -0,0 +1,59 @@
+import concurrent.futures
+import multiprocessing
+import os
+import pickle
+import subprocess
+import sys
+
+import pytest
+
+from seccomppolicy._constants import ScmpAction, SeccompFilterFlag
+from seccomppolicy._containerpolicy import Policy, Rule
+from seccomppolicy._installer import FilterInstaller
+
+POLICY = Policy(
+    ScmpAction.SCMP_ACT_ALLOW, (Rule(ScmpAction.SCMP_ACT_EPERM, "getpriority", ()),)
+)
+
+CHECK = """
+import os
+try:
+    os.getpriority(os.PRIO_PROCESS, 0)
+except PermissionError:
+    print("blocked")
+"""
+
+
+def _getpriority(_):
+    try:
+        return os.getpriority(os.PRIO_PROCESS, 0)
+    except PermissionError:
+        return None
+
+
+def test_popen():
+    installer = FilterInstaller.from_policy(POLICY)
+    assert len(installer) == len(installer.bpf) // 8
+    out = subprocess.check_output([sys.executable, "-c", CHECK], preexec_fn=installer)
+    assert out.strip() == b"blocked"
+    # parent is not affected
+    os.getpriority(os.PRIO_PROCESS, 0)
+
+
+@pytest.mark.skipif(
+    sys.version_info < (3, 7), reason="ProcessPoolExecutor initializer needs 3.7"
+)
+def test_process_pool():
+    installer = FilterInstaller.from_policy(POLICY, flags=SeccompFilterFlag.LOG)
+    ctx = multiprocessing.get_context("fork")
+    with concurrent.futures.ProcessPoolExecutor(
+        2, mp_context=ctx, initializer=installer
+    ) as pool:
+        assert list(pool.map(_getpriority, range(4))) == [None] * 4
+
+
+def test_pickle():
+    installer = FilterInstaller.from_policy(POLICY)
+    clone = pickle.loads(pickle.dumps(installer))
+    assert clone.bpf == installer.bpf
+    assert clone.flags == installer.flags
@@ -0,0 +1,107 @@
+import fnmatch
+import json
+import os
+import subprocess
+import sys
+
+from seccomppolicy._constants import ScmpArch
+
+PROFILE = {
+    "defaultAction": "SCMP_ACT_ALLOW",
+    "syscalls": [
+        {
+            "names": ["getpriority"],
+            "action": "SCMP_ACT_EPERM",
+            "comment": "",
+            "args": [],
+        }
+    ],
+}
+
+CHECK = """
+import os
+try:
+    os.getpriority(os.PRIO_PROCESS, 0)
+except PermissionError:
+    print("blocked")
+"""
+
+
+def _run(tmp_path, profile):
+    cmd = [
+        sys.executable,
+        "-m",
+        "seccomppolicy",
+        "run",
+        "--profile",
+        str(profile),
+        "--cache-dir",
+        str(tmp_path / "cache"),
+        "--timing",
+        "--",
+        sys.executable,
+        "-c",
+        CHECK,
+    ]
+    return subprocess.run(
+        cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True
+    )
+
+
+def test_run(tmp_path):
+    profile = tmp_path / "seccomp.json"
+    profile.write_text(json.dumps(PROFILE))
+
+    proc = _run(tmp_path, profile)
+    assert proc.stdout.strip() == b"blocked"
+    assert b"compiled" in proc.stderr
+    (bundle,) = fnmatch.filter(os.listdir(str(tmp_path / "cache")), "*.bundle")
+    assert sorted(os.listdir(str(tmp_path / "cache"))) == [bundle, bundle + ".lock"]
+
+    # second run uses compiled artifact
+    proc = _run(tmp_path, profile)
+    assert proc.stdout.strip() == b"blocked"
+    assert b"cached" in proc.stderr
+
+
+def test_default_caps_imports():
+    # --caps default must not load libseccomp or the policy modules
+    code = (
+        "import sys\n"
+        "from seccomppolicy.__main__ import _parse_caps\n"
+        "assert _parse_caps('default')\n"
+        "assert 'seccomppolicy._libseccomp' not in sys.modules\n"
+        "assert 'seccomppolicy._defaultpolicy' not in sys.modules\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_policy_hash(tmp_path):
+    from seccomppolicy.__main__ import _policy_hash
+
+    profile = tmp_path / "seccomp.json"
+    profile.write_text(json.dumps(PROFILE))
+    x86_64, x86 = ScmpArch.SCMP_ARCH_X86_64, ScmpArch.SCMP_ARCH_X86
+    key = _policy_hash(str(profile), "2.5.4", x86_64)
+    assert key != _policy_hash(str(profile), "2.5.5", x86_64)
+    # 32bit and 64bit interpreters do not share a bundle
+    assert key != _policy_hash(str(profile), "2.5.4", x86)
+
+
+def test_variant():
+    from seccomppolicy.__main__ import _variant
+
+    variant = _variant(ScmpArch.SCMP_ARCH_MIPSEL64N32, 0)
+    assert variant.machine == "mipsel64n32"
+    assert variant != _variant(ScmpArch.SCMP_ARCH_MIPSEL64, 0)
+
+
+def test_run_default_action_rule(tmp_path):
+    # rules with the default action are common in container profiles
+    profile = tmp_path / "seccomp.json"
+    syscalls = PROFILE["syscalls"] + [
+        {"names": ["getpid", "kexec_load"], "action": "SCMP_ACT_ALLOW", "comment": ""}
+    ]
+    profile.write_text(json.dumps(dict(PROFILE, syscalls=syscalls)))
+    proc = _run(tmp_path, profile)
+    assert proc.stdout.strip() == b"blocked"
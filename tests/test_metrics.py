@@ -0,0 +1,85 @@
+import itertools
+import socket
+
+from seccomppolicy._constants import ScmpArch
+from seccomppolicy._metrics import (
+    DenialCounters,
+    follow_file,
+    parse_record,
+    render,
+    serve_unix,
+)
+from seccomppolicy._seccomp import Syscall
+
+X86_64 = int(ScmpArch.SCMP_ARCH_X86_64)
+
+LINE = (
+    "type=SECCOMP msg=audit(1600000000.123:456): auid=1000 uid=1000 gid=1000 "
+    'ses=2 subj=unconfined pid=1234 comm="python3" exe="/usr/bin/python3.9" '
+    "sig=0 arch={:x} syscall={} compat=0 ip=0x7f5b2c8a6f2b code={:#x}"
+)
+
+
+def _line(nr=140, code=0x50001, arch=X86_64):
+    return LINE.format(arch, nr, code)
+
+
+def test_parse_record():
+    record = parse_record(_line())
+    assert record.pid == 1234
+    assert record.comm == "python3"
+    assert record.arch == X86_64
+    assert record.syscall == 140
+    assert record.action == "errno"
+    assert parse_record(_line(code=0x7FFC0000)).action == "log"
+    assert parse_record(_line(code=0x80000000)).action == "kill_process"
+    # hex encoded comm
+    hexline = _line().replace('comm="python3"', "comm=6D7920636F6D6D")
+    assert parse_record(hexline).comm == "my comm"
+    assert parse_record("type=SYSCALL msg=audit(1.0:1): arch=c000003e") is None
+
+
+def test_counters():
+    counters = DenialCounters(maxsize=2)
+    counters.add(parse_record(_line(nr=140)))
+    counters.add(parse_record(_line(nr=140)))
+    counters.add(parse_record(_line(nr=141)))
+    counters.add(parse_record(_line(nr=142)))
+    assert len(counters) == 2
+    name = Syscall(140, ScmpArch.SCMP_ARCH_X86_64).name
+    snapshot = dict(counters.snapshot())
+    # oldest series was folded into the overflow series
+    assert ("python3", name, "errno") not in snapshot
+    assert snapshot[("__other__", "__other__", "errno")] == 2
+    assert sum(snapshot.values()) == 4
+
+    text = render(counters)
+    assert "# TYPE seccomp_actions_total counter" in text
+    assert 'seccomp_actions_total{comm="__other__"' in text
+
+
+def test_follow_file(tmp_path):
+    filename = tmp_path / "audit.log"
+    filename.write_text(_line() + "\n" + _line(nr=141) + "\n")
+    lines = list(itertools.islice(follow_file(str(filename), from_start=True), 2))
+    assert [parse_record(line).syscall for line in lines] == [140, 141]
+
+
+def test_serve_unix(tmp_path):
+    counters = DenialCounters()
+    counters.add(parse_record(_line()))
+    path = str(tmp_path / "metrics.sock")
+    server = serve_unix(path, counters)
+    try:
+        with socket.socket(socket.AF_UNIX) as sock:
+            sock.connect(path)
+            data = b""
+            while True:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert data.decode("utf-8") == render(counters)
@@ -0,0 +1,120 @@
+import pytest
+
+from seccomppolicy import _defaultpolicy
+from seccomppolicy._bpf import (
+    BPF_ABS,
+    BPF_JEQ,
+    BPF_JGE,
+    BPF_JMP,
+    BPF_K,
+    BPF_LD,
+    BPF_RET,
+    BPF_W,
+    decode,
+    encode,
+    evaluate,
+    insn,
+    seccomp_data,
+)
+from seccomppolicy._compiled import build
+from seccomppolicy._constants import ScmpAction, ScmpArch
+from seccomppolicy._containerpolicy import Policy, Rule, flatten
+from seccomppolicy._incremental import IncrementalCompiler
+from seccomppolicy._peephole import optimize, stats, verify
+from seccomppolicy._seccomp import NATIVE_ARCH
+from seccomppolicy._syscalltable import get_table
+
+ALLOW = ScmpAction.SCMP_ACT_ALLOW
+KILL = ScmpAction.SCMP_ACT_KILL_THREAD
+
+
+def _chain(numbers, target=ALLOW, default=KILL):
+    """Program that returns target for numbers, like libseccomp"""
+    code = [insn(BPF_LD | BPF_W | BPF_ABS, 0)]
+    for i, nr in enumerate(numbers):
+        code.append(insn(BPF_JMP | BPF_JEQ | BPF_K, nr, len(numbers) - i, 0))
+    code.append(insn(BPF_RET | BPF_K, default))
+    code.append(insn(BPF_RET | BPF_K, target))
+    return b"".join(code)
+
+
+@pytest.mark.parametrize("compiler", ["libseccomp", "incremental"])
+def test_default_policy(compiler):
+    policy = flatten(_defaultpolicy.DEFAULT_ACTION, _defaultpolicy.SYSCALLS)
+    arches = tuple(_defaultpolicy.SUB_ARCHITECTURES.get(NATIVE_ARCH, ()))
+    if compiler == "libseccomp":
+        bpf = build(policy, arches).bpf
+    else:
+        bpf = IncrementalCompiler().compile(policy, arches)
+    optimized = optimize(bpf, NATIVE_ARCH)
+    assert verify(bpf, optimized, (NATIVE_ARCH,) + arches) == []
+    before = stats(bpf)
+    after = stats(optimized)
+    assert after.instructions < before.instructions
+    assert after.longest_path < before.longest_path
+
+
+def test_ranges():
+    bpf = _chain([1, 2, 3, 4, 5, 7, 10, 11])
+    optimized = optimize(bpf)
+    # jge 1, jgt 5, jeq 7, jeq 10, jeq 11
+    assert [code for code, _, _, _ in decode(optimized)].count(
+        BPF_JMP | BPF_JGE | BPF_K
+    ) == 1
+    assert stats(optimized).instructions == 8
+    assert verify(bpf, optimized) == []
+    for nr in range(-1, 14):
+        data = seccomp_data(nr, NATIVE_ARCH)
+        assert evaluate(optimized, data) == evaluate(bpf, data)
+
+
+def test_far_jumps():
+    # alternating actions, most jumps to the returns are out of reach
+    numbers = get_table().numbers()
+    names = sorted(numbers, key=numbers.get)
+    policy = Policy(
+        ALLOW,
+        tuple(
+            Rule(ScmpAction.errno(1 + i % 2), name, ()) for i, name in enumerate(names)
+        ),
+    )
+    bpf = build(policy).bpf
+    optimized = optimize(bpf)
+    assert len(optimized) <= len(bpf)
+    assert verify(bpf, optimized) == []
+
+
+def test_native_first():
+    policy = Policy(ALLOW, (Rule(ScmpAction.SCMP_ACT_EPERM, "getpriority", ()),))
+    arches = (ScmpArch.SCMP_ARCH_X86, ScmpArch.SCMP_ARCH_AARCH64)
+    bpf = build(policy, arches).bpf
+    for native in (ScmpArch.SCMP_ARCH_AARCH64, NATIVE_ARCH):
+        optimized = optimize(bpf, native)
+        # load of seccomp_data.arch, then the native arch
+        assert decode(optimized)[1][3] == native
+        assert verify(bpf, optimized, (NATIVE_ARCH,) + arches) == []
+
+
+def test_verify():
+    bpf = _chain([1, 2, 3])
+    changed = _chain([1, 2, 4])
+    mismatches = verify(bpf, changed)
+    assert {m.data.nr for m in mismatches} == {3, 4}
+    (mismatch,) = [m for m in mismatches if m.data.nr == 3]
+    assert (mismatch.before, mismatch.after) == (ALLOW, KILL)
+    with pytest.raises(ValueError):
+        optimize(encode([(BPF_JMP | BPF_JGE | BPF_K, 5, 0, 0)]))
+
+
+def test_build_optimize():
+    policy = Policy(
+        ALLOW,
+        tuple(
+            Rule(ScmpAction.SCMP_ACT_EPERM, name, ())
+            for name in ("getpriority", "setpriority", "getpid", "getppid")
+        ),
+    )
+    compiled = build(policy, optimize=True)
+    expected = build(policy)
+    assert len(compiled) <= len(expected)
+    assert verify(expected.bpf, compiled.bpf) == []
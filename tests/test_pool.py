@@ -0,0 +1,69 @@
+import pytest
+
+from seccomppolicy._constants import ScmpAction
+from seccomppolicy._containerpolicy import Policy, Rule
+from seccomppolicy._pool import PreparedRules, SeccompPool
+from seccomppolicy._seccomp import Seccomp
+
+BASE = [
+    Rule(ScmpAction.SCMP_ACT_ALLOW, "read", ()),
+    Rule(ScmpAction.SCMP_ACT_ALLOW, "write", ()),
+]
+
+
+def _plain(rules):
+    with Seccomp(ScmpAction.SCMP_ACT_KILL) as sc:
+        for rule in rules:
+            sc.add_rule(rule.action, rule.syscall, *rule.args)
+        return sc.export_pfc()
+
+
+def test_pool_variants():
+    delta_a = PreparedRules([Rule(ScmpAction.SCMP_ACT_ALLOW, "close", ())])
+    delta_b = [Rule(ScmpAction.SCMP_ACT_EPERM, "open", ())]
+    with SeccompPool(ScmpAction.SCMP_ACT_KILL, BASE, maxsize=1) as pool:
+        for _ in range(3):
+            with pool.variant(delta_a) as sc:
+                assert sc.export_pfc() == _plain(
+                    BASE + [Rule(ScmpAction.SCMP_ACT_ALLOW, "close", ())]
+                )
+            with pool.variant(delta_b) as sc:
+                assert sc.export_pfc() == _plain(BASE + delta_b)
+        assert len(pool._idle) == 1
+
+
+def test_pool_reuse():
+    delta_a = PreparedRules([Rule(ScmpAction.SCMP_ACT_ALLOW, "close", ())])
+    delta_b = PreparedRules([Rule(ScmpAction.SCMP_ACT_EPERM, "open", ())])
+    with SeccompPool(ScmpAction.SCMP_ACT_KILL, BASE, maxsize=2) as pool:
+        with pool.variant(delta_a) as first:
+            expected = first.export_pfc()
+        with pool.variant(delta_b) as second:
+            assert second is not first
+        # same delta gets the context that already holds its rules
+        with pool.variant(delta_a) as sc:
+            assert sc is first
+            assert sc.export_pfc() == expected
+        # equal rules in another delta object reuse the context, too
+        with pool.variant([Rule(ScmpAction.SCMP_ACT_ALLOW, "close", ())]) as sc:
+            assert sc is first
+            with pytest.raises(RuntimeError):
+                sc.add_rule(ScmpAction.SCMP_ACT_ALLOW, "close")
+            with pytest.raises(RuntimeError):
+                sc.reset()
+        assert sc.export_pfc() == expected
+
+
+def test_default_action_rules():
+    policy = Policy(
+        ScmpAction.SCMP_ACT_ERRNO,
+        (
+            Rule(ScmpAction.SCMP_ACT_ALLOW, "read", ()),
+            Rule(ScmpAction.SCMP_ACT_ERRNO, "kexec_load", ()),
+        ),
+    )
+    # libseccomp rejects rules with the default action
+    prepared = PreparedRules.from_policy(policy)
+    assert len(prepared) == 1
+    with Seccomp(policy.default_action) as sc:
+        prepared.apply(sc)
@@ -0,0 +1,80 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from seccomppolicy._containerpolicy import flatten, load_file
+from seccomppolicy._profilecache import ProfileCache
+
+PROFILE = {
+    "defaultAction": "SCMP_ACT_ERRNO",
+    "archMap": [
+        {
+            "architecture": "SCMP_ARCH_X86_64",
+            "subArchitectures": ["SCMP_ARCH_X86", "SCMP_ARCH_X32"],
+        }
+    ],
+    "syscalls": [
+        {
+            "names": ["read", "write"],
+            "action": "SCMP_ACT_ALLOW",
+            "comment": "",
+        },
+        {
+            "names": ["personality"],
+            "action": "SCMP_ACT_ALLOW",
+            "comment": "",
+            "args": [{"index": 0, "value": 8, "valueTwo": 0, "op": "SCMP_CMP_EQ"}],
+        },
+        {
+            "names": ["socket"],
+            "action": "SCMP_ACT_ALLOW",
+            "comment": "",
+            "includes": {"caps": ["CAP_AUDIT_WRITE"], "minKernel": "4.8"},
+        },
+    ],
+}
+
+
+@pytest.fixture
+def profile(tmp_path):
+    filename = tmp_path / "seccomp.json"
+    filename.write_text(json.dumps(PROFILE))
+    return str(filename)
+
+
+def test_cache(profile, tmp_path):
+    cache = ProfileCache(maxsize=2)
+    config = cache.load(profile)
+    assert cache.load(profile) is config
+    assert cache.cache_info() == (1, 0, 1, 1)
+    # immutable and equivalent to load_file()
+    with pytest.raises(TypeError):
+        config["syscalls"] = ()
+    expected = load_file(profile)
+    assert flatten(config["default_action"], config["syscalls"]) == flatten(
+        expected["default_action"], expected["syscalls"]
+    )
+
+    # same content, different file identity
+    copy = str(tmp_path / "copy.json")
+    shutil.copy(profile, copy)
+    assert cache.load(copy) is config
+    assert cache.cache_info() == (1, 1, 1, 1)
+
+    # modified file
+    with open(profile, "a") as f:
+        f.write("\n")
+    os.utime(profile, ns=(0, 0))
+    assert cache.load(profile) is not config
+    assert cache.cache_info() == (1, 1, 2, 2)
+
+
+def test_disk_cache(profile, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    config = ProfileCache(cache_dir=cache_dir).load(profile)
+    assert len(os.listdir(cache_dir)) == 1
+    other = ProfileCache(cache_dir=cache_dir).load(profile)
+    assert other is not config
+    assert other == config
@@ -0,0 +1,110 @@
+import json
+
+import pytest
+
+from seccomppolicy._analysis import SyscallSpace, evaluate, syscall_rules
+from seccomppolicy._constants import Capabilities, ScmpAction, ScmpArch
+from seccomppolicy._containerpolicy import ExcludeCondition, flatten, loads
+from seccomppolicy._defaultpolicy import DEFAULT_ACTION, SYSCALLS
+from seccomppolicy._query import HostFacts, PolicyIndex
+from seccomppolicy._seccomp import NATIVE_ARCH
+from seccomppolicy._syscalltable import get_table
+
+PROFILE = {
+    "defaultAction": "SCMP_ACT_ERRNO",
+    "archMap": [
+        {
+            "architecture": "SCMP_ARCH_X86_64",
+            "subArchitectures": ["SCMP_ARCH_X86", "SCMP_ARCH_X32"],
+        }
+    ],
+    "syscalls": [
+        {"names": ["read", "write"], "action": "SCMP_ACT_ALLOW", "comment": "io"},
+        {
+            "names": ["personality"],
+            "action": "SCMP_ACT_ALLOW",
+            "comment": "",
+            "args": [{"index": 0, "value": 8, "valueTwo": 0, "op": "SCMP_CMP_EQ"}],
+        },
+        {
+            "names": ["setpriority"],
+            "action": "SCMP_ACT_ALLOW",
+            "comment": "",
+            "excludes": {"caps": ["CAP_SYS_NICE"]},
+        },
+    ],
+}
+
+X86_64 = HostFacts(ScmpArch.SCMP_ARCH_X86_64, (), "5.10")
+
+
+def test_exclude_condition():
+    excludes = ExcludeCondition(caps=[Capabilities.CAP_SYS_ADMIN])
+    assert excludes.check(effective={Capabilities.CAP_SYS_ADMIN})
+    assert not excludes.check(effective=set())
+    excludes = ExcludeCondition(arches=[ScmpArch.SCMP_ARCH_S390X])
+    assert excludes.check(arch=ScmpArch.SCMP_ARCH_S390X)
+    assert not excludes.check(arch=ScmpArch.SCMP_ARCH_X86_64)
+
+
+def test_host_facts():
+    facts = HostFacts.current()
+    assert facts.arch == NATIVE_ARCH
+    assert HostFacts(caps=[Capabilities.CAP_KILL]).caps == {Capabilities.CAP_KILL}
+
+
+def test_query_profile():
+    index = PolicyIndex.from_config(loads(json.dumps(PROFILE)))
+    decision = index.query("read", facts=X86_64)
+    assert decision.action == ScmpAction.SCMP_ACT_ALLOW
+    assert decision.candidate.comment == "io"
+    assert index.query("personality", [8], facts=X86_64).action == (
+        ScmpAction.SCMP_ACT_ALLOW
+    )
+    assert index.query("personality", [9], facts=X86_64) == (
+        ScmpAction.SCMP_ACT_ERRNO,
+        None,
+    )
+    # excluded with CAP_SYS_NICE
+    facts = X86_64._replace(caps=frozenset([Capabilities.CAP_SYS_NICE]))
+    assert index.query("setpriority", facts=facts).action == ScmpAction.SCMP_ACT_ERRNO
+    assert index.query("setpriority", facts=X86_64).action == ScmpAction.SCMP_ACT_ALLOW
+
+    # sub architecture and architectures outside the filter
+    assert index.query("read", arch=ScmpArch.SCMP_ARCH_X86, facts=X86_64).action == (
+        ScmpAction.SCMP_ACT_ALLOW
+    )
+    decision = index.query("read", arch=ScmpArch.SCMP_ARCH_AARCH64, facts=X86_64)
+    assert decision == (ScmpAction.SCMP_ACT_KILL_THREAD, None)
+
+    nr = get_table().resolve_name("write", ScmpArch.SCMP_ARCH_X86_64)
+    assert index.candidates(nr, ScmpArch.SCMP_ARCH_X86_64)[0].position == 0
+    with pytest.raises(ValueError):
+        index.query("no_such_syscall", facts=X86_64)
+
+    decisions = index.query_batch(
+        [("read", ()), ("personality", (9,)), ("write", (), ScmpArch.SCMP_ARCH_X32)],
+        facts=X86_64,
+    )
+    assert [d.action for d in decisions] == [
+        ScmpAction.SCMP_ACT_ALLOW,
+        ScmpAction.SCMP_ACT_ERRNO,
+        ScmpAction.SCMP_ACT_ALLOW,
+    ]
+
+
+@pytest.mark.parametrize(
+    "caps", [(), (Capabilities.CAP_SYS_ADMIN, Capabilities.CAP_AUDIT_WRITE)]
+)
+def test_query_default_policy(caps):
+    """Query results agree with the flattened policy"""
+    facts = HostFacts(caps=caps)
+    index = PolicyIndex.default()
+    policy = flatten(DEFAULT_ACTION, SYSCALLS, caps)
+    rules = syscall_rules(policy)
+    for nr in sorted(rules):
+        space = SyscallSpace(rules[nr])
+        for cells in space:
+            values = space.values(cells)
+            expected = evaluate(rules[nr], DEFAULT_ACTION, values)
+            assert index.query(nr, values, facts=facts).action == expected, nr
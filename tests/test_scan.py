@@ -0,0 +1,63 @@
+import io
+import json
+import os
+
+from seccomppolicy._scan import parse_status, scan, write_csv, write_json
+
+STATUS = b"""\
+Name:\tpython3
+Umask:\t0022
+State:\tS (sleeping)
+Pid:\t42
+NoNewPrivs:\t1
+Seccomp:\t2
+Seccomp_filters:\t3
+CapInh:\t0000000000000000
+CapPrm:\t0000000000000003
+CapEff:\t0000000000000001
+CapBnd:\t000001ffffffffff
+CapAmb:\t0000000000000000
+"""
+
+
+def test_parse_status():
+    status = parse_status(STATUS, 42)
+    assert status.pid == status.tid == 42
+    assert status.name == "python3"
+    assert status.seccomp == 2
+    assert status.filters == 3
+    assert status.no_new_privs is True
+    assert status.cap_prm == 3
+    assert status.cap_eff == 1
+    # Kernel without Seccomp_filters
+    old = parse_status(STATUS.replace(b"Seccomp_filters:\t3\n", b""), 42, 43)
+    assert old.tid == 43
+    assert old.filters is None
+
+
+def test_scan_self():
+    statuses = scan(tasks=True)
+    pids = {status.pid for status in statuses}
+    assert os.getpid() in pids
+
+
+def test_scan_vanished(tmp_path):
+    (tmp_path / "1").mkdir()
+    (tmp_path / "1" / "status").write_bytes(STATUS)
+    # process exited between listdir() and open()
+    (tmp_path / "2").mkdir()
+    statuses = scan(tasks=True, proc=str(tmp_path))
+    assert [status.pid for status in statuses] == [1]
+
+
+def test_output():
+    statuses = [parse_status(STATUS, 42)]
+    out = io.StringIO()
+    write_json(statuses, out)
+    record = json.loads(out.getvalue())[0]
+    assert record["cap_prm"] == ["CAP_CHOWN", "CAP_DAC_OVERRIDE"]
+    out = io.StringIO()
+    write_csv(statuses, out)
+    lines = out.getvalue().splitlines()
+    assert lines[0].startswith("pid,tid,name,seccomp,filters")
+    assert "CAP_CHOWN CAP_DAC_OVERRIDE" in lines[1]
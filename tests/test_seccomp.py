@@ -0,0 +1,132 @@
+import errno
+
+import pytest
+
+from seccomppolicy._constants import (
+    ScmpAction,
+    ScmpCmp,
+    ScmpFilterAttr,
+    SeccompFilterFlag,
+)
+from seccomppolicy import _libc, _seccomp
+from seccomppolicy._features import probe
+from seccomppolicy._installer import FilterInstaller
+from seccomppolicy._libseccomp import ScmpArg
+from seccomppolicy._seccomp import RuleErrors, Seccomp, Syscall
+
+ARG = (ScmpArg(0, ScmpCmp.SCMP_CMP_EQ, 1),)
+
+
+def test_add_rules():
+    read = Syscall("read").nr
+    write = Syscall("write").nr
+    rules = [
+        (ScmpAction.SCMP_ACT_EPERM, read, ARG),
+        (ScmpAction.SCMP_ACT_EPERM, write, ARG),
+        # same as default action
+        (ScmpAction.SCMP_ACT_ALLOW, write, ()),
+        (ScmpAction.SCMP_ACT_KILL, Syscall("getpriority").nr, ()),
+    ]
+    with Seccomp(ScmpAction.SCMP_ACT_ALLOW, degrade=True) as sc:
+        # skipped with degrade
+        assert sc.add_rules(rules) == 3
+        pfc = sc.export_pfc()
+    assert "if ($syscall == {})".format(read) in pfc
+    assert "if ($syscall == {})".format(write) in pfc
+
+    with Seccomp(ScmpAction.SCMP_ACT_ALLOW) as sc:
+        with pytest.raises(RuleErrors) as excinfo:
+            sc.add_rules(rules)
+        assert excinfo.value.errno == errno.EACCES
+        assert excinfo.value.failures[0][0] == rules[2]
+
+
+def test_add_rules_errors():
+    invalid = (ScmpArg.unchecked(6, ScmpCmp.SCMP_CMP_EQ, 1),)
+    read = Syscall("read").nr
+    with Seccomp(ScmpAction.SCMP_ACT_ALLOW) as sc:
+        with pytest.raises(RuleErrors) as excinfo:
+            sc.add_rules(
+                [
+                    (ScmpAction.SCMP_ACT_EPERM, read, invalid),
+                    (ScmpAction.SCMP_ACT_EPERM, Syscall("write").nr, ARG),
+                    (ScmpAction.SCMP_ACT_EPERM, read, invalid),
+                ]
+            )
+        # all rules are tried
+        assert len(excinfo.value.failures) == 2
+        assert excinfo.value.failures[0][0] == (
+            ScmpAction.SCMP_ACT_EPERM,
+            read,
+            invalid,
+        )
+        assert isinstance(excinfo.value, OSError)
+
+
+def test_spec_allow():
+    with Seccomp(ScmpAction.SCMP_ACT_ALLOW) as sc:
+        assert not sc.get_attr(ScmpFilterAttr.SCMP_FLTATR_CTL_SSB)
+        assert not sc.filter_flags() & SeccompFilterFlag.SPEC_ALLOW
+    if not probe().has_flag(SeccompFilterFlag.SPEC_ALLOW):
+        pytest.skip("SECCOMP_FILTER_FLAG_SPEC_ALLOW not supported")
+    with Seccomp(ScmpAction.SCMP_ACT_ALLOW, spec_allow=True) as sc:
+        assert sc.get_attr(ScmpFilterAttr.SCMP_FLTATR_CTL_SSB)
+        assert sc.filter_flags() & SeccompFilterFlag.SPEC_ALLOW
+        # attribute survives reset
+        sc.reset()
+        assert sc.filter_flags() & SeccompFilterFlag.SPEC_ALLOW
+        installer = FilterInstaller.from_seccomp(sc)
+    assert installer.flags & SeccompFilterFlag.SPEC_ALLOW
+
+
+def test_filter_flags_unknown_attr(monkeypatch):
+    get_attr = Seccomp.get_attr
+
+    def old_get_attr(self, attr):
+        # libseccomp < 2.4 does not know SCMP_FLTATR_CTL_LOG, < 2.5 CTL_SSB
+        if attr in (
+            ScmpFilterAttr.SCMP_FLTATR_CTL_LOG,
+            ScmpFilterAttr.SCMP_FLTATR_CTL_SSB,
+        ):
+            raise OSError(errno.EINVAL, "seccomp_attr_get")
+        return get_attr(self, attr)
+
+    monkeypatch.setattr(Seccomp, "get_attr", old_get_attr)
+    for spec_allow in (False, True):
+        with Seccomp(ScmpAction.SCMP_ACT_ALLOW, spec_allow=spec_allow) as sc:
+            sc.set_attr(ScmpFilterAttr.SCMP_FLTATR_CTL_TSYNC, 1)
+            assert sc.filter_flags() == SeccompFilterFlag.TSYNC
+
+
+def test_log_flag(monkeypatch):
+    if not probe().has_flag(SeccompFilterFlag.LOG):
+        pytest.skip("SECCOMP_FILTER_FLAG_LOG not supported")
+    loaded = []
+    monkeypatch.setattr(
+        _seccomp, "install_fprog", lambda addr, flags, nnp: loaded.append(flags)
+    )
+    with Seccomp(ScmpAction.SCMP_ACT_ALLOW) as sc:
+        sc.set_attr(ScmpFilterAttr.SCMP_FLTATR_CTL_LOG, 1)
+        sc.set_attr(ScmpFilterAttr.SCMP_FLTATR_CTL_TSYNC, 1)
+        expected = SeccompFilterFlag.TSYNC | SeccompFilterFlag.LOG
+        assert sc.filter_flags() == expected
+        assert FilterInstaller.from_seccomp(sc).flags == expected
+        # TSYNC filters are installed directly, not by seccomp_load()
+        sc.load()
+    assert loaded == [expected]
+
+
+def test_sys_seccomp():
+    # libc's seccomp() uses the syscall number of the interpreter's ABI
+    assert _libc._SYS_SECCOMP == Syscall("seccomp").nr
+
+
+def test_reset_released():
+    sc = Seccomp(ScmpAction.SCMP_ACT_KILL)
+    # seccomp_reset(NULL) would reset the global state of libseccomp
+    with pytest.raises(RuntimeError):
+        sc.reset()
+    with sc:
+        sc.reset()
+    with pytest.raises(RuntimeError):
+        sc.reset()
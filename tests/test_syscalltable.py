@@ -0,0 +1,100 @@
+import sys
+
+import pytest
+
+from seccomppolicy import _libseccomp as lsc
+from seccomppolicy import _syscalltable
+from seccomppolicy._constants import ScmpArch
+from seccomppolicy._seccomp import NATIVE_ARCH
+from seccomppolicy._syscalltable import (
+    TABLE_FILE,
+    SyscallTable,
+    generate,
+    get_table,
+    native_arch,
+    resolve_name,
+    resolve_num,
+)
+
+ARCHES = [
+    ScmpArch.SCMP_ARCH_X86_64,
+    ScmpArch.SCMP_ARCH_X32,
+    ScmpArch.SCMP_ARCH_MIPS64N32,
+    ScmpArch.SCMP_ARCH_ARM,
+    ScmpArch.SCMP_ARCH_S390X,
+]
+
+# the shipped table is generated with one libseccomp release, other releases
+# know more or fewer syscalls
+SAME_LIBSECCOMP = get_table().libseccomp == str(lsc.seccomp_version().contents)
+
+
+@pytest.mark.parametrize("arch", ARCHES)
+def test_matches_libseccomp(arch):
+    table = get_table()
+    assert arch in table.arches
+    for name in table.names():
+        encoded = name.encode("ascii")
+        try:
+            expected = lsc.seccomp_syscall_resolve_name_arch(arch, encoded)
+        except ValueError:
+            if SAME_LIBSECCOMP:
+                with pytest.raises(ValueError):
+                    table.resolve_name(name, arch)
+            continue
+        assert table.resolve_name(name, arch) == expected
+        if expected >= 0:
+            assert table.resolve_num(expected, arch) == (
+                lsc.seccomp_syscall_resolve_num_arch(arch, expected)
+            )
+
+
+def test_resolve():
+    assert native_arch() == NATIVE_ARCH
+    nr = lsc.seccomp_syscall_resolve_name_arch(NATIVE_ARCH, b"getpriority")
+    assert resolve_name("getpriority") == nr
+    assert resolve_num(nr) == "getpriority"
+    # x32 syscalls are offset by __X32_SYSCALL_BIT
+    assert resolve_name("read", ScmpArch.SCMP_ARCH_X32) == 0x40000000
+    assert resolve_name("read", ScmpArch.SCMP_ARCH_MIPS64N32) == 6000
+    # pseudo syscall number
+    assert resolve_name("socketcall", ScmpArch.SCMP_ARCH_X86_64) < 0
+    with pytest.raises(ValueError):
+        resolve_name("no_such_syscall")
+    with pytest.raises(ValueError):
+        resolve_num(-4242)
+
+
+def test_generate(tmp_path):
+    filename = str(tmp_path / "syscalls.bin")
+    generate(filename)
+    if SAME_LIBSECCOMP:
+        with open(filename, "rb") as f, open(TABLE_FILE, "rb") as g:
+            assert f.read() == g.read()
+    with SyscallTable(filename) as table:
+        assert table.libseccomp == str(lsc.seccomp_version().contents)
+
+    with open(filename, "r+b") as f:
+        f.write(b"XXXXXXXX")
+    with pytest.raises(ValueError):
+        SyscallTable(filename)
+
+
+@pytest.mark.parametrize(
+    "machine, is64, elf, arch",
+    [
+        ("mips64", False, (False, 8, 0x20), ScmpArch.SCMP_ARCH_MIPSEL64N32),
+        ("mips64", False, (False, 8, 0), ScmpArch.SCMP_ARCH_MIPSEL),
+        ("mips64", True, (True, 8, 0), ScmpArch.SCMP_ARCH_MIPSEL64),
+        ("x86_64", False, (False, 62, 0), ScmpArch.SCMP_ARCH_X32),
+        ("x86_64", False, (False, 3, 0), ScmpArch.SCMP_ARCH_X86),
+        ("aarch64", False, None, ScmpArch.SCMP_ARCH_ARM),
+        ("armv8l", False, None, ScmpArch.SCMP_ARCH_ARM),
+    ],
+)
+def test_native_arch_abi(monkeypatch, machine, is64, elf, arch):
+    monkeypatch.setattr(_syscalltable, "_machine", lambda: machine)
+    monkeypatch.setattr(sys, "maxsize", 2**63 - 1 if is64 else 2**31 - 1)
+    monkeypatch.setattr(sys, "byteorder", "little")
+    monkeypatch.setattr(_syscalltable, "_interpreter_elf", lambda: elf)
+    assert native_arch() == arch
@@ -0,0 +1,117 @@
+import errno
+import os
+
+import pytest
+
+from seccomppolicy._compiled import build
+from seccomppolicy._constants import ScmpAction, ScmpCmp
+from seccomppolicy._containerpolicy import Policy, Rule
+from seccomppolicy._libseccomp import ScmpArg
+from seccomppolicy._template import DATUM, ERRNO, TRACE, FilterTemplate, LayoutError
+
+PARAMS = {"errno": ERRNO, "trace": TRACE, "persona": DATUM, "persona2": DATUM}
+
+
+def _factory(values):
+    return Policy(
+        ScmpAction.SCMP_ACT_ALLOW,
+        (
+            Rule(ScmpAction.errno(values["errno"]), "getpriority", ()),
+            Rule(ScmpAction.trace(values["trace"]), "getppid", ()),
+            Rule(
+                ScmpAction.SCMP_ACT_EPERM,
+                "personality",
+                (ScmpArg(0, ScmpCmp.SCMP_CMP_EQ, values["persona"]),),
+            ),
+            Rule(
+                ScmpAction.SCMP_ACT_EACCES,
+                "personality",
+                (ScmpArg(0, ScmpCmp.SCMP_CMP_EQ, values["persona2"]),),
+            ),
+        ),
+    )
+
+
+def test_scmp_action_data():
+    assert ScmpAction.errno(errno.EPERM) is ScmpAction.SCMP_ACT_EPERM
+    assert ScmpAction.errno(300) == 0x0005012C
+    assert ScmpAction.trace() is ScmpAction.SCMP_ACT_TRACE
+    assert ScmpAction.trace(7) == 0x7FF00007
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        dict(errno=errno.EROFS, trace=1, persona=8, persona2=0xFFFFFFFF),
+        dict(errno=0, trace=0xFFFF, persona=0, persona2=0x0400000),
+    ],
+)
+def test_template(values):
+    template = FilterTemplate(_factory, PARAMS)
+    assert template.patch(**values) == build(_factory(values)).bpf
+    compiled = template.instantiate(**values)
+    assert compiled == build(_factory(values))
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        # shares the return instruction of the EACCES rule
+        dict(errno=errno.EACCES, trace=1, persona=8, persona2=0xFFFFFFFF),
+        # comparisons of an argument are ordered by value
+        dict(errno=errno.EROFS, trace=1, persona=0xFFFFFFFF, persona2=8),
+        dict(errno=errno.EROFS, trace=1, persona=8, persona2=8),
+    ],
+)
+def test_template_layout(values):
+    template = FilterTemplate(_factory, PARAMS)
+    with pytest.raises(LayoutError):
+        template.patch(**values)
+    if values["persona"] != values["persona2"]:
+        assert template.instantiate(**values) == build(_factory(values))
+
+
+def test_template_install(in_child):
+    template = FilterTemplate(_factory, PARAMS)
+    compiled = template.instantiate(
+        errno=errno.EROFS, trace=1, persona=0xFFFFFFFE, persona2=0xFFFFFFFF
+    )
+
+    def child():
+        compiled.install()
+        with pytest.raises(OSError) as e:
+            os.getpriority(os.PRIO_PROCESS, 0)
+        assert e.value.errno == errno.EROFS
+
+    in_child(child)
+
+
+def test_template_errors():
+    template = FilterTemplate(_factory, PARAMS)
+    values = dict(errno=1, trace=1, persona=1, persona2=2)
+    with pytest.raises(ValueError):
+        template.patch(**dict(values, errno=4096))
+    with pytest.raises(ValueError):
+        template.patch(**dict(values, persona=1 << 32))
+    with pytest.raises(TypeError):
+        template.patch(errno=1)
+
+    with pytest.raises(ValueError):
+        # unused parameter
+        FilterTemplate(_factory, dict(PARAMS, extra=DATUM))
+
+    def structural(values):
+        # an extra rule for some values
+        rules = [
+            Rule(
+                ScmpAction.SCMP_ACT_EPERM,
+                "personality",
+                (ScmpArg(0, ScmpCmp.SCMP_CMP_EQ, values["persona"]),),
+            )
+        ]
+        if values["persona"] & 0x100000:
+            rules.append(Rule(ScmpAction.SCMP_ACT_EPERM, "getpriority", ()))
+        return Policy(ScmpAction.SCMP_ACT_ALLOW, tuple(rules))
+
+    with pytest.raises(ValueError):
+        FilterTemplate(structural, {"persona": DATUM})
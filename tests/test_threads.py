@@ -0,0 +1,85 @@
+import os
+import threading
+import time
+
+import pytest
+
+from seccomppolicy._compiled import build
+from seccomppolicy._constants import ScmpAction
+from seccomppolicy._containerpolicy import Policy, Rule
+from seccomppolicy import _threads
+from seccomppolicy._threads import (
+    ThreadFilterError,
+    ThreadSandbox,
+    gettid,
+    thread_status,
+    thread_statuses,
+)
+
+POLICY = Policy(
+    ScmpAction.SCMP_ACT_ALLOW,
+    (Rule(ScmpAction.SCMP_ACT_EPERM, "getpriority", ()),),
+)
+
+
+def _getpriority():
+    try:
+        os.getpriority(os.PRIO_PROCESS, 0)
+    except PermissionError:
+        return gettid(), False
+    return gettid(), True
+
+
+def test_thread_status():
+    status = thread_status()
+    assert status.pid == os.getpid()
+    assert status.tid == gettid()
+    assert status.tid in [s.tid for s in thread_statuses()]
+
+
+@pytest.mark.parametrize("initializer", [True, False])
+def test_sandbox(in_child, monkeypatch, initializer):
+    monkeypatch.setattr(_threads, "_HAS_INITIALIZER", initializer)
+
+    def child():
+        sandbox = ThreadSandbox(build(POLICY))
+        barrier = threading.Barrier(2)
+
+        def work():
+            # keep both workers busy, so each runs one task
+            barrier.wait()
+            return _getpriority()
+
+        with sandbox.executor(max_workers=2) as pool:
+            results = [pool.submit(work) for _ in range(2)]
+            results = [future.result() for future in results]
+            assert {tid for tid, allowed in results} == sandbox.tids
+            assert not any(allowed for tid, allowed in results)
+            statuses = sandbox.verify()
+            assert len(statuses) == 2
+            others = sandbox.outside()
+            assert gettid() in [status.tid for status in others]
+            assert all(not status.filters for status in others)
+
+        # main thread is not filtered
+        assert _getpriority()[1]
+        # workers have exited and are forgotten, a joined thread is listed
+        # until the Kernel has released it
+        deadline = time.monotonic() + 5
+        while sandbox.tids and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert sandbox.tids == frozenset()
+        assert sandbox.verify() == []
+
+        # thread without filter
+        fake = ThreadSandbox(build(POLICY))
+        fake._tids[gettid()] = _threads._starttime(gettid())
+        with pytest.raises(ThreadFilterError) as exc:
+            fake.verify()
+        assert exc.value.statuses[0].tid == gettid()
+
+        # reused thread id, the recorded thread has exited
+        fake._tids[gettid()] -= 1
+        assert fake.verify() == []
+
+    in_child(child)
@@ -0,0 +1,90 @@
+import concurrent.futures
+import os
+import threading
+
+import pytest
+
+from seccomppolicy._constants import ScmpAction, ScmpFilterAttr
+from seccomppolicy._seccomp import Seccomp, TsyncError
+
+WORKERS = 4
+
+
+def _load(tsync):
+    with Seccomp(ScmpAction.SCMP_ACT_ALLOW) as sc:
+        sc.add_rule(ScmpAction.SCMP_ACT_EPERM, "getpriority")
+        if tsync:
+            sc.set_attr(ScmpFilterAttr.SCMP_FLTATR_CTL_TSYNC, 1)
+        sc.load()
+
+
+def _worker(barrier):
+    # barrier ensures that every worker thread runs one task
+    barrier.wait()
+    try:
+        os.getpriority(os.PRIO_PROCESS, 0)
+    except PermissionError:
+        blocked = True
+    else:
+        blocked = False
+    with open("/proc/thread-self/status") as f:
+        status = dict(line.split(":", 1) for line in f)
+    return threading.get_ident(), blocked, int(status["Seccomp"])
+
+
+def _run_pool(tsync):
+    with concurrent.futures.ThreadPoolExecutor(WORKERS) as pool:
+        # start all worker threads before the filter is loaded
+        barrier = threading.Barrier(WORKERS)
+        list(pool.map(_worker, [barrier] * WORKERS))
+        _load(tsync)
+        barrier = threading.Barrier(WORKERS)
+        return list(pool.map(_worker, [barrier] * WORKERS))
+
+
+def test_tsync_thread_pool(in_child):
+    def check():
+        results = _run_pool(tsync=True)
+        assert len({ident for ident, _, _ in results}) == WORKERS
+        assert all(blocked for _, blocked, _ in results), results
+        assert all(mode == 2 for _, _, mode in results), results
+
+    in_child(check)
+
+
+def test_no_tsync_thread_pool(in_child):
+    def check():
+        results = _run_pool(tsync=False)
+        assert not any(blocked for _, blocked, _ in results), results
+
+    in_child(check)
+
+
+@pytest.mark.skipif(
+    not hasattr(threading, "get_native_id"), reason="requires get_native_id"
+)
+def test_tsync_error(in_child):
+    def check():
+        ready = threading.Event()
+        done = threading.Event()
+        tids = []
+
+        def own_filter():
+            # thread with a filter of its own cannot be synchronized
+            _load(tsync=False)
+            tids.append(threading.get_native_id())
+            ready.set()
+            done.wait()
+
+        thread = threading.Thread(target=own_filter)
+        thread.start()
+        ready.wait()
+        try:
+            with pytest.raises(TsyncError) as e:
+                _load(tsync=True)
+            assert e.value.tid == tids[0]
+        finally:
+            done.set()
+            thread.join()
+
+    in_child(check)
@@ -0,0 +1,170 @@
+import json
+import os
+
+import pytest
+
+from seccomppolicy._compileserver import compile_profile
+from seccomppolicy._constants import Capabilities
+from seccomppolicy._watch import PolicyWatcher, WatchVariant
+
+PROFILE = {
+    "defaultAction": "SCMP_ACT_ALLOW",
+    "syscalls": [
+        {"names": ["getpriority"], "action": "SCMP_ACT_EPERM", "comment": ""},
+        {
+            "names": ["setpriority"],
+            "action": "SCMP_ACT_EPERM",
+            "comment": "",
+            "excludes": {"caps": ["CAP_SYS_NICE"]},
+        },
+    ],
+}
+
+VARIANTS = [
+    WatchVariant("nocaps", None, frozenset()),
+    WatchVariant("nice", None, frozenset([Capabilities.CAP_SYS_NICE])),
+]
+
+
+def _write(path, profile):
+    # replace atomically like a package manager
+    tmp = path.with_name(".tmp")
+    tmp.write_text(json.dumps(profile))
+    os.rename(str(tmp), str(path))
+
+
+@pytest.fixture
+def watcher(tmp_path):
+    profiles = tmp_path / "profiles"
+    profiles.mkdir()
+    _write(profiles / "a.json", PROFILE)
+    _write(profiles / "b.json", PROFILE)
+    watcher = PolicyWatcher(
+        [str(profiles)], str(tmp_path / "out"), VARIANTS, debounce=0.05
+    )
+    yield watcher
+    watcher.close()
+
+
+def test_watch(watcher, tmp_path):
+    profiles = tmp_path / "profiles"
+    out = tmp_path / "out"
+    updates = watcher.sync()
+    assert [os.path.basename(u.profile) for u in updates] == ["a.json", "b.json"]
+    assert sorted(os.listdir(str(out))) == [
+        "a.nice.bpf",
+        "a.nocaps.bpf",
+        "b.nice.bpf",
+        "b.nocaps.bpf",
+    ]
+    source = json.dumps(PROFILE).encode("utf-8")
+    assert (out / "a.nocaps.bpf").read_bytes() == compile_profile(source)
+    assert (out / "a.nice.bpf").read_bytes() == compile_profile(
+        source, caps=[Capabilities.CAP_SYS_NICE]
+    )
+    assert watcher.poll(timeout=0) == []
+
+    # a burst of writes results in one update, only b.json is parsed
+    profile = dict(PROFILE, syscalls=PROFILE["syscalls"][:1])
+    for _ in range(3):
+        _write(profiles / "b.json", profile)
+    (profiles / "ignored.txt").write_text("")
+    updates = watcher.poll(timeout=1)
+    assert len(updates) == 1
+    update = updates[0]
+    assert update.profile == str(profiles / "b.json")
+    # variant with CAP_SYS_NICE already excluded the removed ruleset
+    assert update.written == [str(out / "b.nocaps.bpf")]
+    assert update.unchanged == ["nice"]
+    assert (out / "b.nocaps.bpf").read_bytes() == compile_profile(
+        json.dumps(profile).encode("utf-8")
+    )
+
+    # invalid profile keeps the old program
+    (profiles / "a.json").write_text("{")
+    assert watcher.poll(timeout=1) == []
+    assert (out / "a.nocaps.bpf").read_bytes() == compile_profile(source)
+
+    os.unlink(str(profiles / "a.json"))
+    (update,) = watcher.poll(timeout=1)
+    assert sorted(update.removed) == [
+        str(out / "a.nice.bpf"),
+        str(out / "a.nocaps.bpf"),
+    ]
+    assert sorted(os.listdir(str(out))) == ["b.nice.bpf", "b.nocaps.bpf"]
+
+
+def test_watch_variant_names(tmp_path):
+    with pytest.raises(ValueError):
+        PolicyWatcher([str(tmp_path)], str(tmp_path), VARIANTS[:1] * 2)
+
+
+def test_watch_duplicates(tmp_path):
+    first = tmp_path / "first"
+    second = tmp_path / "second"
+    first.mkdir()
+    second.mkdir()
+    out = tmp_path / "out"
+    _write(first / "a.json", PROFILE)
+    with PolicyWatcher(
+        [str(first), str(second)], str(out), VARIANTS[:1], debounce=0.05
+    ) as watcher:
+        assert len(watcher.sync()) == 1
+        source = (out / "a.nocaps.bpf").read_bytes()
+
+        # same name in another directory is rejected, old output is kept
+        profile = dict(PROFILE, syscalls=PROFILE["syscalls"][:1])
+        _write(second / "a.json", profile)
+        assert watcher.poll(timeout=1) == []
+        assert (out / "a.nocaps.bpf").read_bytes() == source
+
+        # removal of the first profile hands the output over
+        os.unlink(str(first / "a.json"))
+        updates = watcher.poll(timeout=1)
+        assert [update.profile for update in updates] == [
+            str(first / "a.json"),
+            str(second / "a.json"),
+        ]
+        assert updates[0].removed == []
+        assert (out / "a.nocaps.bpf").read_bytes() == compile_profile(
+            json.dumps(profile).encode("utf-8")
+        )
+
+
+@pytest.mark.parametrize("remove", ["delete", "move"])
+def test_watch_directory_gone(watcher, tmp_path, remove):
+    profiles = tmp_path / "profiles"
+    watcher.sync()
+    if remove == "delete":
+        for name in os.listdir(str(profiles)):
+            os.unlink(str(profiles / name))
+        os.rmdir(str(profiles))
+    else:
+        os.rename(str(profiles), str(tmp_path / "moved"))
+    # poll until the directory events are through
+    while watcher.poll(timeout=1):
+        pass
+    assert os.listdir(str(tmp_path / "out")) == []
+    assert watcher._wds == {}
+    assert watcher.sync() == []
+
+
+def test_watch_default_action_rule(tmp_path):
+    # ERRNO ruleset under an ERRNO default, like container profiles
+    profile = {
+        "defaultAction": "SCMP_ACT_ERRNO",
+        "syscalls": [
+            {"names": ["read", "write"], "action": "SCMP_ACT_ALLOW", "comment": ""},
+            {"names": ["kexec_load"], "action": "SCMP_ACT_ERRNO", "comment": ""},
+        ],
+    }
+    profiles = tmp_path / "profiles"
+    profiles.mkdir()
+    _write(profiles / "c.json", profile)
+    out = tmp_path / "out"
+    with PolicyWatcher([str(profiles)], str(out), VARIANTS[:1]) as watcher:
+        (update,) = watcher.sync()
+    assert update.written == [str(out / "c.nocaps.bpf")]
+    assert (out / "c.nocaps.bpf").read_bytes() == compile_profile(
+        json.dumps(profile).encode("utf-8")
+    )